@@ -16,7 +16,7 @@ ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
 async def get_auth_db():
@@ -80,9 +80,6 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail="User not found",
         )
     
-    if isinstance(user_data.get('created_at'), str):
-        user_data['created_at'] = datetime.fromisoformat(user_data['created_at'])
-    
     user = UserResponse(**user_data)
     return user
 
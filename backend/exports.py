@@ -0,0 +1,490 @@
+import hashlib
+import io
+import os
+import re
+import struct
+import time
+import uuid
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from PIL import Image
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, PdfObject, StreamObject
+
+# Landscape letter page that certificate images are fitted on
+PAGE_WIDTH = 792
+PAGE_HEIGHT = 612
+PAGE_MARGIN = 20
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Page attributes a page can inherit from its ancestors in the page tree
+INHERITABLE_PAGE_ATTRIBUTES = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+
+# Size of the reads used to copy files into streamed archives
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+
+def _read_png_stream(image_path: str) -> Optional[Tuple[int, int, int, bytes]]:
+    """Return (width, height, colors, zlib data) for PNGs a PDF can embed without decoding.
+
+    Only 8-bit, non-interlaced grayscale or RGB PNGs qualify: their concatenated
+    IDAT chunks are a valid FlateDecode stream with PNG predictors.
+    """
+    with open(image_path, 'rb') as f:
+        if f.read(8) != PNG_SIGNATURE:
+            return None
+
+        width = height = colors = None
+        idat = []
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            length, chunk_type = struct.unpack('>I4s', header)
+            data = f.read(length)
+            f.read(4)  # CRC
+
+            if chunk_type == b'IHDR':
+                width, height, bit_depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', data)
+                if bit_depth != 8 or interlace != 0 or color_type not in (0, 2):
+                    return None
+                colors = 1 if color_type == 0 else 3
+            elif chunk_type == b'IDAT':
+                idat.append(data)
+            elif chunk_type == b'IEND':
+                break
+
+    if width is None:
+        return None
+    return width, height, colors, b''.join(idat)
+
+
+def _image_xobject(image_path: str) -> Tuple[int, int, bytes, bytes]:
+    """Build an image XObject for a certificate file: (width, height, dictionary, stream data)"""
+    png = _read_png_stream(image_path)
+    if png is not None:
+        width, height, colors, data = png
+        color_space = '/DeviceGray' if colors == 1 else '/DeviceRGB'
+        dictionary = (
+            f'/Filter /FlateDecode /DecodeParms << /Predictor 15 /Colors {colors} '
+            f'/BitsPerComponent 8 /Columns {width} >> /ColorSpace {color_space}'
+        )
+        return width, height, dictionary.encode(), data
+
+    with Image.open(image_path) as img:
+        if img.format == 'JPEG' and img.mode in ('L', 'RGB'):
+            width, height = img.size
+            color_space = '/DeviceGray' if img.mode == 'L' else '/DeviceRGB'
+            with open(image_path, 'rb') as f:
+                data = f.read()
+            return width, height, f'/Filter /DCTDecode /ColorSpace {color_space}'.encode(), data
+
+        # Anything else (WebP, palette or alpha PNGs) is decoded and deflated
+        rgb = img.convert('RGB')
+        width, height = rgb.size
+        return width, height, b'/Filter /FlateDecode /ColorSpace /DeviceRGB', zlib.compress(rgb.tobytes(), 6)
+
+
+def _has_references(obj: PdfObject) -> bool:
+    """Whether a parsed PDF object refers to other objects"""
+    if isinstance(obj, IndirectObject):
+        return True
+    if isinstance(obj, DictionaryObject):
+        return any(_has_references(value) for value in dict.values(obj))
+    if isinstance(obj, ArrayObject):
+        return any(_has_references(value) for value in list.__iter__(obj))
+    return False
+
+
+class StreamingPdfWriter:
+    """Incremental PDF writer for full-page images and pages copied from other PDFs.
+
+    Every method returns the bytes to send next, so a document can be streamed
+    while later pages are still being produced. Only the current page is held in
+    memory; the page tree and cross-reference table are written at the end.
+    """
+
+    CATALOG_ID = 1
+    PAGES_ID = 2
+
+    def __init__(self):
+        self._offsets = {}
+        self._position = 0
+        self._next_id = 3
+        self._page_ids: List[int] = []
+        # Object ids of the background images already embedded, by path
+        self._backgrounds: Dict[str, int] = {}
+        # Object ids of copied streams without references (font files), by content digest
+        self._streams: Dict[bytes, int] = {}
+
+    def _emit(self, chunk: bytes) -> bytes:
+        self._position += len(chunk)
+        return chunk
+
+    def _object(self, object_id: int, body: bytes, stream: Optional[bytes] = None) -> bytes:
+        self._offsets[object_id] = self._position
+        if stream is None:
+            chunk = b'%d 0 obj\n%s\nendobj\n' % (object_id, body)
+        else:
+            chunk = b'%d 0 obj\n<< %s /Length %d >>\nstream\n%s\nendstream\nendobj\n' % (
+                object_id, body, len(stream), stream
+            )
+        return self._emit(chunk)
+
+    def _reserve(self) -> int:
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+
+    def header(self) -> bytes:
+        return self._emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _image(self, image_path: str) -> Tuple[int, int, int, bytes]:
+        """Emit an image XObject: (object id, width, height, bytes to send)"""
+        width, height, dictionary, data = _image_xobject(image_path)
+        image_id = self._reserve()
+        chunk = self._object(
+            image_id,
+            b'/Type /XObject /Subtype /Image /Width %d /Height %d /BitsPerComponent 8 %s' % (
+                width, height, dictionary
+            ),
+            data,
+        )
+        return image_id, width, height, chunk
+
+    def add_image_page(self, image_path: str) -> bytes:
+        image_id, width, height, image = self._image(image_path)
+
+        # Fit the image on the page with margins, centered
+        scale = min((PAGE_WIDTH - 2 * PAGE_MARGIN) / width, (PAGE_HEIGHT - 2 * PAGE_MARGIN) / height)
+        draw_width = width * scale
+        draw_height = height * scale
+        x = (PAGE_WIDTH - draw_width) / 2
+        y = (PAGE_HEIGHT - draw_height) / 2
+
+        content_id = self._reserve()
+        page_id = self._reserve()
+        self._page_ids.append(page_id)
+
+        content = b'q %.4f 0 0 %.4f %.4f %.4f cm /Im0 Do Q' % (draw_width, draw_height, x, y)
+        return b''.join([
+            image,
+            self._object(content_id, b'', content),
+            self._object(
+                page_id,
+                b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R '
+                b'/Resources << /XObject << /Im0 %d 0 R >> >> >>' % (
+                    self.PAGES_ID, PAGE_WIDTH, PAGE_HEIGHT, content_id, image_id
+                ),
+            ),
+        ])
+
+    def _copy_objects(self, obj: PdfObject, ids: Dict[tuple, int], queue: List[tuple]) -> PdfObject:
+        """Point the references in obj at new object ids, queueing each newly referenced object"""
+        if isinstance(obj, IndirectObject):
+            if obj.pdf is None:
+                # Already renumbered, by an earlier page of the same reader
+                return obj
+            key = (obj.idnum, obj.generation)
+            if key not in ids:
+                target = obj.get_object()
+                digest = None
+                if isinstance(target, StreamObject) and not _has_references(target):
+                    # Every vector overlay embeds the same font files; keep one copy of each
+                    body = io.BytesIO()
+                    target.write_to_stream(body)
+                    digest = hashlib.sha256(body.getvalue()).digest()
+                if digest in self._streams:
+                    ids[key] = self._streams[digest]
+                else:
+                    ids[key] = self._reserve()
+                    queue.append((ids[key], target))
+                    if digest is not None:
+                        self._streams[digest] = ids[key]
+            return IndirectObject(ids[key], 0, None)
+        if isinstance(obj, DictionaryObject):
+            for name, value in list(dict.items(obj)):
+                dict.__setitem__(obj, name, self._copy_objects(value, ids, queue))
+        elif isinstance(obj, ArrayObject):
+            for index, value in enumerate(list.__iter__(obj)):
+                list.__setitem__(obj, index, self._copy_objects(value, ids, queue))
+        return obj
+
+    def add_pdf_page(self, page: DictionaryObject, background: Optional[str] = None) -> bytes:
+        """Copy a page of a parsed PDF with every object it uses, optionally drawn over an image.
+
+        The background image is stretched to the page's MediaBox and embedded only
+        once per document however many pages are drawn over it. The page's
+        objects are renumbered in place, so its reader is only good for copying
+        its other pages afterwards.
+        """
+        chunks = []
+        page_id = self._reserve()
+        self._page_ids.append(page_id)
+
+        attributes = DictionaryObject(dict.items(page))
+        parent = attributes.pop(NameObject('/Parent'), None)
+        while parent is not None:
+            parent = parent.get_object()
+            for name in INHERITABLE_PAGE_ATTRIBUTES:
+                if name not in attributes and name in parent:
+                    attributes[NameObject(name)] = dict.__getitem__(parent, name)
+            parent = dict.get(parent, '/Parent')
+
+        if background is not None:
+            # Fresh direct dictionaries and contents array, so the background can be added to them
+            resources = dict.get(attributes, '/Resources')
+            resources = DictionaryObject(dict.items(resources.get_object()) if resources is not None else ())
+            xobjects = dict.get(resources, '/XObject')
+            xobjects = DictionaryObject(dict.items(xobjects.get_object()) if xobjects is not None else ())
+            resources[NameObject('/XObject')] = xobjects
+            attributes[NameObject('/Resources')] = resources
+
+            contents = dict.get(attributes, '/Contents')
+            if contents is None:
+                contents = ArrayObject()
+            elif isinstance(contents.get_object(), ArrayObject):
+                contents = ArrayObject(list.__iter__(contents.get_object()))
+            else:
+                contents = ArrayObject([contents])
+            attributes[NameObject('/Contents')] = contents
+
+            x0, y0, x1, y1 = (float(value) for value in dict.__getitem__(attributes, '/MediaBox').get_object())
+
+        ids = {}
+        if page.indirect_reference is not None:
+            ids[(page.indirect_reference.idnum, page.indirect_reference.generation)] = page_id
+        queue = []
+        self._copy_objects(attributes, ids, queue)
+
+        if background is not None:
+            if background not in self._backgrounds:
+                image_id, _, _, image = self._image(background)
+                self._backgrounds[background] = image_id
+                chunks.append(image)
+            xobjects[NameObject('/CertBg')] = IndirectObject(self._backgrounds[background], 0, None)
+
+            content_id = self._reserve()
+            chunks.append(self._object(
+                content_id, b'', b'q %.4f 0 0 %.4f %.4f %.4f cm /CertBg Do Q\n' % (x1 - x0, y1 - y0, x0, y0)
+            ))
+            contents.insert(0, IndirectObject(content_id, 0, None))
+
+        attributes[NameObject('/Parent')] = IndirectObject(self.PAGES_ID, 0, None)
+        queue.insert(0, (page_id, attributes))
+
+        # Copying an object can reference further ones, which join the queue
+        while queue:
+            object_id, obj = queue.pop(0)
+            if object_id != page_id:
+                self._copy_objects(obj, ids, queue)
+            body = io.BytesIO()
+            obj.write_to_stream(body)
+            chunks.append(self._object(object_id, body.getvalue()))
+        return b''.join(chunks)
+
+    def trailer(self) -> bytes:
+        kids = b' '.join(b'%d 0 R' % page_id for page_id in self._page_ids)
+        chunks = [
+            self._object(self.PAGES_ID, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self._page_ids))),
+            self._object(self.CATALOG_ID, b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES_ID),
+        ]
+
+        xref_position = self._position
+        size = self._next_id
+        xref = [b'xref\n0 %d\n' % size, b'0000000000 65535 f \n']
+        for object_id in range(1, size):
+            xref.append(b'%010d 00000 n \n' % self._offsets[object_id])
+        xref.append(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            size, self.CATALOG_ID, xref_position
+        ))
+        chunks.append(self._emit(b''.join(xref)))
+        return b''.join(chunks)
+
+
+def stream_batch_pdf(pages: Iterable[dict]) -> Iterator[bytes]:
+    """Yield a batch PDF, producing each page only when it is requested.
+
+    Each page is {'image_path': ...} for a rendered certificate image,
+    {'pdf_path': ...} for a stored certificate PDF copied as it is, or
+    {'overlay': ..., 'background': ...} for a vector certificate: the one-page PDF
+    of its fields drawn over the template image at background. Template images
+    and identical font files are embedded once; a font file whose subset differs
+    between overlays is embedded again for each of them.
+    """
+    writer = StreamingPdfWriter()
+    yield writer.header()
+    for page in pages:
+        if 'image_path' in page:
+            yield writer.add_image_page(page['image_path'])
+        elif 'pdf_path' in page:
+            for pdf_page in PdfReader(page['pdf_path']).pages:
+                yield writer.add_pdf_page(pdf_page)
+        else:
+            yield writer.add_pdf_page(PdfReader(io.BytesIO(page['overlay'])).pages[0], page['background'])
+    yield writer.trailer()
+
+
+class BatchPdfCache:
+    """Disk cache of assembled batch PDFs with a size quota and LRU eviction.
+
+    Files are named <selection>-<revision>.pdf: the selection hash covers the sorted
+    certificate ids and the revision hash covers each member's file revision. A
+    changed member therefore produces a new name, and storing it removes the
+    entries of older revisions of the same selection.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(members: Iterable[Tuple[str, str]]) -> str:
+        """Cache key for (certificate_id, revision) pairs, independent of their order"""
+        members = sorted(members)
+        selection = hashlib.sha256('\n'.join(cert_id for cert_id, _ in members).encode()).hexdigest()[:32]
+        revision = hashlib.sha256('\n'.join(f"{cert_id}:{rev}" for cert_id, rev in members).encode()).hexdigest()[:16]
+        return f"{selection}-{revision}"
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.pdf"
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """Return the cached PDF for a key, marking it as recently used"""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def temp_path(self, key: str) -> Path:
+        """A unique path in the cache directory to build an entry in before commit()"""
+        return self.directory / f"{key}.{uuid.uuid4().hex[:8]}.partial"
+
+    def commit(self, key: str, temp_path: Path) -> Path:
+        """Move a fully written file into the cache, replacing stale revisions and enforcing the quota"""
+        path = self.path(key)
+        os.replace(temp_path, path)
+
+        selection = key.split('-')[0]
+        for stale in self.directory.glob(f"{selection}-*.pdf"):
+            if stale != path:
+                stale.unlink(missing_ok=True)
+
+        self.evict()
+        return path
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits its quota"""
+        entries = []
+        for entry in self.directory.glob("*.pdf"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+
+    def tee(self, key: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Yield chunks while writing them to the cache; the entry only appears once complete"""
+        temp_path = self.temp_path(key)
+        completed = False
+        try:
+            with open(temp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            self.commit(key, temp_path)
+            completed = True
+        finally:
+            if not completed:
+                temp_path.unlink(missing_ok=True)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable buffer that hands written bytes back through drain()"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStreamWriter:
+    """Builds a ZIP archive incrementally with stored (uncompressed) entries.
+
+    Certificate images are already compressed, so entries are stored as-is and
+    copied in ZIP_CHUNK_SIZE reads; only one chunk is held in memory at a time.
+    """
+
+    def __init__(self):
+        self._sink = _ChunkSink()
+        self._zip = zipfile.ZipFile(self._sink, mode='w', compression=zipfile.ZIP_STORED)
+        self._names = set()
+
+    def _unique_name(self, name: str) -> str:
+        stem, dot, extension = name.rpartition('.')
+        if not dot:
+            stem, extension = name, ''
+        candidate = name
+        counter = 2
+        while candidate in self._names:
+            candidate = f"{stem}_{counter}{dot}{extension}"
+            counter += 1
+        self._names.add(candidate)
+        return candidate
+
+    def add_file(self, name: str, file_path: str) -> Iterator[bytes]:
+        """Yield the archive bytes for one file entry"""
+        stat = os.stat(file_path)
+        info = zipfile.ZipInfo(self._unique_name(name), date_time=time.localtime(stat.st_mtime)[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        info.file_size = stat.st_size
+
+        with open(file_path, 'rb') as source, self._zip.open(info, 'w') as entry:
+            while True:
+                chunk = source.read(ZIP_CHUNK_SIZE)
+                if not chunk:
+                    break
+                entry.write(chunk)
+                yield self._sink.drain()
+        yield self._sink.drain()
+
+    def close(self) -> bytes:
+        """Finish the archive and return the central directory bytes"""
+        self._zip.close()
+        return self._sink.drain()
+
+
+def safe_filename(*parts: str) -> str:
+    """Join parts into a filesystem and archive friendly name"""
+    name = '_'.join(str(part).strip() for part in parts if part)
+    name = re.sub(r'[^\w\-.]+', '_', name, flags=re.UNICODE)
+    return name.strip('._') or 'certificado'
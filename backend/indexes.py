@@ -0,0 +1,176 @@
+import logging
+from typing import Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Index options that make two indexes on the same keys different
+INDEX_OPTIONS = ('unique', 'sparse', 'partialFilterExpression', 'expireAfterSeconds')
+
+# Delay before reconciling again when MongoDB could not be reached
+INDEX_RETRY_SECONDS = 30
+
+# Server error codes met when another process reconciles the same index at the same time
+INDEX_NOT_FOUND = 27
+INDEX_CONFLICTS = (85, 86)  # IndexOptionsConflict, IndexKeySpecsConflict
+
+
+def _unique_id() -> IndexModel:
+    return IndexModel([('id', ASCENDING)], unique=True)
+
+
+# Indexes the queries in server.py, auth.py and jobs.py rely on, by collection.
+# Indexes keep their default name (field_direction) and are matched by key, so ones
+# created by hand or by earlier releases are recognised; others are left alone.
+INDEXES: Dict[str, List[IndexModel]] = {
+    'users': [
+        _unique_id(),
+        IndexModel([('email', ASCENDING)], unique=True),
+    ],
+    'templates': [
+        _unique_id(),
+    ],
+    'certificates': [
+        _unique_id(),
+        IndexModel([('unique_code', ASCENDING)], unique=True),
+        # Only certificates issued with duplicate detection carry a key
+        IndexModel(
+            [('issuance_key', ASCENDING)], unique=True,
+            partialFilterExpression={'issuance_key': {'$type': 'string'}}
+        ),
+        # GET /certificates pages in (created_at, id) order, alone or after an equality filter
+        IndexModel([('created_at', DESCENDING), ('id', DESCENDING)]),
+        IndexModel([('template_id', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+        IndexModel([('event_name', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+        IndexModel([('course_name', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+        IndexModel([('created_by', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+        # GET /certificates/search; name_tokens is multikey
+        IndexModel([('document_key', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+        IndexModel([('name_tokens', ASCENDING), ('created_at', DESCENDING), ('id', DESCENDING)]),
+    ],
+    'validations': [
+        IndexModel([('certificate_id', ASCENDING)]),
+    ],
+    'audit_logs': [
+        _unique_id(),
+    ],
+    'jobs': [
+        _unique_id(),
+        # JobWorker.claim: oldest queued job, or a running one whose lease expired
+        IndexModel([('status', ASCENDING), ('created_at', ASCENDING)]),
+    ],
+    'job_rows': [
+        IndexModel([('job_id', ASCENDING), ('row', ASCENDING)]),
+        IndexModel([('job_id', ASCENDING), ('status', ASCENDING), ('row', ASCENDING)]),
+        IndexModel([('job_id', ASCENDING), ('commit', ASCENDING), ('row', ASCENDING)]),
+    ],
+}
+
+
+def _key(spec: dict) -> list:
+    """Key pattern as (field, direction) pairs, from an IndexModel or index_information()"""
+    key = spec['key']
+    return [tuple(part) for part in (key.items() if hasattr(key, 'items') else key)]
+
+
+def _options(spec: dict) -> dict:
+    return {option: spec[option] for option in INDEX_OPTIONS if spec.get(option) not in (None, False)}
+
+
+def _find_by_key(existing: Dict[str, dict], key: list) -> Optional[str]:
+    for name, info in existing.items():
+        if _key(info) == key:
+            return name
+    return None
+
+
+def _is_current(existing: Dict[str, dict], spec: dict) -> bool:
+    current = _find_by_key(existing, _key(spec))
+    return current is not None and _options(existing[current]) == _options(spec)
+
+
+async def ensure_indexes(database: AsyncIOMotorDatabase) -> List[str]:
+    """Create missing declared indexes and rebuild those whose options changed.
+
+    Safe to run on every startup and from several processes at once: an index that
+    another process dropped or created first is not an error. A rebuilt index is
+    dropped before it is created again, so queries and, for unique indexes, the
+    constraint go without it until the new build finishes.
+
+    An index that cannot be built (a unique index over duplicate values, for
+    example) is logged and skipped. Returns the names of indexes that failed;
+    connection errors are raised.
+    """
+    failed = []
+    for collection_name, models in INDEXES.items():
+        collection = database[collection_name]
+        existing = await collection.index_information()
+
+        for model in models:
+            spec = model.document
+            if _is_current(existing, spec):
+                continue
+
+            current = _find_by_key(existing, _key(spec))
+            try:
+                if current is not None:
+                    logger.info(f"Rebuilding index {collection_name}.{current} with options {_options(spec)}")
+                    try:
+                        await collection.drop_index(current)
+                    except OperationFailure as e:
+                        if e.code != INDEX_NOT_FOUND:
+                            raise
+                await collection.create_indexes([model])
+                logger.info(f"Created index {collection_name}.{spec['name']}")
+            except OperationFailure as e:
+                if e.code in INDEX_CONFLICTS and _is_current(await collection.index_information(), spec):
+                    continue
+                logger.error(f"Error creating index {collection_name}.{spec['name']}: {str(e)}")
+                failed.append(f"{collection_name}.{spec['name']}")
+    return failed
+
+
+async def index_report(database: AsyncIOMotorDatabase) -> Dict[str, dict]:
+    """Declared and existing indexes of each collection with their usage since the server started.
+
+    Usage comes from $indexStats and is counted per mongod, since its last restart.
+    """
+    report = {}
+    for collection_name, models in INDEXES.items():
+        collection = database[collection_name]
+        existing = await collection.index_information()
+
+        usage = {}
+        try:
+            async for stats in collection.aggregate([{'$indexStats': {}}]):
+                usage[stats['name']] = stats['accesses']
+        except OperationFailure as e:
+            logger.warning(f"Index usage of {collection_name} is unavailable: {str(e)}")
+
+        declared = {}
+        for model in models:
+            spec = model.document
+            declared[_find_by_key(existing, _key(spec)) or spec['name']] = spec
+
+        indexes = []
+        for name in sorted(set(existing) | set(declared)):
+            info = existing.get(name) or declared[name]
+            accesses = usage.get(name)
+            indexes.append({
+                'name': name,
+                'key': [list(part) for part in _key(info)],
+                **_options(info),
+                'declared': name in declared or name == '_id_',
+                'present': name in existing,
+                'ops': accesses['ops'] if accesses else None,
+                'since': accesses['since'] if accesses else None,
+            })
+
+        report[collection_name] = {
+            'documents': await collection.estimated_document_count(),
+            'indexes': indexes,
+        }
+    return report
@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from concurrent.futures import BrokenExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import ConnectionFailure
+
+logger = logging.getLogger(__name__)
+
+# A running job's claim expires unless its worker renews it within this many seconds;
+# expired jobs are claimed again and resume from their last checkpoint
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 30))
+# How often an idle worker looks for queued jobs submitted to other processes
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 2))
+# Delay before a job interrupted by a retryable error is claimed again, per attempt so far
+JOB_RETRY_SECONDS = float(os.environ.get('JOB_RETRY_SECONDS', 10))
+JOB_RETRY_MAX_SECONDS = 300
+
+# Failures of the infrastructure rather than of the job (a dead render worker, a lost
+# database connection): the job keeps its checkpoint and input and is retried
+RETRYABLE_ERRORS = (BrokenExecutor, ConnectionFailure)
+
+JOB_STATUSES = ("queued", "running", "completed", "failed")
+
+
+class JobError(Exception):
+    """A job cannot continue; its message is stored on the failed job"""
+
+
+class JobLeaseLost(Exception):
+    """The job's lease expired and another worker claimed it"""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobContext:
+    """A claimed job as seen by its handler.
+
+    Handlers persist progress through update(); every update also renews the lease
+    and fails with JobLeaseLost if another worker has taken the job over.
+    """
+
+    def __init__(self, database: AsyncIOMotorDatabase, job: dict, worker_id: str, lease_seconds: int):
+        self.database = database
+        self.job = job
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+
+    @property
+    def id(self) -> str:
+        return self.job['id']
+
+    async def update(self, set_fields: Optional[dict] = None, inc: Optional[dict] = None):
+        now = _now()
+        fields = {
+            **(set_fields or {}),
+            'updated_at': now,
+            'lease_expires_at': now + timedelta(seconds=self.lease_seconds),
+        }
+        update = {'$set': fields}
+        if inc:
+            update['$inc'] = inc
+
+        result = await self.database.jobs.update_one({'id': self.id, 'worker_id': self.worker_id}, update)
+        if result.matched_count == 0:
+            raise JobLeaseLost(self.id)
+
+        self.job.update(fields)
+        for key, value in (inc or {}).items():
+            self.job[key] = self.job.get(key, 0) + value
+
+    async def release(self, delay: float, error: str):
+        """Give the job up for delay seconds, keeping its checkpoint; then any worker resumes it"""
+        now = _now()
+        await self.database.jobs.update_one(
+            {'id': self.id, 'worker_id': self.worker_id},
+            {'$set': {'lease_expires_at': now + timedelta(seconds=delay), 'last_error': error, 'updated_at': now}}
+        )
+
+
+JobHandler = Callable[[JobContext], Awaitable[None]]
+
+
+class JobWorker:
+    """Claims jobs from the `jobs` collection and runs them one at a time.
+
+    Each API process runs one worker. Claims are leases renewed by a heartbeat, so
+    several processes can share the queue and a job whose process stopped is picked
+    up again once its lease expires.
+    """
+
+    def __init__(
+        self,
+        database: AsyncIOMotorDatabase,
+        handlers: Dict[str, JobHandler],
+        poll_seconds: float = JOB_POLL_SECONDS,
+        lease_seconds: int = JOB_LEASE_SECONDS,
+    ):
+        self.database = database
+        self.handlers = handlers
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the worker; a job in progress keeps its checkpoint and resumes after its lease expires"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self):
+        """Look for work now instead of waiting for the next poll"""
+        self._wakeup.set()
+
+    async def claim(self) -> Optional[dict]:
+        now = _now()
+        return await self.database.jobs.find_one_and_update(
+            {
+                'type': {'$in': list(self.handlers)},
+                '$or': [
+                    {'status': 'queued'},
+                    {'status': 'running', 'lease_expires_at': {'$lt': now}},
+                ],
+            },
+            {
+                '$set': {
+                    'status': 'running',
+                    'worker_id': self.worker_id,
+                    'lease_expires_at': now + timedelta(seconds=self.lease_seconds),
+                    'updated_at': now,
+                },
+                '$inc': {'attempts': 1},
+            },
+            projection={'_id': 0},
+            sort=[('created_at', 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                job = await self.claim()
+            except Exception as e:
+                logger.error(f"Error claiming job: {str(e)}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._execute(job)
+
+    async def _heartbeat(self, context: JobContext):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await context.update()
+            except JobLeaseLost:
+                return
+            except Exception as e:
+                logger.warning(f"Error renewing lease of job {context.id}: {str(e)}")
+
+    async def _execute(self, job: dict):
+        context = JobContext(self.database, job, self.worker_id, self.lease_seconds)
+        heartbeat = asyncio.create_task(self._heartbeat(context))
+        if job['attempts'] > 1:
+            logger.info(f"Resuming job {job['id']} at row {job.get('next_row', 0)}")
+
+        try:
+            if not job.get('started_at'):
+                await context.update({'started_at': _now()})
+            await self.handlers[job['type']](context)
+            await context.update({'status': 'completed', 'finished_at': _now()})
+        except JobLeaseLost:
+            logger.warning(f"Job {job['id']} was taken over by another worker")
+            return
+        except RETRYABLE_ERRORS as e:
+            # Stop renewing the lease before shortening it
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+            delay = min(JOB_RETRY_SECONDS * job['attempts'], JOB_RETRY_MAX_SECONDS)
+            logger.warning(f"Job {job['id']} interrupted, resuming at row {job.get('next_row', 0)} in {delay:g}s: {str(e)}")
+            try:
+                await context.release(delay, str(e))
+            except Exception as release_error:
+                # The lease then simply expires
+                logger.warning(f"Error releasing job {job['id']}: {str(release_error)}")
+            return
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {str(e)}")
+            try:
+                await context.update({'status': 'failed', 'error': str(e), 'finished_at': _now()})
+            except JobLeaseLost:
+                return
+            except Exception as update_error:
+                # Still running as far as the queue knows; retried once the lease expires
+                logger.warning(f"Error marking job {job['id']} as failed: {str(update_error)}")
+                return
+        finally:
+            heartbeat.cancel()
+
+        # Uploaded input is only needed until the job reaches a final state
+        if job.get('source_path'):
+            try:
+                os.remove(job['source_path'])
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,185 @@
+import logging
+from datetime import datetime, timezone
+from typing import Dict
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from utils import document_key, generate_issuance_key, name_tokens
+
+logger = logging.getLogger(__name__)
+
+# Fields earlier releases stored as ISO 8601 strings, by collection
+DATE_FIELDS = {
+    'users': ('created_at',),
+    'templates': ('created_at', 'updated_at'),
+    'certificates': ('issue_date', 'created_at'),
+    'validations': ('validated_at',),
+    'audit_logs': ('timestamp',),
+    'jobs': ('created_at', 'updated_at', 'started_at', 'finished_at', 'lease_expires_at'),
+}
+
+# Dates an integrity hash was computed from as strings (certificates' hash_code):
+# the original string is kept as <field>_source, since converting it can lose
+# microseconds and change its format
+SOURCE_FIELDS = {
+    'certificates': ('issue_date',),
+}
+
+# Documents converted per bulk write
+MIGRATION_BATCH_SIZE = 1000
+
+DUPLICATE_KEY = 11000
+
+
+def parse_datetime(value: str) -> datetime:
+    """An ISO 8601 string as an aware datetime; strings without an offset are UTC"""
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+async def migrate_dates(database: AsyncIOMotorDatabase) -> Dict[str, int]:
+    """Convert string dates left by earlier releases to BSON dates.
+
+    Runs online: documents are converted in bulk writes of MIGRATION_BATCH_SIZE,
+    and each update only applies while the document still holds the string it was
+    read with, so it never overwrites a concurrent change. Safe to rerun and to run
+    from several processes; converted documents no longer match. Strings listed
+    in SOURCE_FIELDS are kept next to their date. Returns the number of documents
+    converted per collection.
+    """
+    converted = {}
+    for collection_name, fields in DATE_FIELDS.items():
+        collection = database[collection_name]
+        count = 0
+        batch = []
+
+        async for doc in collection.find(
+            {'$or': [{field: {'$type': 'string'}} for field in fields]},
+            {field: 1 for field in fields}
+        ):
+            values = {}
+            for field in fields:
+                if isinstance(doc.get(field), str):
+                    try:
+                        values[field] = parse_datetime(doc[field])
+                    except ValueError:
+                        logger.warning(f"Unparseable {collection_name}.{field} in document {doc['_id']}: {doc[field]!r}")
+            if not values:
+                continue
+
+            sources = {
+                f"{field}_source": doc[field] for field in SOURCE_FIELDS.get(collection_name, ()) if field in values
+            }
+            batch.append(UpdateOne(
+                {'_id': doc['_id'], **{field: doc[field] for field in values}}, {'$set': {**values, **sources}}
+            ))
+            if len(batch) >= MIGRATION_BATCH_SIZE:
+                count += (await collection.bulk_write(batch, ordered=False)).modified_count
+                batch = []
+        if batch:
+            count += (await collection.bulk_write(batch, ordered=False)).modified_count
+
+        if count:
+            logger.info(f"Converted dates of {count} {collection_name} documents")
+        converted[collection_name] = count
+    return converted
+
+
+async def backfill_search_keys(database: AsyncIOMotorDatabase) -> int:
+    """Add the name_tokens and document_key search fields to certificates issued before they existed.
+
+    Online, batched and safe to rerun like migrate_dates. Returns the number of
+    certificates updated.
+    """
+    collection = database.certificates
+    count = 0
+    batch = []
+    async for doc in collection.find(
+        {'name_tokens': {'$exists': False}}, {'participant_name': 1, 'document_id': 1}
+    ):
+        batch.append(UpdateOne(
+            {'_id': doc['_id'], 'name_tokens': {'$exists': False}},
+            {'$set': {
+                'name_tokens': name_tokens(doc.get('participant_name', '')),
+                'document_key': document_key(doc.get('document_id', '')),
+            }}
+        ))
+        if len(batch) >= MIGRATION_BATCH_SIZE:
+            count += (await collection.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        count += (await collection.bulk_write(batch, ordered=False)).modified_count
+
+    if count:
+        logger.info(f"Added search keys to {count} certificates")
+    return count
+
+
+async def _set_issuance_keys(collection, batch: list) -> int:
+    try:
+        return (await collection.bulk_write(batch, ordered=False)).modified_count
+    except BulkWriteError as e:
+        # Issuances that already have a certificate holding their key
+        if any(error['code'] != DUPLICATE_KEY for error in e.details['writeErrors']):
+            raise
+        return e.details['nModified']
+
+
+async def backfill_issuance_keys(database: AsyncIOMotorDatabase) -> int:
+    """Give certificates issued without an issuance key, singly or before keys existed, the key of their issuance.
+
+    Batches skip participants whose issuance key is taken, so this lets them find
+    those certificates too. The unique index lets one certificate per issuance
+    hold the key; the updates of the others (reissues) fail on it and they keep
+    none. The index must therefore exist first. Online, batched and safe to rerun
+    like migrate_dates. Returns the number of certificates updated.
+    """
+    collection = database.certificates
+    indexes = await collection.index_information()
+    if not any(info.get('unique') and list(dict(info['key'])) == ['issuance_key'] for info in indexes.values()):
+        raise RuntimeError("The unique issuance_key index does not exist yet")
+
+    count = 0
+    batch = []
+    async for doc in collection.find(
+        {'issuance_key': None}, {'template_id': 1, 'document_id': 1, 'event_name': 1, 'course_name': 1}
+    ):
+        batch.append(UpdateOne(
+            {'_id': doc['_id'], 'issuance_key': None},
+            {'$set': {'issuance_key': generate_issuance_key(
+                doc.get('template_id', ''), doc.get('document_id', ''), doc.get('event_name'), doc.get('course_name')
+            )}}
+        ))
+        if len(batch) >= MIGRATION_BATCH_SIZE:
+            count += await _set_issuance_keys(collection, batch)
+            batch = []
+    if batch:
+        count += await _set_issuance_keys(collection, batch)
+
+    if count:
+        logger.info(f"Added issuance keys to {count} certificates")
+    return count
+
+
+MIGRATIONS = (
+    ('native_dates', migrate_dates),
+    ('certificate_search_keys', backfill_search_keys),
+    ('certificate_issuance_keys', backfill_issuance_keys),
+)
+
+
+async def run_migrations(database: AsyncIOMotorDatabase):
+    """Bring documents written by earlier releases up to the current schema.
+
+    Completed migrations are recorded in the `migrations` collection and skipped
+    afterwards, so later starts do not rescan the collections.
+    """
+    for name, migration in MIGRATIONS:
+        if await database.migrations.find_one({'id': name}):
+            continue
+        await migration(database)
+        await database.migrations.update_one(
+            {'id': name}, {'$set': {'completed_at': datetime.now(timezone.utc)}}, upsert=True
+        )
@@ -3,6 +3,23 @@ from typing import Optional, List, Dict, Any
 from datetime import datetime, timezone
 import uuid
 
+# Longest participant name and document id accepted on a certificate
+MAX_PARTICIPANT_NAME_LENGTH = 200
+MAX_DOCUMENT_ID_LENGTH = 64
+
+def utc_now() -> datetime:
+    """Current UTC time at the millisecond precision MongoDB stores dates with"""
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+def projection(model) -> dict:
+    """Mongo projection reading only the fields of a pydantic model, without _id"""
+    return {"_id": 0, **{field: 1 for field in model.model_fields}}
+
+def generate_unique_code() -> str:
+    """Public verification code; unique, so callers retry on a collision"""
+    return str(uuid.uuid4())[:8].upper()
+
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -10,7 +27,7 @@ class User(BaseModel):
     password_hash: str
     full_name: str
     role: str = "operator"  # admin or operator
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=utc_now)
     is_active: bool = True
 
 class UserCreate(BaseModel):
@@ -40,7 +57,7 @@ class TokenResponse(BaseModel):
 class FieldConfig(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    field_type: str  # participant_name, document_id, certifier_name, representative_name, date, unique_code, qr_code
+    field_type: str  # participant_name, document_id, certifier_name, representative_name(_2, _3), event_name, course_name, date, unique_code, qr_code
     x: float
     y: float
     width: float
@@ -50,6 +67,11 @@ class FieldConfig(BaseModel):
     font_color: str = "#000000"
     text_align: str = "left"  # left, center, right
 
+class TemplateImage(BaseModel):
+    path: str
+    width: int
+    height: int
+
 class Template(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -60,9 +82,25 @@ class Template(BaseModel):
     width: float
     height: float
     fields: List[FieldConfig] = []
+    master: Optional[TemplateImage] = None  # RGB-normalized render master
+    previews: List[TemplateImage] = []  # Downscaled JPEG previews, smallest first
+    output_format: Optional[str] = None  # png, webp, jpeg or pdf; None uses the deployment default
     created_by: str
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=utc_now)
+    updated_at: datetime = Field(default_factory=utc_now)
+
+class TemplateSummary(BaseModel):
+    """A template as listed by GET /templates; the layout and file paths come from GET /templates/{id}"""
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    name: str
+    description: Optional[str] = None
+    file_type: str
+    width: float
+    height: float
+    output_format: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
 
 class TemplateCreate(BaseModel):
     name: str
@@ -74,11 +112,19 @@ class TemplateUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     fields: Optional[List[FieldConfig]] = None
+    output_format: Optional[str] = None
+
+class TemplatePreviewRequest(BaseModel):
+    fields: Optional[List[FieldConfig]] = None  # Unsaved editor layout; defaults to the saved fields
+    width: Optional[int] = Field(default=None, gt=0)  # Editor canvas width in pixels
+    scale: Optional[float] = Field(default=None, gt=0, le=1)  # Used when no width is given
+    image_format: str = "jpeg"  # jpeg or webp
+    sample_data: Optional[Dict[str, str]] = None  # Overrides for the sample certificate values
 
 class Certificate(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    unique_code: str = Field(default_factory=lambda: str(uuid.uuid4())[:8].upper())
+    unique_code: str = Field(default_factory=generate_unique_code)
     template_id: str
     participant_name: str
     document_id: str
@@ -86,21 +132,27 @@ class Certificate(BaseModel):
     representative_name: str
     representative_name_2: Optional[str] = None
     representative_name_3: Optional[str] = None
-    issue_date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    issue_date: datetime = Field(default_factory=utc_now)
+    issue_date_source: Optional[str] = None  # ISO string a migrated certificate's hash_code was computed from
     event_name: Optional[str] = None
     course_name: Optional[str] = None
     hash_code: Optional[str] = None  # SHA256 hash for integrity
     pdf_url: Optional[str] = None
+    file_format: str = "png"  # format of the file at pdf_url
+    batch_id: Optional[str] = None  # Id of the batch job that issued the certificate
+    issuance_key: Optional[str] = None  # Set when issued with duplicate detection; unique
+    name_tokens: List[str] = []  # utils.name_tokens of participant_name, for search
+    document_key: Optional[str] = None  # utils.document_key of document_id, for search
     qr_code_url: Optional[str] = None
     is_valid: bool = True
     created_by: str
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=utc_now)
     validation_count: int = 0
 
 class CertificateCreate(BaseModel):
     template_id: str
-    participant_name: str
-    document_id: str
+    participant_name: str = Field(min_length=1, max_length=MAX_PARTICIPANT_NAME_LENGTH)
+    document_id: str = Field(min_length=1, max_length=MAX_DOCUMENT_ID_LENGTH)
     certifier_name: str
     representative_name: str
     representative_name_2: Optional[str] = None
@@ -117,6 +169,11 @@ class CertificateBatchCreate(BaseModel):
     event_name: Optional[str] = None
     course_name: Optional[str] = None
 
+class CertificateExportRequest(BaseModel):
+    certificate_ids: Optional[List[str]] = None
+    template_id: Optional[str] = None
+    event_name: Optional[str] = None
+
 class CertificateResponse(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str
@@ -132,14 +189,31 @@ class CertificateResponse(BaseModel):
     event_name: Optional[str] = None
     course_name: Optional[str] = None
     pdf_url: Optional[str] = None
+    file_format: str = "png"
+    batch_id: Optional[str] = None
     is_valid: bool
     created_at: datetime
     validation_count: int
 
+class CertificateSummary(BaseModel):
+    """A certificate as listed by GET /certificates; the full record comes from GET /certificates/{id}"""
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    unique_code: str
+    template_id: str
+    participant_name: str
+    document_id: str
+    issue_date: datetime
+    event_name: Optional[str] = None
+    course_name: Optional[str] = None
+    file_format: str = "png"
+    is_valid: bool
+    created_at: datetime
+
 class CertificateValidation(BaseModel):
     model_config = ConfigDict(extra="ignore")
     certificate_id: str
-    validated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    validated_at: datetime = Field(default_factory=utc_now)
     ip_address: Optional[str] = None
     user_agent: Optional[str] = None
 
@@ -150,9 +224,67 @@ class AuditLog(BaseModel):
     action: str
     resource_type: str
     resource_id: str
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    timestamp: datetime = Field(default_factory=utc_now)
     details: Optional[Dict[str, Any]] = None
 
+class Job(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    type: str  # certificate_batch
+    status: str = "queued"  # queued, running, completed or failed
+    params: Dict[str, Any] = {}
+    source_path: Optional[str] = None  # Uploaded input, removed once the job finishes
+    total_rows: Optional[int] = None
+    next_row: int = 0  # First input row not yet committed; work resumes from here
+    processed: int = 0
+    succeeded: int = 0
+    skipped: int = 0  # Rows that already had a certificate
+    failed: int = 0
+    commits: int = 0  # Groups of rows stored so far; job rows carry the number of their commit
+    attempts: int = 0
+    error: Optional[str] = None
+    last_error: Optional[str] = None  # Retryable error that interrupted the latest attempt
+    pipeline: Optional[Dict[str, Any]] = None  # Per-stage throughput and queue depth
+    created_by: str
+    created_at: datetime = Field(default_factory=utc_now)
+    updated_at: datetime = Field(default_factory=utc_now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class JobResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    type: str
+    status: str
+    params: Dict[str, Any] = {}
+    total_rows: Optional[int] = None
+    next_row: int
+    processed: int
+    succeeded: int
+    skipped: int = 0
+    failed: int
+    attempts: int
+    error: Optional[str] = None
+    last_error: Optional[str] = None
+    pipeline: Optional[Dict[str, Any]] = None
+    created_by: str
+    created_at: datetime
+    updated_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class JobRow(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    job_id: str
+    row: int  # Spreadsheet row number
+    status: str  # succeeded, existing (already issued; the stored certificate is returned) or failed
+    certificate_id: Optional[str] = None
+    unique_code: Optional[str] = None
+    participant_name: Optional[str] = None
+    error: Optional[str] = None
+    values: Optional[List[str]] = None  # Cells of a failed row, so it can be downloaded and resubmitted
+    commit: int = 0
+
 class StatsResponse(BaseModel):
     total_templates: int
     total_certificates: int
@@ -0,0 +1,154 @@
+import asyncio
+import time
+from typing import Any, AsyncIterable, Awaitable, Callable, List, Optional
+
+_DONE = object()
+
+
+class Stage:
+    """One step of a Pipeline: `workers` tasks applying func to items from a bounded queue.
+
+    func returns the item to hand to the next stage (None drops it). With a
+    batch_size, func receives lists of up to batch_size items instead, collected
+    for at most `linger` seconds after the first one arrives.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Any], Awaitable[Any]],
+        workers: int = 1,
+        queue_size: int = 16,
+        batch_size: Optional[int] = None,
+        linger: float = 0.0,
+    ):
+        self.name = name
+        self.func = func
+        self.workers = max(workers, 1)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.linger = linger
+        self.items = 0
+        self.busy_seconds = 0.0
+
+    async def _next_batch(self) -> tuple:
+        """(items, done) where done means the upstream stage has finished"""
+        first = await self.queue.get()
+        if first is _DONE:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self.queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self.queue.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def work(self, outbox: Optional[asyncio.Queue]):
+        while True:
+            if self.batch_size:
+                item, done = await self._next_batch()
+                if not item:
+                    return
+                count = len(item)
+            else:
+                item = await self.queue.get()
+                if item is _DONE:
+                    return
+                done = False
+                count = 1
+
+            started = time.monotonic()
+            result = await self.func(item)
+            self.busy_seconds += time.monotonic() - started
+            self.items += count
+
+            if result is not None and outbox is not None:
+                await outbox.put(result)
+            if done:
+                return
+
+    def stats(self, elapsed: float) -> dict:
+        return {
+            'workers': self.workers,
+            'items': self.items,
+            'items_per_second': round(self.items / elapsed, 2) if elapsed else 0.0,
+            'utilization': round(min(self.busy_seconds / (elapsed * self.workers), 1.0), 3) if elapsed else 0.0,
+            'queue_depth': self.queue.qsize(),
+            'queue_size': self.queue.maxsize,
+        }
+
+
+class Pipeline:
+    """Stages connected by bounded queues, fed from an async iterable.
+
+    A full queue blocks the stage feeding it, so a slow stage throttles every stage
+    before it instead of letting their output pile up in memory. If any stage
+    raises, the other stages are cancelled and the error is re-raised.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+        self.source_items = 0
+        self._started: Optional[float] = None
+
+    async def _feed(self, source: AsyncIterable):
+        first = self.stages[0]
+        async for item in source:
+            self.source_items += 1
+            await first.queue.put(item)
+        for _ in range(first.workers):
+            await first.queue.put(_DONE)
+
+    async def _run_stage(self, index: int):
+        stage = self.stages[index]
+        following = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        await asyncio.gather(*[stage.work(following.queue if following else None) for _ in range(stage.workers)])
+        if following is not None:
+            for _ in range(following.workers):
+                await following.queue.put(_DONE)
+
+    async def run(self, source: AsyncIterable):
+        self._started = time.monotonic()
+        tasks = [asyncio.ensure_future(self._feed(source))]
+        tasks += [asyncio.ensure_future(self._run_stage(index)) for index in range(len(self.stages))]
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        return {
+            'elapsed_seconds': round(elapsed, 2),
+            'source': {
+                'items': self.source_items,
+                'items_per_second': round(self.source_items / elapsed, 2) if elapsed else 0.0,
+            },
+            'stages': {stage.name: stage.stats(elapsed) for stage in self.stages},
+        }
+
+
+class RowCheckpoint:
+    """Tracks the first input row not yet committed while rows complete out of order"""
+
+    def __init__(self, next_row: int):
+        self.next_row = next_row
+        self._done = set()
+
+    def done(self, row: int):
+        self._done.add(row)
+        while self.next_row in self._done:
+            self._done.remove(self.next_row)
+            self.next_row += 1
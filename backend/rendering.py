@@ -0,0 +1,767 @@
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from PIL import Image, ImageDraw
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas as pdf_canvas
+
+from utils import (
+    render_qr_image, generate_qr_matrix, get_font, hex_to_rgb, preload_fonts, font_cache_info,
+    resolve_font_path
+)
+
+logger = logging.getLogger(__name__)
+
+# Number of worker processes used to render certificates.
+# 0 renders in the event loop's default thread pool instead (useful for development).
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', os.cpu_count() or 1))
+
+# Memory budget for decoded template rasters, per process
+TEMPLATE_CACHE_MB = int(os.environ.get('TEMPLATE_CACHE_MB', 256))
+
+# Vector pages of a batch PDF rendered ahead of the page being written
+BATCH_PDF_LOOKAHEAD = 2 * max(RENDER_WORKERS, 1)
+
+# Number of compiled render plans kept per process
+PLAN_CACHE_SIZE = int(os.environ.get('PLAN_CACHE_SIZE', 64))
+
+# Default output format for rendered certificates (png, webp, jpeg or pdf); templates can override it
+CERT_OUTPUT_FORMAT = os.environ.get('CERT_OUTPUT_FORMAT', 'png').lower()
+CERT_PNG_COMPRESS_LEVEL = int(os.environ.get('CERT_PNG_COMPRESS_LEVEL', 1))
+CERT_WEBP_LOSSLESS = os.environ.get('CERT_WEBP_LOSSLESS', 'false').lower() in ('1', 'true', 'yes')
+CERT_WEBP_QUALITY = int(os.environ.get('CERT_WEBP_QUALITY', 90))
+# libwebp effort, 0-6: higher makes files a little smaller but encodes several times slower
+CERT_WEBP_METHOD = int(os.environ.get('CERT_WEBP_METHOD', 0))
+CERT_JPEG_QUALITY = int(os.environ.get('CERT_JPEG_QUALITY', 92))
+
+# Encoder per output format: file extension, media type and Pillow save options
+OUTPUT_FORMATS: Dict[str, Dict[str, Any]] = {
+    "png": {
+        "extension": "png",
+        "media_type": "image/png",
+        "save": {"format": "PNG", "compress_level": CERT_PNG_COMPRESS_LEVEL},
+    },
+    "webp": {
+        "extension": "webp",
+        "media_type": "image/webp",
+        "save": {"format": "WEBP", "lossless": CERT_WEBP_LOSSLESS, "quality": CERT_WEBP_QUALITY, "method": CERT_WEBP_METHOD},
+    },
+    "jpeg": {
+        "extension": "jpg",
+        "media_type": "image/jpeg",
+        "save": {"format": "JPEG", "quality": CERT_JPEG_QUALITY, "subsampling": 0, "optimize": True},
+    },
+    # Vector PDF: template background as an image XObject, fields as text and paths
+    "pdf": {
+        "extension": "pdf",
+        "media_type": "application/pdf",
+        "save": None,
+    },
+}
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+class TemplateRasterCache:
+    """LRU cache of decoded, RGB-converted template images bounded by a memory budget.
+
+    Entries are keyed by template id plus the file revision (mtime and size), so a
+    replaced file is never served stale even in worker processes that missed an
+    explicit invalidation.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: "OrderedDict[tuple, Image.Image]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _image_bytes(img: Image.Image) -> int:
+        return img.width * img.height * len(img.getbands())
+
+    def get(
+        self,
+        template_id: str,
+        file_path: str,
+        layer_key: Optional[tuple] = None,
+        build: Optional[Callable[[Image.Image], None]] = None,
+    ) -> Image.Image:
+        """Return the cached raster for a template, decoding it on a miss.
+
+        With a layer_key, returns a derived layer instead: the image build() makes
+        from the template raster (a pre-composited copy, or a resized one), which
+        must leave the raster itself untouched. Callers must not draw on the
+        returned image; work on a .copy() instead.
+        """
+        stat = os.stat(file_path)
+        revision = (template_id, file_path, stat.st_mtime_ns, stat.st_size)
+        key = revision + (layer_key,)
+
+        with self._lock:
+            img = self._entries.get(key)
+            if img is not None:
+                self._entries.move_to_end(key)
+                return img
+
+        if layer_key is None:
+            img = Image.open(file_path).convert('RGB')
+        else:
+            img = build(self.get(template_id, file_path))
+        size = self._image_bytes(img)
+
+        with self._lock:
+            # Drop older revisions of the same template file before storing the new one
+            for stale_key in [k for k in self._entries if k[:2] == revision[:2] and k[:4] != revision]:
+                self.current_bytes -= self._image_bytes(self._entries.pop(stale_key))
+            if size <= self.max_bytes and key not in self._entries:
+                self._entries[key] = img
+                self.current_bytes += size
+                while self.current_bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.current_bytes -= self._image_bytes(evicted)
+        return img
+
+    def invalidate(self, template_id: str):
+        """Remove every cached revision of a template"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == template_id]:
+                self.current_bytes -= self._image_bytes(self._entries.pop(key))
+
+
+template_cache = TemplateRasterCache(TEMPLATE_CACHE_MB * 1024 * 1024)
+
+
+def invalidate_template_cache(template_id: str):
+    """Drop a template's decoded raster and compiled plans from this process's caches"""
+    template_cache.invalidate(template_id)
+    with _plans_lock:
+        for key in [k for k in _plans if k[0] == template_id]:
+            del _plans[key]
+
+
+def render_cache_stats() -> dict:
+    """Font and template cache counters of the process this runs in"""
+    return {
+        "pid": os.getpid(),
+        "fonts": font_cache_info(),
+        "templates": {
+            "entries": len(template_cache._entries),
+            "bytes": template_cache.current_bytes,
+            "max_bytes": template_cache.max_bytes,
+        },
+    }
+
+
+# Widths of the downscaled previews generated for each uploaded template
+TEMPLATE_PREVIEW_WIDTHS = [
+    int(width) for width in os.environ.get('TEMPLATE_PREVIEW_WIDTHS', '320,800,1600').split(',') if width
+]
+
+
+def template_source(template: dict) -> str:
+    """Path of the raster to render from: the normalized master when available"""
+    master = template.get('master')
+    if master and os.path.exists(master['path']):
+        return master['path']
+    return template['file_url']
+
+
+def preprocess_template(source_path: str, output_base: str) -> dict:
+    """Normalize an uploaded template image and build its previews.
+
+    Writes an RGB render master (<output_base>_master.png, fast to decode) and a
+    JPEG preview per TEMPLATE_PREVIEW_WIDTHS narrower than the original. Returns
+    the master and previews as {'path', 'width', 'height'} dicts.
+    """
+    with Image.open(source_path) as img:
+        master = img.convert('RGB')
+
+    master_path = f"{output_base}_master.png"
+    master.save(master_path, format='PNG', compress_level=1)
+
+    previews = []
+    for width in sorted(TEMPLATE_PREVIEW_WIDTHS):
+        if width >= master.width:
+            continue
+        height = max(1, round(master.height * width / master.width))
+        preview_path = f"{output_base}_{width}.jpg"
+        master.resize((width, height), Image.Resampling.LANCZOS).save(
+            preview_path, format='JPEG', quality=85, optimize=True
+        )
+        previews.append({"path": preview_path, "width": width, "height": height})
+
+    return {
+        "master": {"path": master_path, "width": master.width, "height": master.height},
+        "previews": previews,
+    }
+
+
+# Encoders for editor previews, tuned for speed over size
+PREVIEW_FORMATS: Dict[str, Dict[str, Any]] = {
+    "jpeg": {"media_type": "image/jpeg", "save": {"format": "JPEG", "quality": 80}},
+    "webp": {"media_type": "image/webp", "save": {"format": "WEBP", "quality": 75, "method": 0}},
+}
+
+# Width of editor previews requested without a width or scale
+PREVIEW_DEFAULT_WIDTH = 800
+
+
+def _scaled_fields(fields: Iterable[dict], scale: float) -> list:
+    scaled_fields = []
+    for field in fields:
+        scaled = dict(field)
+        for key in ('x', 'y'):
+            if key in scaled:
+                scaled[key] = float(scaled[key]) * scale
+        for key in ('width', 'height'):
+            if key in scaled and float(scaled[key]) > 0:
+                scaled[key] = max(1.0, float(scaled[key]) * scale)
+        if 'font_size' in scaled:
+            scaled['font_size'] = max(1, round(float(scaled['font_size']) * scale))
+        scaled_fields.append(scaled)
+    return scaled_fields
+
+
+def render_preview(
+    template: dict,
+    certificate_data: dict,
+    verification_url: str,
+    scale: Optional[float] = None,
+    image_format: str = "jpeg",
+    width: Optional[int] = None,
+) -> bytes:
+    """Render a certificate at a reduced size straight into encoded image bytes.
+
+    The preview is `width` pixels wide (the editor canvas), or `scale` times the
+    template, and never wider than the largest TEMPLATE_PREVIEW_WIDTHS, so large
+    templates are drawn on a stored preview raster instead of the full-size
+    master; the browser scales it to fit. The resized background and the
+    compiled plan of each layout are cached, so re-rendering while the layout is
+    edited only draws the fields. Nothing is written to disk.
+    """
+    master = template.get('master')
+    if master:
+        full_width, full_height = master['width'], master['height']
+    else:
+        full_width, full_height = template_cache.get(template['id'], template['file_url']).size
+
+    previews = [preview for preview in template.get('previews', []) if os.path.exists(preview['path'])]
+    if width is None:
+        width = full_width * scale if scale else PREVIEW_DEFAULT_WIDTH
+    if TEMPLATE_PREVIEW_WIDTHS:
+        width = min(width, max(TEMPLATE_PREVIEW_WIDTHS))
+    scale = min(width / full_width, 1.0)
+    size = (max(1, round(full_width * scale)), max(1, round(full_height * scale)))
+
+    # Smallest preview raster that covers the size, falling back to the master
+    source = next((preview['path'] for preview in previews if preview['width'] >= size[0]), template_source(template))
+    background = template_cache.get(
+        template['id'], source, ('preview', size),
+        lambda img: img.resize(size, Image.Resampling.BILINEAR) if img.size != size else img,
+    )
+    image = background.copy()
+
+    scaled_fields = _scaled_fields(template.get('fields') or [], scale)
+    layout = hashlib.sha1(json.dumps(scaled_fields, sort_keys=True, default=str).encode()).hexdigest()
+    plan = _cached_plan((template.get('id'), f"preview:{layout}"), {**template, 'fields': scaled_fields})
+    plan.draw(image, certificate_data, verification_url)
+
+    buffered = BytesIO()
+    image.save(buffered, **PREVIEW_FORMATS[image_format]["save"])
+    return buffered.getvalue()
+
+
+def resolve_output_format(template: dict) -> str:
+    """Output format for certificates of a template: its own profile or the deployment default"""
+    output_format = (template.get('output_format') or CERT_OUTPUT_FORMAT).lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise RenderPlanError(f"Unsupported output format '{output_format}'")
+    return output_format
+
+
+def get_render_executor() -> Optional[ProcessPoolExecutor]:
+    """Return the shared rendering process pool, creating it on first use"""
+    global _executor
+    if RENDER_WORKERS <= 0:
+        return None
+    # Batch PDF downloads also reach the pool from threadpool threads
+    with _executor_lock:
+        if _executor is None:
+            # spawn keeps workers free of the parent's event loop and Mongo client threads
+            _executor = ProcessPoolExecutor(
+                max_workers=RENDER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=preload_fonts,
+            )
+        return _executor
+
+
+def shutdown_render_executor():
+    """Stop the rendering process pool"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+def _discard_broken_executor(executor: ProcessPoolExecutor):
+    """Drop a pool that lost a worker so the next get_render_executor() starts a new one"""
+    global _executor
+    # Concurrent calls fail together; only the first replaces the pool
+    if _executor is executor:
+        _executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_in_render_executor(func, *args):
+    """Run a picklable rendering function in the executor and await its result.
+
+    A process pool whose worker died (killed, out of memory) stays broken, so it is
+    replaced and the call retried once on the new pool.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_render_executor()
+    try:
+        return await loop.run_in_executor(executor, func, *args)
+    except BrokenProcessPool:
+        logger.warning("Render worker died; restarting the render process pool")
+        _discard_broken_executor(executor)
+        return await loop.run_in_executor(get_render_executor(), func, *args)
+
+
+_pdf_fonts: Dict[str, str] = {}
+
+
+def get_pdf_font(font_family: str) -> str:
+    """Register a font family's TTF with reportlab once and return its PDF font name"""
+    font_name = _pdf_fonts.get(font_family)
+    if font_name is None:
+        font_name = 'Helvetica'
+        font_path = resolve_font_path(font_family)
+        if font_path:
+            try:
+                pdfmetrics.registerFont(TTFont(font_family, font_path))
+                font_name = font_family
+            except Exception as e:
+                logger.error(f"Error registering PDF font {font_family} from {font_path}: {e}")
+        _pdf_fonts[font_family] = font_name
+    return font_name
+
+
+class RenderPlanError(ValueError):
+    """Raised when a template's field configuration cannot be rendered"""
+
+
+def _text_value(key: str) -> Callable[[dict], str]:
+    def extract(certificate_data: dict) -> str:
+        return certificate_data.get(key) or ""
+    return extract
+
+
+def _date_value(certificate_data: dict) -> str:
+    return certificate_data['issue_date'].strftime("%d/%m/%Y")
+
+
+# Value extractor per text field type
+FIELD_VALUE_EXTRACTORS: Dict[str, Callable[[dict], str]] = {
+    "participant_name": _text_value("participant_name"),
+    "document_id": _text_value("document_id"),
+    "certifier_name": _text_value("certifier_name"),
+    "representative_name": _text_value("representative_name"),
+    "representative_name_2": _text_value("representative_name_2"),
+    "representative_name_3": _text_value("representative_name_3"),
+    "event_name": _text_value("event_name"),
+    "course_name": _text_value("course_name"),
+    "date": _date_value,
+    "unique_code": _text_value("unique_code"),
+}
+
+TEXT_ALIGNMENTS = ("left", "center", "right")
+
+# Field types that usually come from the batch form and repeat on every row
+BATCH_STATIC_FIELDS = (
+    "certifier_name",
+    "representative_name",
+    "representative_name_2",
+    "representative_name_3",
+    "event_name",
+    "course_name",
+)
+
+
+@dataclass(frozen=True)
+class TextOp:
+    """Draw one text field with a resolved font, color and box"""
+    field_type: str
+    x: int
+    y: int
+    width: int
+    height: int
+    font: Any
+    font_family: str
+    font_size: int
+    color: Tuple[int, int, int]
+    align: str
+    extract: Callable[[dict], str]
+
+    def draw(self, image: Image.Image, draw: ImageDraw.ImageDraw, certificate_data: dict, verification_url: str):
+        value = self.extract(certificate_data)
+        if not value:
+            return
+
+        x = self.x
+        if self.align != 'left':
+            bbox = draw.textbbox((0, 0), value, font=self.font)
+            text_width = bbox[2] - bbox[0]
+            if self.align == 'center':
+                x += (self.width - text_width) // 2
+            else:  # right
+                x += self.width - text_width
+        draw.text((x, self.y), value, font=self.font, fill=self.color)
+
+    def pdf_draw(self, c: pdf_canvas.Canvas, page_height: float, certificate_data: dict, verification_url: str):
+        value = self.extract(certificate_data)
+        if not value:
+            return
+
+        font_name = get_pdf_font(self.font_family)
+        x = self.x
+        if self.align != 'left':
+            text_width = pdfmetrics.stringWidth(value, font_name, self.font_size)
+            if self.align == 'center':
+                x += (self.width - text_width) / 2
+            else:  # right
+                x += self.width - text_width
+
+        # PIL positions text by its ascender line from the top; PDF by baseline from the bottom
+        ascent = self.font.getmetrics()[0] if hasattr(self.font, 'getmetrics') else self.font_size
+        c.setFillColorRGB(*(channel / 255 for channel in self.color))
+        c.setFont(font_name, self.font_size)
+        c.drawString(x, page_height - self.y - ascent, value)
+
+
+@dataclass(frozen=True)
+class QrOp:
+    """Paste the verification QR code into a box"""
+    field_type: str
+    x: int
+    y: int
+    width: int
+    height: int
+
+    def draw(self, image: Image.Image, draw: ImageDraw.ImageDraw, certificate_data: dict, verification_url: str):
+        image.paste(render_qr_image(verification_url, self.width, self.height), (self.x, self.y))
+
+    def pdf_draw(self, c: pdf_canvas.Canvas, page_height: float, certificate_data: dict, verification_url: str):
+        matrix = generate_qr_matrix(verification_url)
+        modules = len(matrix)
+        cell_width = self.width / modules
+        cell_height = self.height / modules
+        top = page_height - self.y
+
+        c.setFillColorRGB(1, 1, 1)
+        c.rect(self.x, top - self.height, self.width, self.height, stroke=0, fill=1)
+
+        # One rectangle per horizontal run of dark modules
+        path = c.beginPath()
+        for row_index, row in enumerate(matrix):
+            column = 0
+            while column < modules:
+                if not row[column]:
+                    column += 1
+                    continue
+                run_start = column
+                while column < modules and row[column]:
+                    column += 1
+                path.rect(
+                    self.x + run_start * cell_width,
+                    top - (row_index + 1) * cell_height,
+                    (column - run_start) * cell_width,
+                    cell_height,
+                )
+        c.setFillColorRGB(0, 0, 0)
+        c.drawPath(path, stroke=0, fill=1)
+
+
+@dataclass(frozen=True)
+class RenderPlan:
+    """A template's fields compiled into ready-to-run draw operations"""
+    template_id: str
+    revision: str
+    ops: Tuple[Any, ...]
+
+    def draw(
+        self,
+        image: Image.Image,
+        certificate_data: dict,
+        verification_url: str,
+        only: Optional[Iterable[str]] = None,
+        skip: Iterable[str] = (),
+    ):
+        """Run the plan's operations, optionally limited to the `only` field types or excluding `skip`"""
+        draw = ImageDraw.Draw(image)
+        for op in self.ops:
+            if (only is not None and op.field_type not in only) or op.field_type in skip:
+                continue
+            op.draw(image, draw, certificate_data, verification_url)
+
+    def pdf_draw(self, c: pdf_canvas.Canvas, page_height: float, certificate_data: dict, verification_url: str):
+        """Run the plan's operations as vector text and paths on a PDF page"""
+        for op in self.ops:
+            op.pdf_draw(c, page_height, certificate_data, verification_url)
+
+
+def _compile_field(index: int, field: dict):
+    field_type = field.get('field_type')
+    if field_type != "qr_code" and field_type not in FIELD_VALUE_EXTRACTORS:
+        raise RenderPlanError(f"Field {index + 1}: unknown field type '{field_type}'")
+
+    try:
+        x = int(float(field.get('x', 0)))
+        y = int(float(field.get('y', 0)))
+        width = int(float(field.get('width', 300)))
+        height = int(float(field.get('height', 40)))
+    except (TypeError, ValueError):
+        raise RenderPlanError(f"Field {index + 1} ({field_type}): position and size must be numbers")
+    if width <= 0 or height <= 0:
+        raise RenderPlanError(f"Field {index + 1} ({field_type}): width and height must be positive")
+
+    if field_type == "qr_code":
+        return QrOp(field_type=field_type, x=x, y=y, width=width, height=height)
+
+    extract = FIELD_VALUE_EXTRACTORS[field_type]
+
+    try:
+        font_size = int(field.get('font_size', 16))
+    except (TypeError, ValueError):
+        raise RenderPlanError(f"Field {index + 1} ({field_type}): font size must be a number")
+    if font_size <= 0:
+        raise RenderPlanError(f"Field {index + 1} ({field_type}): font size must be positive")
+
+    font_color = field.get('font_color', '#000000') or '#000000'
+    try:
+        if len(font_color.lstrip('#')) != 6:
+            raise ValueError(font_color)
+        color = hex_to_rgb(font_color)
+    except (AttributeError, ValueError):
+        raise RenderPlanError(f"Field {index + 1} ({field_type}): invalid color '{font_color}'")
+
+    text_align = field.get('text_align', 'left')
+    if text_align not in TEXT_ALIGNMENTS:
+        raise RenderPlanError(f"Field {index + 1} ({field_type}): invalid text alignment '{text_align}'")
+
+    font_family = field.get('font_family', 'Arial')
+    return TextOp(
+        field_type=field_type, x=x, y=y, width=width, height=height,
+        font=get_font(font_family, font_size), font_family=font_family, font_size=font_size,
+        color=color, align=text_align, extract=extract,
+    )
+
+
+def compile_render_plan(template: dict, strict: bool = True) -> RenderPlan:
+    """Validate a template's fields and compile them into a RenderPlan.
+
+    Strict compilation, for layouts being saved or previewed, raises RenderPlanError
+    describing the first invalid field. Otherwise invalid fields, such as those of
+    layouts saved before fields were validated, are logged and left out so the
+    certificate still renders.
+    """
+    ops = []
+    for index, field in enumerate(template.get('fields') or []):
+        try:
+            ops.append(_compile_field(index, field))
+        except RenderPlanError as e:
+            if strict:
+                raise
+            logger.warning(f"Skipping invalid field of template {template.get('id')}: {e}")
+    return RenderPlan(template_id=template.get('id', ''), revision=str(template.get('updated_at', '')), ops=tuple(ops))
+
+
+_plans: "OrderedDict[tuple, RenderPlan]" = OrderedDict()
+_plans_lock = threading.Lock()
+
+
+def get_render_plan(template: dict) -> RenderPlan:
+    """Return the compiled plan for a template, cached by template id and revision.
+
+    Invalid fields of the saved layout are skipped (see compile_render_plan).
+    """
+    return _cached_plan((template.get('id'), str(template.get('updated_at', ''))), template, strict=False)
+
+
+def _cached_plan(key: tuple, template: dict, strict: bool = True) -> RenderPlan:
+    """Compiled plan for a template under a cache key starting with the template id"""
+    with _plans_lock:
+        plan = _plans.get(key)
+        if plan is not None:
+            _plans.move_to_end(key)
+            return plan
+
+    plan = compile_render_plan(template, strict)
+
+    with _plans_lock:
+        _plans[key] = plan
+        while len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    return plan
+
+
+def render_certificate(
+    template: dict,
+    certificate_data: dict,
+    verification_url: str,
+    output_path: Union[str, BinaryIO],
+    static_values: Optional[Dict[str, Any]] = None,
+    output_format: str = "png",
+) -> str:
+    """Render a certificate image with all fields and save it to output_path.
+
+    static_values holds the batch-wide values of BATCH_STATIC_FIELDS. Rows that
+    match them are drawn on a cached base layer with those fields already
+    composited, so only the per-row fields are drawn here.
+
+    Pure function of its arguments so it can run in a worker process.
+    """
+    if output_format == "pdf":
+        return render_certificates_pdf([(template, certificate_data, verification_url)], output_path)
+
+    plan = get_render_plan(template)
+    static_values = {k: v for k, v in (static_values or {}).items() if k in BATCH_STATIC_FIELDS}
+
+    if static_values and all(certificate_data.get(k) == v for k, v in static_values.items()):
+        layer_key = (plan.revision,) + tuple(sorted(static_values.items()))
+        def build_layer(img: Image.Image) -> Image.Image:
+            layer = img.copy()
+            plan.draw(layer, static_values, "", only=static_values)
+            return layer
+
+        base = template_cache.get(template['id'], template_source(template), layer_key, build_layer)
+        skip = static_values
+    else:
+        # Work on a copy of the cached template raster
+        base = template_cache.get(template['id'], template_source(template))
+        skip = ()
+
+    template_img = base.copy()
+    plan.draw(template_img, certificate_data, verification_url, skip=skip)
+
+    # Save certificate with the encoder of its output format
+    template_img.save(output_path, **OUTPUT_FORMATS[output_format]["save"])
+
+    return output_path
+
+
+def render_certificate_bytes(
+    template: dict,
+    certificate_data: dict,
+    verification_url: str,
+    static_values: Optional[Dict[str, Any]] = None,
+    output_format: str = "png",
+) -> bytes:
+    """Render a certificate like render_certificate, returning the encoded file instead of saving it"""
+    buffer = BytesIO()
+    render_certificate(template, certificate_data, verification_url, buffer, static_values, output_format)
+    return buffer.getvalue()
+
+
+def draw_certificate_pdf_page(
+    c: pdf_canvas.Canvas,
+    template: dict,
+    certificate_data: dict,
+    verification_url: str,
+    background: bool = True,
+):
+    """Draw one vector certificate page sized to the template raster.
+
+    The background is drawn from the same file the page is sized from, by path,
+    which reportlab stores as a single image XObject however many pages reuse it.
+    background=False leaves it to the caller.
+    """
+    plan = get_render_plan(template)
+    source = template_source(template)
+    page_width, page_height = template_cache.get(template['id'], source).size
+    c.setPageSize((page_width, page_height))
+    if background:
+        c.drawImage(source, 0, 0, width=page_width, height=page_height)
+    plan.pdf_draw(c, page_height, certificate_data, verification_url)
+
+
+def render_certificates_pdf(pages: Iterable[tuple], output_path: str) -> str:
+    """Write a PDF with one vector certificate page per (template, certificate_data, verification_url)"""
+    c = pdf_canvas.Canvas(output_path)
+    for template, certificate_data, verification_url in pages:
+        draw_certificate_pdf_page(c, template, certificate_data, verification_url)
+        c.showPage()
+    c.save()
+    return output_path
+
+
+def render_certificate_pdf_overlay(template: dict, certificate_data: dict, verification_url: str) -> bytes:
+    """One-page PDF of a vector certificate's fields without its background, sized to the template raster"""
+    buffer = BytesIO()
+    c = pdf_canvas.Canvas(buffer)
+    draw_certificate_pdf_page(c, template, certificate_data, verification_url, background=False)
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def _render_batch_page(page: dict, submitted: Optional[tuple]) -> dict:
+    if 'template' not in page:
+        return page
+    args = (page['template'], page['certificate'], page['verification_url'])
+    if submitted is None:
+        overlay = render_certificate_pdf_overlay(*args)
+    else:
+        executor, future = submitted
+        try:
+            overlay = future.result()
+        except BrokenProcessPool:
+            logger.warning("Render worker died; restarting the render process pool")
+            _discard_broken_executor(executor)
+            overlay = get_render_executor().submit(render_certificate_pdf_overlay, *args).result()
+    return {'overlay': overlay, 'background': template_source(page['template'])}
+
+
+def render_batch_pages(pages: Iterable[dict]) -> Iterator[dict]:
+    """Turn the vector pages of a batch PDF into overlays for exports.stream_batch_pdf, in order.
+
+    Vector pages ({'template', 'certificate', 'verification_url'}) become
+    {'overlay': ..., 'background': ...}; other pages pass through. Up to
+    BATCH_PDF_LOOKAHEAD overlays render ahead in the render executor while earlier
+    pages are written, so neither time to the first page nor memory grows with the
+    batch. Blocking: iterate it from a thread.
+    """
+    pending = deque()
+    try:
+        for page in pages:
+            submitted = None
+            executor = get_render_executor() if 'template' in page else None
+            if executor is not None:
+                submitted = (executor, executor.submit(
+                    render_certificate_pdf_overlay, page['template'], page['certificate'], page['verification_url']
+                ))
+            pending.append((page, submitted))
+            if len(pending) > BATCH_PDF_LOOKAHEAD:
+                yield _render_batch_page(*pending.popleft())
+        while pending:
+            yield _render_batch_page(*pending.popleft())
+    finally:
+        # The client went away: drop the overlays nobody will read
+        for _, submitted in pending:
+            if submitted is not None:
+                submitted[1].cancel()
@@ -1,55 +1,121 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, UploadFile, File, Request, Form
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, UploadFile, File, Request, Form, Query
+from fastapi.responses import FileResponse, StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, PyMongoError
 import os
 import logging
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime, timezone
 import shutil
-import uuid
-from PIL import Image, ImageDraw
-from io import BytesIO
+import asyncio
 import base64
-import openpyxl
+import json
+import re
+import uuid
+from itertools import islice
+from concurrent.futures import BrokenExecutor
 from reportlab.lib.pagesizes import landscape
 from reportlab.pdfgen import canvas as pdf_canvas
 from reportlab.lib.utils import ImageReader
 
 from models import (
     User, UserCreate, UserLogin, UserResponse, TokenResponse,
-    Template, TemplateCreate, TemplateUpdate,
-    Certificate, CertificateCreate, CertificateBatchCreate, CertificateResponse,
-    CertificateValidation, AuditLog, StatsResponse, FieldConfig
+    Template, TemplateSummary, TemplateCreate, TemplateUpdate, TemplatePreviewRequest,
+    Certificate, CertificateCreate, CertificateBatchCreate, CertificateResponse, CertificateSummary,
+    CertificateExportRequest, CertificateValidation, AuditLog, StatsResponse, FieldConfig, Job, JobResponse, JobRow,
+    MAX_PARTICIPANT_NAME_LENGTH, MAX_DOCUMENT_ID_LENGTH, generate_unique_code, projection, utc_now
 )
 from auth import (
     get_password_hash, verify_password, create_access_token,
     get_current_user, require_role
 )
-from utils import generate_certificate_hash, generate_qr_code, get_font, hex_to_rgb, create_pdf_from_images
+from utils import generate_certificate_hash, generate_issuance_key, name_tokens, document_key, preload_fonts
+from exports import stream_batch_pdf, BatchPdfCache, ZipStreamWriter, safe_filename
+from indexes import ensure_indexes, index_report, INDEX_RETRY_SECONDS
+from migrations import run_migrations
+from jobs import JobWorker, JobContext, JobError
+from pipeline import Pipeline, Stage, RowCheckpoint
+from spreadsheets import (
+    SPREADSHEET_EXTENSIONS, SpreadsheetError, validate_spreadsheet, estimate_rows, iter_rows, cell_text, csv_line
+)
+from rendering import (
+    render_certificate, run_in_render_executor, shutdown_render_executor, invalidate_template_cache,
+    render_cache_stats, compile_render_plan, RenderPlanError,
+    resolve_output_format, OUTPUT_FORMATS, render_batch_pages, preprocess_template,
+    render_preview, PREVIEW_FORMATS, render_certificate_bytes, template_source, RENDER_WORKERS
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Dates are stored as BSON dates and read back as aware UTC datetimes
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
 # Frontend URL for QR verification (configurable)
 FRONTEND_URL = os.environ.get('FRONTEND_URL', 'https://digital-certs-3.preview.emergentagent.com')
 
+# Values shown in template editor previews
+PREVIEW_SAMPLE_DATA = {
+    'participant_name': 'María Fernanda López',
+    'document_id': '1234567890',
+    'certifier_name': 'Nombre del Certificador',
+    'representative_name': 'Representante Legal',
+    'representative_name_2': 'Segundo Representante',
+    'representative_name_3': 'Tercer Representante',
+    'event_name': 'Nombre del Evento',
+    'course_name': 'Nombre del Curso',
+    'unique_code': 'ABCD1234',
+}
+
 # Create directories for uploads
 UPLOAD_DIR = ROOT_DIR / "uploads"
 TEMPLATES_DIR = UPLOAD_DIR / "templates"
 CERTIFICATES_DIR = UPLOAD_DIR / "certificates"
 QR_CODES_DIR = UPLOAD_DIR / "qr_codes"
+BATCH_CACHE_DIR = UPLOAD_DIR / "batch_cache"
+JOBS_DIR = UPLOAD_DIR / "jobs"
 
-for directory in [UPLOAD_DIR, TEMPLATES_DIR, CERTIFICATES_DIR, QR_CODES_DIR]:
+for directory in [UPLOAD_DIR, TEMPLATES_DIR, CERTIFICATES_DIR, QR_CODES_DIR, BATCH_CACHE_DIR, JOBS_DIR]:
     directory.mkdir(parents=True, exist_ok=True)
 
+# Assembled batch PDFs, reused while their member certificates are unchanged
+batch_pdf_cache = BatchPdfCache(BATCH_CACHE_DIR, int(os.environ.get('BATCH_PDF_CACHE_MB', 1024)) * 1024 * 1024)
+
+# Spreadsheet rows parsed and checked for existing certificates together by batch
+# jobs; an interrupted job resumes after its last committed row
+BATCH_CHUNK_SIZE = int(os.environ.get('BATCH_CHUNK_SIZE', 50))
+# Certificates per insert_many call; the persist stage waits up to BATCH_FLUSH_SECONDS to fill one
+BATCH_INSERT_SIZE = int(os.environ.get('BATCH_INSERT_SIZE', 500))
+BATCH_FLUSH_SECONDS = float(os.environ.get('BATCH_FLUSH_SECONDS', 0.5))
+# Concurrency of the batch render and file-write stages, and the capacity of the queues between stages
+BATCH_RENDER_CONCURRENCY = int(os.environ.get('BATCH_RENDER_CONCURRENCY', max(RENDER_WORKERS, 1) * 2))
+BATCH_WRITE_WORKERS = int(os.environ.get('BATCH_WRITE_WORKERS', 4))
+BATCH_QUEUE_SIZE = int(os.environ.get('BATCH_QUEUE_SIZE', 16))
+DUPLICATE_KEY_ERROR = 11000
+# Spreadsheet columns of a batch, by position; only the first two are required
+BATCH_COLUMNS = (
+    'participant_name', 'document_id', 'certifier_name',
+    'representative_name', 'representative_name_2', 'representative_name_3'
+)
+
+# Job event streams check for new rows this often, and send at most JOB_EVENT_ROWS rows per event
+JOB_EVENTS_POLL_SECONDS = float(os.environ.get('JOB_EVENTS_POLL_SECONDS', 0.5))
+JOB_EVENT_ROWS = 500
+SSE_KEEPALIVE_SECONDS = 15
+
+# Largest page of GET /certificates and of certificate search
+CERTIFICATE_PAGE_MAX = 1000
+CERTIFICATE_SEARCH_PAGE_MAX = 100
+# Shortest document id or single-word name prefix searched for
+SEARCH_MIN_PREFIX = 2
+
 # Create the main app
 app = FastAPI(title="CertifyPro API")
 
@@ -87,10 +153,7 @@ async def register(user_data: UserCreate, database: AsyncIOMotorDatabase = Depen
         role=user_data.role or "operator"
     )
     
-    user_dict = user.model_dump()
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
-    
-    await database.users.insert_one(user_dict)
+    await database.users.insert_one(user.model_dump())
     
     # Create token
     access_token = create_access_token(data={"sub": user.id})
@@ -117,9 +180,6 @@ async def login(credentials: UserLogin, database: AsyncIOMotorDatabase = Depends
     
     access_token = create_access_token(data={"sub": user_data['id']})
     
-    if isinstance(user_data.get('created_at'), str):
-        user_data['created_at'] = datetime.fromisoformat(user_data['created_at'])
-    
     user_response = UserResponse(**user_data)
     
     return TokenResponse(access_token=access_token, user=user_response)
@@ -130,16 +190,25 @@ async def get_me(current_user: UserResponse = Depends(get_current_user), databas
 
 # ==================== TEMPLATE ENDPOINTS ====================
 
+def save_upload(file: UploadFile, file_path: Path):
+    """Copy an uploaded file to disk (blocking; run it in the threadpool)"""
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
 @api_router.post("/templates", response_model=Template)
 async def create_template(
     name: str = Form(...),
     description: str = Form(None),
     width: float = Form(1000),
     height: float = Form(707),
+    output_format: Optional[str] = Form(None),
     file: UploadFile = File(...),
     current_user: UserResponse = Depends(get_current_user),
     database: AsyncIOMotorDatabase = Depends(get_db)
 ):
+    if output_format and output_format.lower() not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported output format '{output_format}'")
+    
     # Save uploaded file
     file_extension = file.filename.split('.')[-1].lower()
     file_type = "image" if file_extension in ['jpg', 'jpeg', 'png'] else "pdf"
@@ -147,8 +216,19 @@ async def create_template(
     file_id = str(uuid.uuid4())
     file_path = TEMPLATES_DIR / f"{file_id}.{file_extension}"
     
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await run_in_threadpool(save_upload, file, file_path)
+    
+    # Normalize the image and build previews in the render executor
+    assets = {}
+    if file_type == "image":
+        try:
+            assets = await run_in_render_executor(
+                preprocess_template, str(file_path), str(TEMPLATES_DIR / file_id)
+            )
+        except Exception as e:
+            os.remove(file_path)
+            logger.error(f"Error preprocessing template image: {str(e)}")
+            raise HTTPException(status_code=400, detail=f"Invalid template image: {str(e)}")
     
     template = Template(
         name=name,
@@ -157,14 +237,13 @@ async def create_template(
         file_type=file_type,
         width=width,
         height=height,
+        master=assets.get('master'),
+        previews=assets.get('previews', []),
+        output_format=output_format.lower() if output_format else None,
         created_by=current_user.id
     )
     
-    template_dict = template.model_dump()
-    template_dict['created_at'] = template_dict['created_at'].isoformat()
-    template_dict['updated_at'] = template_dict['updated_at'].isoformat()
-    
-    await database.templates.insert_one(template_dict)
+    await database.templates.insert_one(template.model_dump())
     
     # Audit log
     audit = AuditLog(
@@ -173,22 +252,16 @@ async def create_template(
         resource_type="template",
         resource_id=template.id
     )
-    await database.audit_logs.insert_one({**audit.model_dump(), 'timestamp': audit.timestamp.isoformat()})
+    await database.audit_logs.insert_one(audit.model_dump())
     
     return template
 
-@api_router.get("/templates", response_model=List[Template])
+@api_router.get("/templates", response_model=List[TemplateSummary])
 async def get_templates(
     current_user: UserResponse = Depends(get_current_user),
     database: AsyncIOMotorDatabase = Depends(get_db)
 ):
-    templates = await database.templates.find({}, {"_id": 0}).to_list(1000)
-    
-    for template in templates:
-        if isinstance(template.get('created_at'), str):
-            template['created_at'] = datetime.fromisoformat(template['created_at'])
-        if isinstance(template.get('updated_at'), str):
-            template['updated_at'] = datetime.fromisoformat(template['updated_at'])
+    templates = await database.templates.find({}, projection(TemplateSummary)).to_list(1000)
     
     return templates
 
@@ -202,11 +275,6 @@ async def get_template(
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
     
-    if isinstance(template.get('created_at'), str):
-        template['created_at'] = datetime.fromisoformat(template['created_at'])
-    if isinstance(template.get('updated_at'), str):
-        template['updated_at'] = datetime.fromisoformat(template['updated_at'])
-    
     return Template(**template)
 
 @api_router.put("/templates/{template_id}", response_model=Template)
@@ -221,21 +289,25 @@ async def update_template(
         raise HTTPException(status_code=404, detail="Template not found")
     
     update_dict = {k: v for k, v in update_data.model_dump().items() if v is not None}
-    update_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_dict['updated_at'] = utc_now()
+    
+    if 'output_format' in update_dict:
+        update_dict['output_format'] = update_dict['output_format'].lower()
+        if update_dict['output_format'] not in OUTPUT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unsupported output format '{update_dict['output_format']}'")
     
     # Convert FieldConfig objects to dicts if present
     if 'fields' in update_dict:
         update_dict['fields'] = [field.model_dump() if isinstance(field, FieldConfig) else field for field in update_dict['fields']]
+        
+        # Reject layouts the renderer cannot draw before they are saved
+        validate_template_layout({**template, 'fields': update_dict['fields']})
     
     await database.templates.update_one({"id": template_id}, {"$set": update_dict})
+    invalidate_template_cache(template_id)
     
     updated_template = await database.templates.find_one({"id": template_id}, {"_id": 0})
     
-    if isinstance(updated_template.get('created_at'), str):
-        updated_template['created_at'] = datetime.fromisoformat(updated_template['created_at'])
-    if isinstance(updated_template.get('updated_at'), str):
-        updated_template['updated_at'] = datetime.fromisoformat(updated_template['updated_at'])
-    
     # Audit log
     audit = AuditLog(
         user_id=current_user.id,
@@ -243,7 +315,7 @@ async def update_template(
         resource_type="template",
         resource_id=template_id
     )
-    await database.audit_logs.insert_one({**audit.model_dump(), 'timestamp': audit.timestamp.isoformat()})
+    await database.audit_logs.insert_one(audit.model_dump())
     
     return Template(**updated_template)
 
@@ -257,11 +329,17 @@ async def delete_template(
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
     
-    # Delete file
-    if os.path.exists(template['file_url']):
-        os.remove(template['file_url'])
+    # Delete the original file, render master and previews
+    file_paths = [template['file_url']]
+    if template.get('master'):
+        file_paths.append(template['master']['path'])
+    file_paths.extend(preview['path'] for preview in template.get('previews', []))
+    for file_path in file_paths:
+        if os.path.exists(file_path):
+            os.remove(file_path)
     
     await database.templates.delete_one({"id": template_id})
+    invalidate_template_cache(template_id)
     
     # Audit log
     audit = AuditLog(
@@ -270,17 +348,25 @@ async def delete_template(
         resource_type="template",
         resource_id=template_id
     )
-    await database.audit_logs.insert_one({**audit.model_dump(), 'timestamp': audit.timestamp.isoformat()})
+    await database.audit_logs.insert_one(audit.model_dump())
     
     return {"message": "Template deleted successfully"}
 
 @api_router.get("/templates/{template_id}/image")
-async def get_template_image(template_id: str, database: AsyncIOMotorDatabase = Depends(get_db)):
+async def get_template_image(template_id: str, size: Optional[int] = None, database: AsyncIOMotorDatabase = Depends(get_db)):
     template = await database.templates.find_one({"id": template_id}, {"_id": 0})
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
     
     file_path = template['file_url']
+    
+    # Serve the smallest preview at least `size` pixels wide, if there is one
+    if size:
+        for preview in template.get('previews', []):
+            if preview['width'] >= size and os.path.exists(preview['path']):
+                file_path = preview['path']
+                break
+    
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Template file not found")
     
@@ -303,82 +389,122 @@ async def get_template_image(template_id: str, database: AsyncIOMotorDatabase =
         }
     )
 
+@api_router.post("/templates/{template_id}/preview")
+async def preview_template(
+    template_id: str,
+    preview: TemplatePreviewRequest,
+    current_user: UserResponse = Depends(get_current_user),
+    database: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Render sample data on the template at the editor canvas width, without persisting anything"""
+    template = await database.templates.find_one({"id": template_id}, {"_id": 0})
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+    
+    if preview.image_format not in PREVIEW_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported preview format '{preview.image_format}'")
+    
+    if preview.fields is not None:
+        template['fields'] = [field.model_dump() for field in preview.fields]
+    
+    sample_data = {k: v for k, v in (preview.sample_data or {}).items() if k in PREVIEW_SAMPLE_DATA}
+    certificate_data = {**PREVIEW_SAMPLE_DATA, **sample_data, 'issue_date': datetime.now(timezone.utc)}
+    verification_url = f"{FRONTEND_URL}/verify/{certificate_data['unique_code']}"
+    
+    # Previews run in the threadpool so they never queue behind batch renders
+    try:
+        content = await run_in_threadpool(
+            render_preview, template, certificate_data, verification_url, preview.scale, preview.image_format,
+            preview.width
+        )
+    except RenderPlanError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid template layout: {e}")
+    
+    return Response(
+        content=content,
+        media_type=PREVIEW_FORMATS[preview.image_format]['media_type'],
+        headers={"Cache-Control": "no-store"}
+    )
+
 # ==================== CERTIFICATE GENERATION ====================
 
-async def generate_certificate_image(template: dict, certificate_data: dict, database: AsyncIOMotorDatabase):
-    """Generate certificate image with all fields"""
-    # Load template image
-    template_img = Image.open(template['file_url']).convert('RGB')
-    draw = ImageDraw.Draw(template_img)
+def validate_template_layout(template: dict):
+    """Reject a layout being saved whose fields the renderer cannot draw, with a 400.
     
-    # Generate QR code
+    Saved layouts are not checked again when issuing: fields that were saved before
+    this validation existed are skipped by the renderer instead.
+    """
+    try:
+        compile_render_plan(template)
+    except RenderPlanError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid template layout: {e}")
+
+def template_output_format(template: dict) -> str:
+    """Output format of a template's certificates, turning an unsupported one into a 400"""
+    try:
+        return resolve_output_format(template)
+    except RenderPlanError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid template layout: {e}")
+
+def certificate_file_path(certificate_data: dict) -> Path:
+    return CERTIFICATES_DIR / f"{certificate_data['id']}.{OUTPUT_FORMATS[certificate_data['file_format']]['extension']}"
+
+def write_certificate_file(path: Path, content: bytes):
+    """Write a rendered certificate to disk (blocking; run it in the threadpool)"""
+    with open(path, "wb") as f:
+        f.write(content)
+
+async def generate_certificate_image(
+    template: dict,
+    certificate_data: dict,
+    database: AsyncIOMotorDatabase,
+    static_values: Optional[dict] = None
+):
+    """Generate certificate image with all fields in the rendering executor"""
     verification_url = f"{FRONTEND_URL}/verify/{certificate_data['unique_code']}"
-    qr_data = generate_qr_code(verification_url, size=200)
-    
-    # Draw fields
-    for field in template.get('fields', []):
-        field_type = field['field_type']
-        x = int(float(field.get('x', 0)))
-        y = int(float(field.get('y', 0)))
-        width = int(float(field.get('width', 300)))
-        height = int(float(field.get('height', 40)))
-        font_size = int(field.get('font_size', 16))
-        font_family = field.get('font_family', 'Arial')
-        font_color = field.get('font_color', '#000000')
-        text_align = field.get('text_align', 'left')
-        
-        # Get field value
-        value = ""
-        if field_type == "participant_name":
-            value = certificate_data['participant_name']
-        elif field_type == "document_id":
-            value = certificate_data['document_id']
-        elif field_type == "certifier_name":
-            value = certificate_data['certifier_name']
-        elif field_type == "representative_name":
-            value = certificate_data['representative_name']
-        elif field_type == "representative_name_2" and certificate_data.get('representative_name_2'):
-            value = certificate_data['representative_name_2']
-        elif field_type == "representative_name_3" and certificate_data.get('representative_name_3'):
-            value = certificate_data['representative_name_3']
-        elif field_type == "date":
-            value = certificate_data['issue_date'].strftime("%d/%m/%Y")
-        elif field_type == "unique_code":
-            value = certificate_data['unique_code']
-        elif field_type == "qr_code":
-            # Decode and paste QR code
-            qr_img_data = base64.b64decode(qr_data.split(',')[1])
-            qr_img = Image.open(BytesIO(qr_img_data))
-            qr_img = qr_img.resize((width, height), Image.Resampling.LANCZOS)
-            template_img.paste(qr_img, (x, y))
-            continue
+    cert_path = certificate_file_path(certificate_data)
+    
+    return await run_in_render_executor(
+        render_certificate, template, certificate_data, verification_url, str(cert_path),
+        static_values, certificate_data['file_format']
+    )
+
+def certificate_hash(certificate: Certificate) -> str:
+    """SHA256 integrity hash of a certificate's identifying fields"""
+    return generate_certificate_hash({
+        'unique_code': certificate.unique_code,
+        'participant_name': certificate.participant_name,
+        'document_id': certificate.document_id,
+        'issue_date': certificate.issue_date_source or certificate.issue_date.isoformat()
+    })
+
+async def assign_unique_codes(database: AsyncIOMotorDatabase, certificates: List[Certificate]):
+    """Replace unique_codes already taken by stored certificates or by each other.
+    
+    Codes are random and unique_code has a unique index, so collisions become likely
+    with millions of certificates. Checking before rendering keeps the printed code
+    the stored one.
+    """
+    used = set()
+    changed = []
+    pending = certificates
+    while pending:
+        for certificate in pending:
+            if certificate.unique_code in used:
+                while certificate.unique_code in used:
+                    certificate.unique_code = generate_unique_code()
+                changed.append(certificate)
+            used.add(certificate.unique_code)
         
-        if value:
-            # Load font with proper size
-            font = get_font(font_family, font_size)
-            color = hex_to_rgb(font_color)
-            
-            # Handle text alignment
-            if text_align == 'center':
-                # Get text bbox for centering
-                bbox = draw.textbbox((0, 0), value, font=font)
-                text_width = bbox[2] - bbox[0]
-                x_adjusted = x + (width - text_width) // 2
-                draw.text((x_adjusted, y), value, font=font, fill=color)
-            elif text_align == 'right':
-                bbox = draw.textbbox((0, 0), value, font=font)
-                text_width = bbox[2] - bbox[0]
-                x_adjusted = x + width - text_width
-                draw.text((x_adjusted, y), value, font=font, fill=color)
-            else:  # left
-                draw.text((x, y), value, font=font, fill=color)
-    
-    # Save certificate
-    cert_filename = f"{certificate_data['id']}.png"
-    cert_path = CERTIFICATES_DIR / cert_filename
-    template_img.save(cert_path, 'PNG', quality=95)
-    
-    return str(cert_path)
+        taken = set()
+        async for cert in database.certificates.find(
+            {"unique_code": {"$in": [certificate.unique_code for certificate in pending]}}, {"_id": 0, "unique_code": 1}
+        ):
+            taken.add(cert['unique_code'])
+        pending = [certificate for certificate in pending if certificate.unique_code in taken]
+    
+    for certificate in changed:
+        certificate.hash_code = certificate_hash(certificate)
 
 @api_router.post("/certificates", response_model=CertificateResponse)
 async def create_certificate(
@@ -390,40 +516,46 @@ async def create_certificate(
     template = await database.templates.find_one({"id": cert_data.template_id}, {"_id": 0})
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
+    output_format = template_output_format(template)
     
     # Create certificate
     certificate = Certificate(
         template_id=cert_data.template_id,
         participant_name=cert_data.participant_name,
         document_id=cert_data.document_id,
+        name_tokens=name_tokens(cert_data.participant_name),
+        document_key=document_key(cert_data.document_id),
         certifier_name=cert_data.certifier_name,
         representative_name=cert_data.representative_name,
         representative_name_2=cert_data.representative_name_2,
         representative_name_3=cert_data.representative_name_3,
         event_name=cert_data.event_name,
         course_name=cert_data.course_name,
+        file_format=output_format,
         created_by=current_user.id
     )
     
     # Generate hash
-    certificate.hash_code = generate_certificate_hash({
-        'unique_code': certificate.unique_code,
-        'participant_name': certificate.participant_name,
-        'document_id': certificate.document_id,
-        'issue_date': certificate.issue_date.isoformat()
-    })
+    certificate.hash_code = certificate_hash(certificate)
+    await assign_unique_codes(database, [certificate])
     
     # Generate certificate image
     cert_dict = certificate.model_dump()
     pdf_path = await generate_certificate_image(template, cert_dict, database)
     certificate.pdf_url = pdf_path
     
-    # Save to database
-    cert_dict = certificate.model_dump()
-    cert_dict['issue_date'] = cert_dict['issue_date'].isoformat()
-    cert_dict['created_at'] = cert_dict['created_at'].isoformat()
-    
-    await database.certificates.insert_one(cert_dict)
+    # Save to database. The participant's first certificate for this template, event and
+    # course holds the issuance key that batches skip on; later ones are reissues
+    certificate.issuance_key = generate_issuance_key(
+        certificate.template_id, certificate.document_id, certificate.event_name, certificate.course_name
+    )
+    try:
+        await database.certificates.insert_one(certificate.model_dump())
+    except DuplicateKeyError as e:
+        if 'issuance_key' not in (e.details or {}).get('keyPattern', {}):
+            raise
+        certificate.issuance_key = None
+        await database.certificates.insert_one(certificate.model_dump())
     
     # Audit log
     audit = AuditLog(
@@ -432,11 +564,11 @@ async def create_certificate(
         resource_type="certificate",
         resource_id=certificate.id
     )
-    await database.audit_logs.insert_one({**audit.model_dump(), 'timestamp': audit.timestamp.isoformat()})
+    await database.audit_logs.insert_one(audit.model_dump())
     
     return CertificateResponse(**certificate.model_dump())
 
-@api_router.post("/certificates/batch", response_model=List[CertificateResponse])
+@api_router.post("/certificates/batch", response_model=JobResponse, status_code=202)
 async def create_certificates_batch(
     template_id: str = Form(...),
     certifier_name: Optional[str] = Form(None),
@@ -445,102 +577,535 @@ async def create_certificates_batch(
     representative_name_3: Optional[str] = Form(None),
     event_name: Optional[str] = Form(None),
     course_name: Optional[str] = Form(None),
+    on_existing: str = Form("skip"),
     file: UploadFile = File(...),
     current_user: UserResponse = Depends(get_current_user),
     database: AsyncIOMotorDatabase = Depends(get_db)
 ):
+    """Queue a batch issuance job for an Excel, CSV or TSV file; progress is available from /jobs/{job_id}.
+    
+    With on_existing="skip", rows whose participant already has a certificate for the same
+    template, event and course are not issued again; "reissue" always issues a new one.
+    """
     # Get template
     template = await database.templates.find_one({"id": template_id}, {"_id": 0})
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
+    template_output_format(template)
     
-    # Read Excel file
+    if on_existing not in ("skip", "reissue"):
+        raise HTTPException(status_code=400, detail="on_existing must be 'skip' or 'reissue'")
+    
+    extension = Path(file.filename or "").suffix.lower()
+    if extension == ".xls":
+        raise HTTPException(
+            status_code=400,
+            detail="Error processing spreadsheet: legacy Excel 97-2003 (.xls) files are not supported; save the file as .xlsx or .csv"
+        )
+    if extension not in SPREADSHEET_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Error processing spreadsheet: upload an .xlsx, .csv or .tsv file")
+    
+    job = Job(
+        type="certificate_batch",
+        params={
+            'template_id': template_id,
+            'certifier_name': certifier_name,
+            'representative_name': representative_name,
+            'representative_name_2': representative_name_2,
+            'representative_name_3': representative_name_3,
+            'event_name': event_name,
+            'course_name': course_name,
+            'on_existing': on_existing,
+        },
+        created_by=current_user.id
+    )
+    
+    # The job reads the spreadsheet from disk, so it survives restarts of this process
+    source_path = JOBS_DIR / f"{job.id}{extension}"
+    await run_in_threadpool(save_upload, file, source_path)
     try:
-        contents = await file.read()
-        workbook = openpyxl.load_workbook(BytesIO(contents))
-        sheet = workbook.active
-        
-        certificates = []
-        
+        validate_spreadsheet(source_path)
+    except SpreadsheetError as e:
+        source_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail=f"Error processing spreadsheet: {e}")
+    job.source_path = str(source_path)
+    
+    await database.jobs.insert_one(job.model_dump())
+    job_worker.notify()
+    
+    return JobResponse(**job.model_dump())
+
+def remove_certificate_file(pdf_url: Optional[str]):
+    if pdf_url and os.path.exists(pdf_url):
+        os.remove(pdf_url)
+
+async def insert_certificates(database: AsyncIOMotorDatabase, documents: List[dict]) -> dict:
+    """Insert documents with unordered insert_many calls of BATCH_INSERT_SIZE.
+    
+    Returns the write error of each document that was not stored, keyed by its index.
+    """
+    write_errors = {}
+    for offset in range(0, len(documents), BATCH_INSERT_SIZE):
+        try:
+            await database.certificates.insert_many(documents[offset:offset + BATCH_INSERT_SIZE], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                write_errors[offset + error['index']] = error
+    return write_errors
+
+async def mark_stored_rows(database: AsyncIOMotorDatabase, items: List[dict]):
+    """Flag batch items that already have a certificate, using one query for all of them.
+    
+    Certificate ids are derived from the job and row, so rows stored by this job
+    before an interruption are found by id. Rows issued earlier by another batch
+    are found by issuance key and flagged as existing, with the stored certificate.
+    """
+    if not items:
+        return
+    by_id = {item['certificate'].id: item for item in items}
+    by_key = {}
+    for item in items:
+        if item['certificate'].issuance_key:
+            by_key.setdefault(item['certificate'].issuance_key, []).append(item)
+    
+    query = {"id": {"$in": list(by_id)}}
+    if by_key:
+        query = {"$or": [query, {"issuance_key": {"$in": list(by_key)}}]}
+    stored = await database.certificates.find(
+        query, {"_id": 0, "id": 1, "unique_code": 1, "issuance_key": 1}
+    ).to_list(None)
+    
+    for cert in stored:
+        if cert['id'] in by_id:
+            item = by_id[cert['id']]
+            item['stored'] = True
+            item['certificate'].unique_code = cert['unique_code']
+    for cert in stored:
+        if cert['id'] in by_id:
+            continue
+        for item in by_key.get(cert.get('issuance_key'), []):
+            if not item['stored']:
+                item['stored'] = True
+                item['existing'] = True
+                item['certificate'].id = cert['id']
+                item['certificate'].unique_code = cert['unique_code']
+
+async def persist_batch_items(job: JobContext, items: List[dict], commit: int) -> dict:
+    """Store the certificates of rendered batch items and record every item's row.
+    
+    Items that already carry an error (invalid or unrenderable rows) are only recorded.
+    Rows are tagged with the job's commit number so event streams can pick them up.
+    Returns the increments of the job's processed, succeeded, skipped and failed
+    counters. Rows recorded by an earlier attempt, committed after its last
+    checkpoint and read again on resume, replace their old counts instead of
+    adding to them.
+    """
+    database = job.database
+    pending = [item for item in items if not item['stored'] and not item.get('error')]
+    
+    documents = [item['certificate'].model_dump() for item in pending]
+    
+    # Save to database; write errors are mapped back to their rows
+    write_errors = await insert_certificates(database, documents)
+    duplicates = []
+    for index, item in enumerate(pending):
+        error = write_errors.get(index)
+        if error is None:
+            item['stored'] = True
+        elif error.get('code') == DUPLICATE_KEY_ERROR:
+            # Possibly issued in the meantime: the same row by another worker, or the same
+            # participant by another row or batch
+            duplicates.append(item)
+        else:
+            item['error'] = error.get('errmsg', 'Write error')
+            remove_certificate_file(item['certificate'].pdf_url)
+    await mark_stored_rows(database, duplicates)
+    for item in duplicates:
+        if not item['stored']:
+            item['error'] = "Duplicate certificate"
+        # A row stored by another worker shares this row's file; anything else leaves it unused
+        if not item['stored'] or item.get('existing'):
+            remove_certificate_file(item['certificate'].pdf_url)
+    
+    rows = [
+        JobRow(
+            job_id=job.id,
+            row=item['row'],
+            status="existing" if item.get('existing') else "succeeded" if item['stored'] else "failed",
+            certificate_id=item['certificate'].id if item['stored'] else None,
+            unique_code=item['certificate'].unique_code if item['stored'] else None,
+            participant_name=item['values'][0] or None,
+            error=item.get('error'),
+            values=None if item['stored'] else item['values'],
+            commit=commit
+        ).model_dump()
+        for item in items
+    ]
+    row_numbers = [row['row'] for row in rows]
+    previous = await database.job_rows.find(
+        {"job_id": job.id, "row": {"$in": row_numbers}}, {"_id": 0, "status": 1}
+    ).to_list(None)
+    await database.job_rows.delete_many({"job_id": job.id, "row": {"$in": row_numbers}})
+    await database.job_rows.insert_many(rows)
+    
+    counters = {'processed': len(rows) - len(previous), 'succeeded': 0, 'skipped': 0, 'failed': 0}
+    counter = {'succeeded': 'succeeded', 'existing': 'skipped', 'failed': 'failed'}
+    for row in rows:
+        counters[counter[row['status']]] += 1
+    for row in previous:
+        counters[counter[row['status']]] -= 1
+    return counters
+
+def validate_batch_row(values: List[str]) -> Optional[str]:
+    """Why a spreadsheet row cannot be issued, or None if it can"""
+    if not values[0]:
+        return "Missing participant_name"
+    if len(values) < 2 or not values[1]:
+        return "Missing document_id"
+    if len(values[0]) > MAX_PARTICIPANT_NAME_LENGTH:
+        return f"participant_name is longer than {MAX_PARTICIPANT_NAME_LENGTH} characters"
+    if len(values[1]) > MAX_DOCUMENT_ID_LENGTH:
+        return f"document_id is longer than {MAX_DOCUMENT_ID_LENGTH} characters"
+    return None
+
+def build_batch_certificate(job: JobContext, output_format: str, row_number: int, values: List[str]) -> Certificate:
+    """Certificate for a validated spreadsheet row, with an id derived from the job and row number"""
+    params = job.job['params']
+    
+    # Use Excel value if present, otherwise use form value
+    certifier = values[2] if len(values) > 2 and values[2] else params.get('certifier_name')
+    rep1 = values[3] if len(values) > 3 and values[3] else params.get('representative_name')
+    rep2 = values[4] if len(values) > 4 and values[4] else params.get('representative_name_2')
+    rep3 = values[5] if len(values) > 5 and values[5] else params.get('representative_name_3')
+    
+    certificate = Certificate(
+        id=str(uuid.uuid5(uuid.UUID(job.id), str(row_number))),
+        batch_id=job.id,
+        template_id=params['template_id'],
+        participant_name=values[0],
+        document_id=values[1],
+        name_tokens=name_tokens(values[0]),
+        document_key=document_key(values[1]),
+        certifier_name=certifier or "",
+        representative_name=rep1 or "",
+        representative_name_2=rep2 if rep2 else None,
+        representative_name_3=rep3 if rep3 else None,
+        event_name=params.get('event_name'),
+        course_name=params.get('course_name'),
+        file_format=output_format,
+        created_by=job.job['created_by']
+    )
+    
+    # Generate hash
+    certificate.hash_code = certificate_hash(certificate)
+    
+    # Participants who already have this certificate are skipped unless reissuing
+    if params.get('on_existing', 'skip') == 'skip':
+        certificate.issuance_key = generate_issuance_key(
+            certificate.template_id, certificate.document_id, certificate.event_name, certificate.course_name
+        )
+    return certificate
+
+async def run_certificate_batch_job(job: JobContext):
+    """Issue the certificates of an uploaded spreadsheet, resuming from the job's checkpoint"""
+    database = job.database
+    params = job.job['params']
+    source_path = job.job['source_path']
+    
+    template = await database.templates.find_one({"id": params['template_id']}, {"_id": 0})
+    if not template:
+        raise JobError("Template not found")
+    try:
+        output_format = resolve_output_format(template)
+    except RenderPlanError as e:
+        raise JobError(f"Invalid template layout: {e}")
+    
+    if job.job.get('total_rows') is None:
+        # Includes blank rows; replaced by the issued count once the job finishes
+        try:
+            await job.update({'total_rows': await run_in_threadpool(estimate_rows, source_path)})
+        except Exception as e:
+            raise JobError(f"Error processing spreadsheet: {str(e)}")
+    
+    # Form values shared by every row are composited once onto a base layer
+    static_values = {
+        'certifier_name': params.get('certifier_name') or "",
+        'representative_name': params.get('representative_name') or "",
+        'representative_name_2': params.get('representative_name_2') or None,
+        'representative_name_3': params.get('representative_name_3') or None,
+        'event_name': params.get('event_name'),
+        'course_name': params.get('course_name'),
+    }
+    
+    # Rows move through bounded queues: read -> render -> write -> persist. Each stage
+    # works on different rows at the same time, and a slow stage (disk, database)
+    # blocks the ones before it instead of letting rendered images pile up in memory.
+    checkpoint = RowCheckpoint(max(job.job['next_row'], 2))
+    
+    async def read_rows():
         # Expected columns: participant_name, document_id
-        # Optional columns from Excel: certifier_name, representative_name, representative_name_2, representative_name_3
-        # If not in Excel, use values from form
-        for row in sheet.iter_rows(min_row=2, values_only=True):
-            if not row[0]:  # Skip empty rows
-                continue
-            
-            # Use Excel value if present, otherwise use form value
-            certifier = str(row[2]) if len(row) > 2 and row[2] else certifier_name
-            rep1 = str(row[3]) if len(row) > 3 and row[3] else representative_name
-            rep2 = str(row[4]) if len(row) > 4 and row[4] else representative_name_2
-            rep3 = str(row[5]) if len(row) > 5 and row[5] else representative_name_3
-            
-            certificate = Certificate(
-                template_id=template_id,
-                participant_name=str(row[0]),
-                document_id=str(row[1]),
-                certifier_name=certifier or "",
-                representative_name=rep1 or "",
-                representative_name_2=rep2 if rep2 else None,
-                representative_name_3=rep3 if rep3 else None,
-                event_name=event_name,
-                course_name=course_name,
-                created_by=current_user.id
-            )
-            
-            # Generate hash
-            certificate.hash_code = generate_certificate_hash({
-                'unique_code': certificate.unique_code,
-                'participant_name': certificate.participant_name,
-                'document_id': certificate.document_id,
-                'issue_date': certificate.issue_date.isoformat()
-            })
-            
-            # Generate certificate image
-            cert_dict = certificate.model_dump()
-            pdf_path = await generate_certificate_image(template, cert_dict, database)
-            certificate.pdf_url = pdf_path
-            
-            # Save to database
-            cert_dict = certificate.model_dump()
-            cert_dict['issue_date'] = cert_dict['issue_date'].isoformat()
-            cert_dict['created_at'] = cert_dict['created_at'].isoformat()
-            
-            await database.certificates.insert_one(cert_dict)
-            certificates.append(CertificateResponse(**certificate.model_dump()))
-        
-        # Audit log
-        audit = AuditLog(
-            user_id=current_user.id,
-            action="batch_create",
-            resource_type="certificate",
-            resource_id=template_id,
-            details={"count": len(certificates)}
+        # Optional columns: certifier_name, representative_name, representative_name_2, representative_name_3
+        # If not in the file, use values from form
+        rows = iter_rows(source_path, checkpoint.next_row)
+        read_chunk = lambda: list(islice(rows, BATCH_CHUNK_SIZE))
+        previous = checkpoint.next_row - 1
+        try:
+            while True:
+                raw_rows = await run_in_threadpool(read_chunk)
+                if not raw_rows:
+                    break
+                
+                items = []
+                for row_number, row in raw_rows:
+                    # Rows the reader skips over and empty rows have nothing to commit
+                    for skipped in range(previous + 1, row_number):
+                        checkpoint.done(skipped)
+                    previous = row_number
+                    values = [cell_text(value) for value in row[:len(BATCH_COLUMNS)]]
+                    if not any(values):
+                        checkpoint.done(row_number)
+                        continue
+                    
+                    # Invalid rows are recorded as failed and the batch goes on
+                    item = {'row': row_number, 'values': values, 'certificate': None, 'stored': False}
+                    error = validate_batch_row(values)
+                    if error:
+                        item['error'] = error
+                    else:
+                        item['certificate'] = build_batch_certificate(job, output_format, row_number, values)
+                    items.append(item)
+                
+                await mark_stored_rows(database, [item for item in items if not item.get('error')])
+                await assign_unique_codes(
+                    database, [item['certificate'] for item in items if not item['stored'] and not item.get('error')]
+                )
+                for item in items:
+                    yield item
+        except SpreadsheetError as e:
+            raise JobError(f"Error processing spreadsheet: {str(e)}")
+        finally:
+            try:
+                await run_in_threadpool(rows.close)
+            except ValueError:
+                pass  # Cancelled while a read was still running in its thread
+    
+    async def render(item: dict) -> dict:
+        if not item['stored'] and not item.get('error'):
+            certificate = item['certificate']
+            try:
+                item['content'] = await run_in_render_executor(
+                    render_certificate_bytes, template, certificate.model_dump(),
+                    f"{FRONTEND_URL}/verify/{certificate.unique_code}", static_values, output_format
+                )
+            except BrokenExecutor:
+                # Not the row's fault: the worker gives the job up and resumes it from next_row
+                raise
+            except Exception as e:
+                # Row-specific data the template cannot draw fails only that row
+                logger.warning(f"Error rendering row {item['row']} of job {job.id}: {str(e)}")
+                item['error'] = f"Error rendering certificate: {str(e)}"
+        return item
+    
+    async def write(item: dict) -> dict:
+        if not item['stored'] and not item.get('error'):
+            certificate = item['certificate']
+            cert_path = certificate_file_path({'id': certificate.id, 'file_format': output_format})
+            await run_in_threadpool(write_certificate_file, cert_path, item.pop('content'))
+            certificate.pdf_url = str(cert_path)
+        return item
+    
+    async def persist(items: List[dict]):
+        commit = job.job.get('commits', 0) + 1
+        counters = await persist_batch_items(job, items, commit)
+        for item in items:
+            checkpoint.done(item['row'])
+        await job.update(
+            {'next_row': checkpoint.next_row, 'pipeline': pipeline.stats()},
+            inc={**counters, 'commits': 1}
         )
-        await database.audit_logs.insert_one({**audit.model_dump(), 'timestamp': audit.timestamp.isoformat()})
-        
-        return certificates
     
-    except Exception as e:
-        logger.error(f"Error processing Excel file: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Error processing Excel file: {str(e)}")
+    pipeline = Pipeline([
+        Stage("render", render, workers=BATCH_RENDER_CONCURRENCY, queue_size=BATCH_QUEUE_SIZE),
+        Stage("write", write, workers=BATCH_WRITE_WORKERS, queue_size=BATCH_QUEUE_SIZE),
+        Stage("persist", persist, queue_size=BATCH_QUEUE_SIZE, batch_size=BATCH_INSERT_SIZE, linger=BATCH_FLUSH_SECONDS),
+    ])
+    await pipeline.run(read_rows())
+    
+    await job.update({
+        'next_row': checkpoint.next_row,
+        'total_rows': job.job['processed'],
+        'pipeline': pipeline.stats(),
+    })
+    
+    # Audit log
+    audit = AuditLog(
+        user_id=job.job['created_by'],
+        action="batch_create",
+        resource_type="certificate",
+        resource_id=params['template_id'],
+        details={"count": job.job['processed'], "job_id": job.id}
+    )
+    await database.audit_logs.insert_one(audit.model_dump())
+
+def date_range_query(field: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> dict:
+    """Filter for start <= field < end that also matches ISO strings not yet migrated.
+    
+    Naive bounds are taken as UTC.
+    """
+    start, end = [
+        value.replace(tzinfo=timezone.utc) if value is not None and value.tzinfo is None else value
+        for value in (start, end)
+    ]
+    date_range = {}
+    string_range = {}
+    if start is not None:
+        date_range["$gte"] = start
+        string_range["$gte"] = start.isoformat()
+    if end is not None:
+        date_range["$lt"] = end
+        string_range["$lt"] = end.isoformat()
+    # Range operators only match values of the operand's type
+    return {"$or": [{field: date_range}, {field: string_range}]}
 
-@api_router.get("/certificates", response_model=List[CertificateResponse])
+def encode_certificate_cursor(cert: dict) -> str:
+    """Opaque cursor pointing after a certificate in (created_at, id) descending order"""
+    created_at = cert['created_at']
+    position = {
+        'created_at': created_at.isoformat() if isinstance(created_at, datetime) else created_at,
+        'date': isinstance(created_at, datetime),
+        'id': cert['id'],
+    }
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+def certificate_cursor_query(cursor: str) -> dict:
+    """Filter for the certificates after a cursor from encode_certificate_cursor"""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        created_at = datetime.fromisoformat(position['created_at']) if position['date'] else position['created_at']
+        cert_id = position['id']
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    conditions = [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": cert_id}},
+    ]
+    if position['date']:
+        # String dates not migrated yet sort after every BSON date
+        conditions.append({"created_at": {"$type": "string"}})
+    return {"$or": conditions}
+
+async def find_certificate_page(
+    database: AsyncIOMotorDatabase,
+    response: Response,
+    query: dict,
+    conditions: List[dict],
+    cursor: Optional[str],
+    limit: int,
+    skip: int = 0
+) -> List[dict]:
+    """One page of certificate summaries matching query and conditions, newest first, setting X-Next-Cursor"""
+    conditions = list(conditions)
+    if cursor:
+        conditions.append(certificate_cursor_query(cursor))
+    if conditions:
+        query = {**query, "$and": conditions}
+    
+    # One extra certificate tells whether there is a next page
+    certificates = await database.certificates.find(query, projection(CertificateSummary)).sort(
+        [("created_at", -1), ("id", -1)]
+    ).skip(skip).limit(limit + 1).to_list(limit + 1)
+    
+    if len(certificates) > limit:
+        certificates = certificates[:limit]
+        response.headers["X-Next-Cursor"] = encode_certificate_cursor(certificates[-1])
+    
+    # Validated once, against the endpoint's response_model
+    return certificates
+
+@api_router.get("/certificates", response_model=List[CertificateSummary])
 async def get_certificates(
-    skip: int = 0,
-    limit: int = 100,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=CERTIFICATE_PAGE_MAX),
+    template_id: Optional[str] = None,
+    event_name: Optional[str] = None,
+    course_name: Optional[str] = None,
+    created_by: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    skip: int = Query(0, ge=0, deprecated=True),
     current_user: UserResponse = Depends(get_current_user),
     database: AsyncIOMotorDatabase = Depends(get_db)
 ):
-    certificates = await database.certificates.find({}, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
-    
-    for cert in certificates:
-        if isinstance(cert.get('issue_date'), str):
-            cert['issue_date'] = datetime.fromisoformat(cert['issue_date'])
-        if isinstance(cert.get('created_at'), str):
-            cert['created_at'] = datetime.fromisoformat(cert['created_at'])
+    """Certificates, newest first, one page at a time.
+    
+    Pages are read with a keyset on (created_at, id): pass the X-Next-Cursor header
+    of a response as `cursor` to get the next page. The header is absent on the last
+    page. Every filter has an index that serves it in the same order. Certificates
+    are listed as summaries; GET /certificates/{id} returns the full record.
+    """
+    filters = {
+        "template_id": template_id,
+        "event_name": event_name,
+        "course_name": course_name,
+        "created_by": created_by,
+    }
+    query = {field: value for field, value in filters.items() if value is not None}
+    conditions = []
+    if created_from is not None or created_to is not None:
+        conditions.append(date_range_query("created_at", created_from, created_to))
     
-    return [CertificateResponse(**cert) for cert in certificates]
+    return await find_certificate_page(database, response, query, conditions, cursor, limit, skip)
+
+def certificate_search_conditions(q: str) -> Tuple[List[dict], List[dict]]:
+    """Conditions of the certificates a search matches exactly, and of those it matches only by prefix.
+    
+    Exact conditions are equalities on the first field of a (field, created_at, id)
+    index, which returns their matches newest first without sorting. Prefix
+    conditions are ranges on that field, whose matches the index cannot order by
+    date; a short prefix can match most certificates, so they are never sorted.
+    """
+    if any(char.isdigit() for char in q):
+        key = document_key(q)
+        if len(key) < SEARCH_MIN_PREFIX:
+            raise HTTPException(status_code=400, detail=f"Search for at least {SEARCH_MIN_PREFIX} characters")
+        return [{"document_key": key}], [{"document_key": {"$regex": f"^{re.escape(key)}", "$ne": key}}]
+    
+    tokens = name_tokens(q)
+    if not tokens or (len(tokens) == 1 and len(tokens[0]) < SEARCH_MIN_PREFIX):
+        raise HTTPException(status_code=400, detail=f"Search for at least {SEARCH_MIN_PREFIX} characters")
+    prefix = [{"name_tokens": {"$all": tokens[:-1]}}] if tokens[:-1] else []
+    # The last word may still be being typed: names with a longer word starting with it
+    prefix.append({"name_tokens": {"$regex": f"^{re.escape(tokens[-1])}", "$ne": tokens[-1]}})
+    return [{"name_tokens": {"$all": tokens}}], prefix
+
+@api_router.get("/certificates/search", response_model=List[CertificateSummary])
+async def search_certificates(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=MAX_PARTICIPANT_NAME_LENGTH),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=CERTIFICATE_SEARCH_PAGE_MAX),
+    current_user: UserResponse = Depends(get_current_user),
+    database: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Find certificates by document id or participant name.
+    
+    A query containing digits matches document ids, ignoring punctuation and case.
+    Any other query matches names: every word must be a word of the name, ignoring
+    accents and case. Exact matches come newest first, paged like GET /certificates
+    through X-Next-Cursor. When they do not fill the first page, it is completed, in
+    index order, with prefix matches: document ids starting with the query, or names
+    with a word starting with its last word. Later pages hold exact matches only.
+    """
+    exact, prefix = certificate_search_conditions(q)
+    certificates = await find_certificate_page(database, response, {}, exact, cursor, limit)
+    
+    if cursor is None and len(certificates) < limit:
+        certificates += await database.certificates.find(
+            {"$and": prefix}, projection(CertificateSummary)
+        ).limit(limit - len(certificates)).to_list(limit - len(certificates))
+    return certificates
 
 @api_router.get("/certificates/{certificate_id}", response_model=CertificateResponse)
 async def get_certificate(
@@ -552,11 +1117,6 @@ async def get_certificate(
     if not cert:
         raise HTTPException(status_code=404, detail="Certificate not found")
     
-    if isinstance(cert.get('issue_date'), str):
-        cert['issue_date'] = datetime.fromisoformat(cert['issue_date'])
-    if isinstance(cert.get('created_at'), str):
-        cert['created_at'] = datetime.fromisoformat(cert['created_at'])
-    
     return CertificateResponse(**cert)
 
 @api_router.get("/certificates/{certificate_id}/download")
@@ -572,10 +1132,12 @@ async def download_certificate(
     if not cert.get('pdf_url') or not os.path.exists(cert['pdf_url']):
         raise HTTPException(status_code=404, detail="Certificate file not found")
     
+    output_format = OUTPUT_FORMATS.get(cert.get('file_format', 'png'), OUTPUT_FORMATS['png'])
+    
     return FileResponse(
         cert['pdf_url'],
-        media_type='image/png',
-        filename=f"certificate_{cert['unique_code']}.png"
+        media_type=output_format['media_type'],
+        filename=f"certificate_{cert['unique_code']}.{output_format['extension']}"
     )
 
 @api_router.post("/certificates/batch-pdf")
@@ -597,30 +1159,250 @@ async def download_batch_as_pdf(
     if not certificates:
         raise HTTPException(status_code=404, detail="No certificates found")
     
-    # Collect image paths
-    image_paths = []
-    for cert in certificates:
-        if cert.get('pdf_url') and os.path.exists(cert['pdf_url']):
-            image_paths.append(cert['pdf_url'])
+    # Vector certificates are redrawn from their data; others embed their rendered image
+    template_ids = {cert['template_id'] for cert in certificates if cert.get('file_format') == 'pdf'}
+    templates = {}
+    if template_ids:
+        async for template in database.templates.find({"id": {"$in": list(template_ids)}}, {"_id": 0}):
+            templates[template['id']] = template
     
-    if not image_paths:
+    pages = []
+    members = []
+    for cert in certificates:
+        try:
+            stored = os.stat(cert['pdf_url']) if cert.get('pdf_url') else None
+        except FileNotFoundError:
+            stored = None
+        
+        if cert.get('file_format') == 'pdf':
+            template = templates.get(cert['template_id'])
+            try:
+                source = os.stat(template_source(template)) if template else None
+            except FileNotFoundError:
+                source = None
+            
+            if source is not None:
+                if isinstance(cert.get('issue_date'), str):
+                    cert['issue_date'] = datetime.fromisoformat(cert['issue_date'])
+                pages.append({
+                    'template': template,
+                    'certificate': cert,
+                    'verification_url': f"{FRONTEND_URL}/verify/{cert['unique_code']}",
+                })
+                # Vector pages are redrawn, so their revision is the template's
+                members.append((cert['id'], f"{template.get('updated_at')}:{source.st_mtime_ns}:{source.st_size}"))
+            elif stored is not None:
+                # Template deleted or its file gone: copy the certificate's own PDF
+                pages.append({'pdf_path': cert['pdf_url']})
+                members.append((cert['id'], f"file:{stored.st_mtime_ns}:{stored.st_size}"))
+        elif stored is not None:
+            pages.append({'image_path': cert['pdf_url']})
+            members.append((cert['id'], f"{stored.st_mtime_ns}:{stored.st_size}"))
+    
+    if not pages:
         raise HTTPException(status_code=404, detail="No certificate files found")
     
-    # Generate PDF
     batch_id = str(uuid.uuid4())[:8]
-    pdf_path = CERTIFICATES_DIR / f"batch_{batch_id}.pdf"
+    filename = f"certificados_lote_{batch_id}.pdf"
+    
+    # Repeat downloads of an unchanged selection are served straight from the cache
+    cache_key = batch_pdf_cache.key(members)
+    cached_path = batch_pdf_cache.lookup(cache_key)
+    if cached_path:
+        return FileResponse(str(cached_path), media_type='application/pdf', filename=filename)
+    
+    # Stream pages to the client as they are produced; the generator runs in the threadpool,
+    # vector pages render ahead in the render executor, and the cache entry is committed
+    # once the last page has been written
+    return StreamingResponse(
+        batch_pdf_cache.tee(cache_key, stream_batch_pdf(render_batch_pages(pages))),
+        media_type='application/pdf',
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@api_router.post("/certificates/export-zip")
+async def download_certificates_as_zip(
+    export: CertificateExportRequest,
+    current_user: UserResponse = Depends(get_current_user),
+    database: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Download the files of selected certificates, or of a template or event, as a ZIP archive"""
+    if export.certificate_ids:
+        query = {"id": {"$in": export.certificate_ids}}
+    elif export.template_id or export.event_name:
+        query = {}
+        if export.template_id:
+            query["template_id"] = export.template_id
+        if export.event_name:
+            query["event_name"] = export.event_name
+    else:
+        raise HTTPException(status_code=400, detail="Provide certificate IDs, a template or an event")
+    
+    projection = {"_id": 0, "participant_name": 1, "document_id": 1, "unique_code": 1, "pdf_url": 1, "file_format": 1}
+    if not await database.certificates.find_one(query, projection):
+        raise HTTPException(status_code=404, detail="No certificates found")
+    
+    async def archive():
+        # Certificates are read from a cursor and files are copied in chunks in the
+        # threadpool, so memory use does not depend on the number of certificates
+        writer = ZipStreamWriter()
+        async for cert in database.certificates.find(query, projection):
+            if not cert.get('pdf_url') or not os.path.exists(cert['pdf_url']):
+                continue
+            extension = OUTPUT_FORMATS.get(cert.get('file_format', 'png'), OUTPUT_FORMATS['png'])['extension']
+            name = f"{safe_filename(cert['participant_name'], cert['document_id'], cert['unique_code'])}.{extension}"
+            async for chunk in iterate_in_threadpool(writer.add_file(name, cert['pdf_url'])):
+                if chunk:
+                    yield chunk
+        yield writer.close()
+    
+    filename = f"certificados_{str(uuid.uuid4())[:8]}.zip"
+    return StreamingResponse(
+        archive(),
+        media_type='application/zip',
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# ==================== JOBS ====================
+
+async def get_job_for_user(job_id: str, current_user: UserResponse, database: AsyncIOMotorDatabase) -> dict:
+    job = await database.jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job['created_by'] != current_user.id and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not allowed to access this job")
+    return job
+
+@api_router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    current_user: UserResponse = Depends(get_current_user),
+    database: AsyncIOMotorDatabase = Depends(get_db)
+):
+    job = await get_job_for_user(job_id, current_user, database)
+    
+    return JobResponse(**job)
+
+@api_router.get("/jobs/{job_id}/failed-rows")
+async def download_job_failed_rows(
+    job_id: str,
+    current_user: UserResponse = Depends(get_current_user),
+    database: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Failed rows of a batch as a CSV that can be corrected and uploaded again.
+    
+    The batch columns come first; the original row number and the error are
+    appended after them, where the batch reader ignores them.
+    """
+    await get_job_for_user(job_id, current_user, database)
+    
+    async def lines():
+        # BOM so that Excel opens the file as UTF-8
+        yield '\ufeff' + csv_line(BATCH_COLUMNS + ('row', 'error'))
+        async for row in database.job_rows.find(
+            {"job_id": job_id, "status": "failed"}, {"_id": 0, "row": 1, "values": 1, "error": 1}
+        ).sort("row", 1):
+            values = list(row.get('values') or [])
+            values += [''] * (len(BATCH_COLUMNS) - len(values))
+            yield csv_line(values + [row['row'], row.get('error') or ''])
+    
+    filename = f"filas_con_error_{job_id[:8]}.csv"
+    return StreamingResponse(
+        lines(),
+        media_type='text/csv; charset=utf-8',
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@api_router.get("/jobs/{job_id}/rows", response_model=List[JobRow])
+async def get_job_rows(
+    job_id: str,
+    status: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    current_user: UserResponse = Depends(get_current_user),
+    database: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Per-row results of a job in spreadsheet order, optionally filtered by status"""
+    await get_job_for_user(job_id, current_user, database)
+    
+    query = {"job_id": job_id}
+    if status:
+        query["status"] = status
+    
+    rows = await database.job_rows.find(query, {"_id": 0}).sort("row", 1).skip(skip).limit(limit).to_list(limit)
+    return [JobRow(**row) for row in rows]
+
+def sse_event(event: str, data, event_id: Optional[int] = None) -> str:
+    """Format a Server-Sent Event"""
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+@api_router.get("/jobs/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    request: Request,
+    current_user: UserResponse = Depends(get_current_user),
+    database: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Server-Sent Events for a job as it runs.
+    
+    `rows` carries the results of newly committed rows (its id is the job commit, so a
+    reconnect with Last-Event-ID continues after it), `progress` the job counters
+    whenever they change, and a final `done` the job summary.
+    """
+    await get_job_for_user(job_id, current_user, database)
     
     try:
-        create_pdf_from_images(image_paths, str(pdf_path))
+        last_commit = int(request.headers.get("last-event-id") or 0)
+    except ValueError:
+        last_commit = 0
+    
+    async def events():
+        nonlocal last_commit
+        last_progress = None
+        last_sent = asyncio.get_running_loop().time()
         
-        return FileResponse(
-            str(pdf_path),
-            media_type='application/pdf',
-            filename=f"certificados_lote_{batch_id}.pdf"
-        )
-    except Exception as e:
-        logger.error(f"Error creating batch PDF: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error creating PDF: {str(e)}")
+        while not await request.is_disconnected():
+            job = await database.jobs.find_one({"id": job_id}, {"_id": 0, "pipeline": 0})
+            commits = job.get('commits', 0)
+            
+            if commits > last_commit:
+                # Rows are only read up to the commit the job has recorded, which they precede
+                rows = []
+                async for row in database.job_rows.find(
+                    {"job_id": job_id, "commit": {"$gt": last_commit, "$lte": commits}}, {"_id": 0}
+                ).sort([("commit", 1), ("row", 1)]):
+                    rows.append(JobRow(**row).model_dump())
+                    if len(rows) == JOB_EVENT_ROWS:
+                        yield sse_event("rows", rows)
+                        rows = []
+                yield sse_event("rows", rows, event_id=commits)
+                last_commit = commits
+                last_sent = asyncio.get_running_loop().time()
+            
+            progress = {key: job.get(key) for key in ('status', 'total_rows', 'processed', 'succeeded', 'skipped', 'failed')}
+            if progress != last_progress:
+                yield sse_event("progress", progress)
+                last_progress = progress
+                last_sent = asyncio.get_running_loop().time()
+            
+            if job['status'] in ("completed", "failed"):
+                yield sse_event("done", JobResponse(**job).model_dump(mode="json"))
+                return
+            
+            if asyncio.get_running_loop().time() - last_sent > SSE_KEEPALIVE_SECONDS:
+                # Comment line that keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+                last_sent = asyncio.get_running_loop().time()
+            await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # ==================== PUBLIC VERIFICATION ====================
 
@@ -646,12 +1428,7 @@ async def verify_certificate(
         ip_address=request.client.host,
         user_agent=request.headers.get('user-agent')
     )
-    await database.validations.insert_one({**validation.model_dump(), 'validated_at': validation.validated_at.isoformat()})
-    
-    if isinstance(cert.get('issue_date'), str):
-        cert['issue_date'] = datetime.fromisoformat(cert['issue_date'])
-    if isinstance(cert.get('created_at'), str):
-        cert['created_at'] = datetime.fromisoformat(cert['created_at'])
+    await database.validations.insert_one(validation.model_dump())
     
     cert['validation_count'] = cert.get('validation_count', 0) + 1
     
@@ -670,21 +1447,15 @@ async def get_stats(
     # Certificates this month
     now = datetime.now(timezone.utc)
     start_of_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
-    certificates_this_month = await database.certificates.count_documents({
-        "created_at": {"$gte": start_of_month.isoformat()}
-    })
+    certificates_this_month = await database.certificates.count_documents(
+        date_range_query("created_at", start_of_month)
+    )
     
     total_validations = await database.validations.count_documents({})
     
     # Recent certificates
     recent_certs = await database.certificates.find({}, {"_id": 0}).sort("created_at", -1).limit(5).to_list(5)
     
-    for cert in recent_certs:
-        if isinstance(cert.get('issue_date'), str):
-            cert['issue_date'] = datetime.fromisoformat(cert['issue_date'])
-        if isinstance(cert.get('created_at'), str):
-            cert['created_at'] = datetime.fromisoformat(cert['created_at'])
-    
     return StatsResponse(
         total_templates=total_templates,
         total_certificates=total_certificates,
@@ -693,6 +1464,30 @@ async def get_stats(
         recent_certificates=[CertificateResponse(**cert) for cert in recent_certs]
     )
 
+@api_router.get("/stats/render-cache")
+async def get_render_cache_stats(
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Font and template cache counters for the API process and one render worker"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {
+        "api": render_cache_stats(),
+        "worker": await run_in_render_executor(render_cache_stats),
+    }
+
+@api_router.get("/stats/indexes")
+async def get_index_stats(
+    current_user: UserResponse = Depends(get_current_user),
+    database: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Indexes of each collection, whether the application declares them and how often they are used"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return await index_report(database)
+
 # ==================== USER MANAGEMENT ====================
 
 @api_router.get("/users", response_model=List[UserResponse])
@@ -705,12 +1500,11 @@ async def get_users(
     
     users = await database.users.find({}, {"_id": 0, "password_hash": 0}).to_list(1000)
     
-    for user in users:
-        if isinstance(user.get('created_at'), str):
-            user['created_at'] = datetime.fromisoformat(user['created_at'])
-    
     return [UserResponse(**user) for user in users]
 
+# Background jobs run in every API process; see jobs.JobWorker
+job_worker = JobWorker(db, {"certificate_batch": run_certificate_batch_job})
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -720,8 +1514,68 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+@app.on_event("startup")
+async def preload_render_resources():
+    preload_fonts()
+
+@app.on_event("startup")
+async def create_indexes():
+    # Runs in the background so neither an unreachable MongoDB nor a long index build
+    # holds up startup; queries work meanwhile, only slower
+    async def reconcile():
+        while True:
+            try:
+                await ensure_indexes(db)
+                return
+            except ConnectionFailure as e:
+                logger.error(f"Error reaching MongoDB to create indexes, retrying in {INDEX_RETRY_SECONDS}s: {str(e)}")
+                await asyncio.sleep(INDEX_RETRY_SECONDS)
+            except PyMongoError as e:
+                logger.error(f"Error creating indexes: {str(e)}")
+                return
+    
+    app.state.indexes = asyncio.create_task(reconcile())
+
+@app.on_event("startup")
+async def start_migrations():
+    # Runs in the background; until it has finished, reads accept string dates, search
+    # does not find certificates without search keys, and batches do not skip participants
+    # whose certificates have no issuance key
+    async def migrate():
+        try:
+            # Some migrations rely on the unique indexes
+            await app.state.indexes
+            await run_migrations(db)
+        except Exception as e:
+            logger.error(f"Error migrating documents: {str(e)}")
+    
+    app.state.migrations = asyncio.create_task(migrate())
+
+@app.on_event("startup")
+async def start_job_worker():
+    job_worker.start()
+
+@app.on_event("shutdown")
+async def stop_job_worker():
+    await job_worker.stop()
+
+@app.on_event("shutdown")
+async def stop_index_creation():
+    # Builds already started on the server finish there; the rest run on the next start
+    app.state.indexes.cancel()
+
+@app.on_event("shutdown")
+async def stop_migrations():
+    # An interrupted migration continues on the next start
+    app.state.migrations.cancel()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+
+@app.on_event("shutdown")
+async def shutdown_renderer():
+    shutdown_render_executor()
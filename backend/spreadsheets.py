@@ -0,0 +1,126 @@
+import codecs
+import csv
+import io
+import zipfile
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import openpyxl
+
+SPREADSHEET_EXTENSIONS = ('.xlsx', '.xlsm', '.csv', '.tsv')
+
+# Bytes read at a time when scanning delimited files
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+
+class SpreadsheetError(ValueError):
+    """The uploaded file cannot be read as a spreadsheet"""
+
+
+def _is_delimited(path: Path) -> bool:
+    return path.suffix.lower() in ('.csv', '.tsv')
+
+
+def detect_encoding(path: Path) -> str:
+    """UTF-8 (with or without BOM) when the whole file decodes as such, otherwise Windows-1252"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(SCAN_CHUNK_SIZE), b''):
+                decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        # Excel on Windows saves "CSV" in the ANSI code page
+        return 'cp1252'
+    return 'utf-8-sig'
+
+
+def _csv_dialect(path: Path, encoding: str):
+    if path.suffix.lower() == '.tsv':
+        return csv.excel_tab
+
+    with open(path, newline='', encoding=encoding) as f:
+        sample = f.read(64 * 1024)
+    try:
+        # Spanish-locale Excel separates CSV fields with semicolons
+        return csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        return csv.excel
+
+
+def cell_text(value) -> str:
+    """A cell's value as stripped text; empty cells become ''"""
+    return '' if value is None else str(value).strip()
+
+
+def csv_line(values) -> str:
+    """One CSV record, quoted as needed, for files that are read back by iter_rows"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def validate_spreadsheet(path: Path):
+    """Cheap checks run on upload; the file is parsed by the job that processes it"""
+    path = Path(path)
+    if path.suffix.lower() not in SPREADSHEET_EXTENSIONS:
+        raise SpreadsheetError("upload an .xlsx, .csv or .tsv file")
+    if not _is_delimited(path) and not zipfile.is_zipfile(path):
+        raise SpreadsheetError("not a valid .xlsx workbook")
+
+
+def estimate_rows(path: Path) -> Optional[int]:
+    """Number of data rows below the header, blank rows included, if it can be known without parsing"""
+    path = Path(path)
+    if _is_delimited(path):
+        lines = 0
+        last = b'\n'
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(SCAN_CHUNK_SIZE), b''):
+                lines += chunk.count(b'\n')
+                last = chunk[-1:]
+        if last != b'\n':
+            lines += 1
+        return max(lines - 1, 0)
+
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        # Read-only sheets report the dimension stored in the file, which some writers omit
+        max_row = workbook.active.max_row
+    finally:
+        workbook.close()
+    return max(max_row - 1, 0) if max_row else None
+
+
+def iter_rows(path: Path, start_row: int = 2) -> Iterator[Tuple[int, tuple]]:
+    """Yield (row number, values) from start_row on, streaming the file.
+
+    Row 1 is the header. Workbooks are read in openpyxl's read-only mode and
+    delimited files with the csv module, so memory use does not grow with the
+    number of rows. Blank cells in delimited files are returned as empty strings.
+    """
+    path = Path(path)
+    start_row = max(start_row, 2)
+
+    if _is_delimited(path):
+        encoding = detect_encoding(path)
+        dialect = _csv_dialect(path, encoding)
+        with open(path, newline='', encoding=encoding) as f:
+            row_number = 0
+            try:
+                for row_number, row in enumerate(csv.reader(f, dialect), start=1):
+                    if row_number >= start_row:
+                        yield row_number, tuple(row)
+            except csv.Error as e:
+                raise SpreadsheetError(f"row {row_number + 1}: {e}")
+        return
+
+    try:
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    except Exception as e:
+        raise SpreadsheetError(str(e))
+    try:
+        for row_number, row in enumerate(workbook.active.iter_rows(min_row=start_row, values_only=True), start=start_row):
+            yield row_number, row
+    finally:
+        workbook.close()
@@ -74,6 +74,52 @@ class TestCertificates:
         assert "participant_name" in cert
         assert "unique_code" in cert
         assert "document_id" in cert
+        # Listed as summaries, without file paths
+        assert "pdf_url" not in cert
+    
+    def test_get_certificates_cursor(self, auth_headers):
+        """Test paging certificates with the X-Next-Cursor header"""
+        response = requests.get(f"{API_URL}/certificates", headers=auth_headers, params={"limit": 1})
+        assert response.status_code == 200
+        first = response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            pytest.skip("Need at least 2 certificates for cursor test")
+        
+        response = requests.get(f"{API_URL}/certificates", headers=auth_headers, params={"limit": 1, "cursor": cursor})
+        assert response.status_code == 200
+        second = response.json()
+        assert len(second) == 1
+        assert second[0]["id"] != first[0]["id"]
+        assert second[0]["created_at"] <= first[0]["created_at"]
+    
+    def test_get_certificates_invalid_cursor(self, auth_headers):
+        """Test a malformed cursor returns 400"""
+        response = requests.get(f"{API_URL}/certificates", headers=auth_headers, params={"cursor": "invalid"})
+        assert response.status_code == 400
+    
+    def test_search_certificates(self, auth_headers):
+        """Test searching certificates by document id and by participant name"""
+        list_response = requests.get(f"{API_URL}/certificates", headers=auth_headers)
+        # Only queries with digits are searched as document ids
+        certs = [c for c in list_response.json() if any(char.isdigit() for char in c["document_id"])]
+        if not certs:
+            pytest.skip("No certificates to test")
+        
+        cert = certs[0]
+        response = requests.get(f"{API_URL}/certificates/search", headers=auth_headers, params={"q": cert["document_id"]})
+        assert response.status_code == 200
+        assert cert["id"] in [c["id"] for c in response.json()]
+        
+        name = cert["participant_name"].split()[0].upper()
+        response = requests.get(f"{API_URL}/certificates/search", headers=auth_headers, params={"q": name})
+        assert response.status_code == 200
+        assert all(name.lower() in c["participant_name"].lower() for c in response.json())
+    
+    def test_search_certificates_short_query(self, auth_headers):
+        """Test a one-character search returns 400"""
+        response = requests.get(f"{API_URL}/certificates/search", headers=auth_headers, params={"q": "a"})
+        assert response.status_code == 400
     
     def test_get_single_certificate(self, auth_headers):
         """Test getting a single certificate by ID"""
@@ -100,8 +146,130 @@ class TestCertificates:
         cert_id = certs[0]["id"]
         response = requests.get(f"{API_URL}/certificates/{cert_id}/download", headers=auth_headers)
         assert response.status_code == 200
-        # Should return PNG image
-        assert response.headers.get("content-type") == "image/png"
+        # Served in the format it was rendered in
+        media_types = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg", "pdf": "application/pdf"}
+        assert response.headers.get("content-type") == media_types[certs[0]["file_format"]]
+    
+    def test_certificate_download_output_formats(self, auth_headers):
+        """Test a certificate of each output format downloads with its media type and extension"""
+        import io
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new("RGB", (400, 283), "white").save(buffer, format="PNG")
+        
+        expected = {
+            "png": ("image/png", ".png"),
+            "webp": ("image/webp", ".webp"),
+            "jpeg": ("image/jpeg", ".jpg"),
+            "pdf": ("application/pdf", ".pdf"),
+        }
+        for output_format, (media_type, extension) in expected.items():
+            response = requests.post(
+                f"{API_URL}/templates",
+                headers=auth_headers,
+                data={"name": f"TEST {output_format}", "width": 400, "height": 283, "output_format": output_format},
+                files={"file": ("template.png", buffer.getvalue(), "image/png")}
+            )
+            assert response.status_code == 200, response.text
+            template_id = response.json()["id"]
+            try:
+                response = requests.post(f"{API_URL}/certificates", headers=auth_headers, json={
+                    "template_id": template_id,
+                    "participant_name": "TEST Format",
+                    "document_id": f"TEST-FORMAT-{output_format}",
+                    "certifier_name": "TEST",
+                    "representative_name": "TEST"
+                })
+                assert response.status_code == 200, response.text
+                cert = response.json()
+                assert cert["file_format"] == output_format
+                
+                response = requests.get(f"{API_URL}/certificates/{cert['id']}/download", headers=auth_headers)
+                assert response.status_code == 200
+                assert response.headers.get("content-type") == media_type
+                assert extension in response.headers.get("content-disposition", "")
+            finally:
+                requests.delete(f"{API_URL}/templates/{template_id}", headers=auth_headers)
+
+
+class TestDateMigration:
+    """String dates left by earlier releases, before and after migration"""
+
+    def test_mixed_dates_page_filter_and_migrate(self, auth_headers):
+        """Test cursor paging and date filters over string and BSON dates, then their migration"""
+        import asyncio
+        import sys
+        import uuid
+        from datetime import datetime, timezone
+        from pathlib import Path
+        from dotenv import load_dotenv
+
+        backend_dir = Path(__file__).resolve().parents[1]
+        load_dotenv(backend_dir / '.env')
+        if not os.environ.get('MONGO_URL') or not os.environ.get('DB_NAME'):
+            pytest.skip("MONGO_URL and DB_NAME are not configured")
+        sys.path.insert(0, str(backend_dir))
+        import migrations
+        import server
+        from models import Certificate
+        from utils import generate_certificate_hash
+
+        event_name = f"TEST Dates {uuid.uuid4().hex[:8]}"
+        # Newest first: one BSON date, an ISO string with microseconds, a naive ISO string
+        created = [
+            datetime(2024, 3, 3, 12, 0, tzinfo=timezone.utc),
+            "2024-02-02T12:00:00.123456+00:00",
+            "2024-01-01T12:00:00",
+        ]
+        documents = [{
+            "id": str(uuid.uuid4()), "unique_code": uuid.uuid4().hex[:8].upper(), "template_id": "TEST",
+            "participant_name": f"TEST Dates {index}", "document_id": f"TEST-DATES-{index}",
+            "certifier_name": "TEST", "representative_name": "TEST", "event_name": event_name,
+            "issue_date": created_at, "created_at": created_at, "file_format": "png",
+            "is_valid": True, "created_by": "TEST", "validation_count": 0,
+        } for index, created_at in enumerate(created)]
+        for document in documents:
+            # As earlier releases computed it, from the stored ISO string
+            issue_date = document["issue_date"]
+            document["hash_code"] = generate_certificate_hash(
+                {**document, "issue_date": issue_date if isinstance(issue_date, str) else issue_date.isoformat()}
+            )
+
+        def list_ids(**params):
+            ids = []
+            cursor = None
+            while True:
+                response = requests.get(f"{API_URL}/certificates", headers=auth_headers, params={
+                    "event_name": event_name, "limit": 1, **({"cursor": cursor} if cursor else {}), **params
+                })
+                assert response.status_code == 200
+                ids += [cert["id"] for cert in response.json()]
+                cursor = response.headers.get("X-Next-Cursor")
+                if not cursor:
+                    return ids
+
+        async def scenario():
+            database = server.db
+            await database.certificates.insert_many([dict(document) for document in documents])
+            try:
+                ids = [document["id"] for document in documents]
+                # Before migration every certificate is listed once and the filter matches both types
+                assert sorted(list_ids()) == sorted(ids)
+                assert sorted(list_ids(created_from="2024-01-15T00:00:00Z")) == sorted(ids[:2])
+
+                await migrations.migrate_dates(database)
+                migrated = await database.certificates.find_one({"id": ids[1]})
+                assert isinstance(migrated["created_at"], datetime)
+                assert migrated["issue_date_source"] == created[1]
+                assert server.certificate_hash(Certificate(**migrated)) == migrated["hash_code"]
+
+                assert list_ids() == ids
+                assert list_ids(created_from="2024-01-15T00:00:00Z") == ids[:2]
+                assert list_ids(created_to="2024-01-15T00:00:00Z") == ids[2:]
+            finally:
+                await database.certificates.delete_many({"event_name": event_name})
+
+        asyncio.run(scenario())
 
 
 class TestBatchPdf:
@@ -132,6 +300,22 @@ class TestBatchPdf:
         # Should have content
         assert len(response.content) > 1000, "PDF content too small"
     
+    def test_batch_pdf_repeat_download(self, auth_headers):
+        """Test downloading the same selection twice returns the same PDF"""
+        list_response = requests.get(f"{API_URL}/certificates", headers=auth_headers)
+        certs = list_response.json()
+        if len(certs) < 2:
+            pytest.skip("Need at least 2 certificates for batch PDF test")
+        
+        cert_ids = [certs[0]["id"], certs[1]["id"]]
+        downloads = [
+            requests.post(f"{API_URL}/certificates/batch-pdf", headers=auth_headers, json=cert_ids)
+            for _ in range(2)
+        ]
+        assert [response.status_code for response in downloads] == [200, 200]
+        # The second download is served from the batch PDF cache
+        assert downloads[0].content == downloads[1].content
+    
     def test_batch_pdf_empty_list(self, auth_headers):
         """Test batch PDF with empty list returns 400"""
         response = requests.post(
@@ -151,6 +335,194 @@ class TestBatchPdf:
         assert response.status_code == 404
 
 
+@pytest.fixture(scope="module")
+def template_id(auth_headers):
+    """Id of the template test batches are issued with"""
+    templates = requests.get(f"{API_URL}/templates", headers=auth_headers).json()
+    if not templates:
+        pytest.skip("No templates to test")
+    return templates[0]["id"]
+
+
+def submit_batch(auth_headers, template_id, content: bytes, filename: str = "batch.csv") -> dict:
+    """Queue a batch issuance job for a spreadsheet and return the queued job"""
+    response = requests.post(
+        f"{API_URL}/certificates/batch",
+        headers=auth_headers,
+        data={"template_id": template_id, "certifier_name": "TEST"},
+        files={"file": (filename, content)}
+    )
+    assert response.status_code == 202, f"Batch failed: {response.text}"
+    return response.json()
+
+
+def run_batch(auth_headers, template_id, content: bytes, filename: str = "batch.csv") -> dict:
+    """Issue a batch and return its job once it has finished"""
+    job = submit_batch(auth_headers, template_id, content, filename)
+    # The event stream ends once the job has finished
+    requests.get(f"{API_URL}/jobs/{job['id']}/events", headers=auth_headers, timeout=60)
+    response = requests.get(f"{API_URL}/jobs/{job['id']}", headers=auth_headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+def job_rows(auth_headers, job_id: str, **params) -> list:
+    """Rows of a job, filtered by the given query parameters"""
+    response = requests.get(f"{API_URL}/jobs/{job_id}/rows", headers=auth_headers, params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+class TestJobs:
+    """Background job endpoint tests"""
+
+    def test_batch_returns_job(self, auth_headers, template_id):
+        """Test batch issuance is queued as a job that can be polled"""
+        import io
+        import openpyxl
+        workbook = openpyxl.Workbook()
+        workbook.active.append(["participant_name", "document_id"])
+        workbook.active.append(["TEST Participant", "TEST-001"])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+
+        job = submit_batch(auth_headers, template_id, buffer.getvalue(), "batch.xlsx")
+        assert job["status"] in ("queued", "running", "completed")
+
+        response = requests.get(f"{API_URL}/jobs/{job['id']}", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json()["id"] == job["id"]
+
+    def test_job_events_stream(self, auth_headers, template_id):
+        """Test the job event stream ends with a summary event"""
+        job = submit_batch(auth_headers, template_id, b"participant_name,document_id\nTEST Participant,TEST-002\n")
+
+        response = requests.get(f"{API_URL}/jobs/{job['id']}/events", headers=auth_headers, stream=True, timeout=60)
+        assert response.status_code == 200
+        assert response.headers.get("content-type", "").startswith("text/event-stream")
+        events = [line for line in response.iter_lines(decode_unicode=True) if line.startswith("event: ")]
+        assert "event: rows" in events
+        assert events[-1] == "event: done"
+
+    def test_batch_pipeline_stats(self, auth_headers, template_id):
+        """Test a finished job reports the rows each pipeline stage handled"""
+        import uuid
+        suffix = uuid.uuid4().hex[:8]
+        rows = "".join(f"TEST Pipeline,TEST-{suffix}-{index}\n" for index in range(3))
+        job = run_batch(auth_headers, template_id, f"participant_name,document_id\n{rows}".encode())
+
+        assert job["status"] == "completed" and job["succeeded"] == 3
+        stats = job["pipeline"]
+        assert stats["source"]["items"] == 3
+        assert list(stats["stages"]) == ["render", "write", "persist"]
+        for stage in stats["stages"].values():
+            assert stage["items"] == 3
+            assert stage["queue_depth"] == 0
+            assert 0 <= stage["utilization"] <= 1
+
+    def test_batch_invalid_rows_fail_individually(self, auth_headers, template_id):
+        """Test invalid rows are reported as failed while the rest of the batch is issued"""
+        job = run_batch(auth_headers, template_id, b"participant_name,document_id\nTEST Participant,TEST-003\nTEST Missing Id,\n")
+
+        failed = job_rows(auth_headers, job["id"], status="failed")
+        assert [row["row"] for row in failed] == [3]
+        assert failed[0]["error"] == "Missing document_id"
+
+        response = requests.get(f"{API_URL}/jobs/{job['id']}/failed-rows", headers=auth_headers)
+        assert response.status_code == 200
+        assert "TEST Missing Id" in response.text
+
+    def test_batch_resubmission_skips_existing(self, auth_headers, template_id):
+        """Test resubmitting the same spreadsheet skips rows that already have a certificate"""
+        import uuid
+        suffix = uuid.uuid4().hex[:8]
+        content = f"participant_name,document_id\nTEST Resubmit,TEST-{suffix}-1\nTEST Resubmit,TEST-{suffix}-2\n".encode()
+        first = run_batch(auth_headers, template_id, content)
+        second = run_batch(auth_headers, template_id, content)
+
+        assert first["status"] == "completed" and first["succeeded"] == 2
+        assert second["status"] == "completed"
+        assert second["succeeded"] == 0 and second["skipped"] == 2
+        assert [row["status"] for row in job_rows(auth_headers, second["id"])] == ["existing", "existing"]
+
+    def test_batch_skips_singly_issued(self, auth_headers, template_id):
+        """Test a batch skips a participant issued singly, and a single issue can still reissue"""
+        import uuid
+        document_id = f"TEST-{uuid.uuid4().hex[:8]}"
+        issued = []
+        for _ in range(2):
+            response = requests.post(f"{API_URL}/certificates", headers=auth_headers, json={
+                "template_id": template_id, "participant_name": "TEST Single",
+                "document_id": document_id, "certifier_name": "TEST", "representative_name": "TEST",
+            })
+            assert response.status_code == 200, response.text
+            issued.append(response.json()["id"])
+
+        job = run_batch(auth_headers, template_id, f"participant_name,document_id\nTEST Single,{document_id}\n".encode())
+
+        rows = job_rows(auth_headers, job["id"])
+        assert [row["status"] for row in rows] == ["existing"]
+        assert rows[0]["certificate_id"] == issued[0]
+
+    def test_batch_excel_csv(self, auth_headers, template_id):
+        """Test a semicolon-separated Windows-1252 CSV, as saved by Spanish-locale Excel"""
+        import uuid
+        document_id = f"TEST-{uuid.uuid4().hex[:8]}"
+        content = f"participant_name;document_id\nTEST José Muñoz;{document_id}\n".encode("cp1252")
+        job = run_batch(auth_headers, template_id, content)
+
+        rows = job_rows(auth_headers, job["id"])
+        assert [(row["status"], row["participant_name"]) for row in rows] == [("succeeded", "TEST José Muñoz")]
+
+    def test_batch_rejects_xls(self, auth_headers, template_id):
+        """Test legacy .xls workbooks are rejected up front with a clear error"""
+        response = requests.post(
+            f"{API_URL}/certificates/batch",
+            headers=auth_headers,
+            data={"template_id": template_id, "certifier_name": "TEST"},
+            files={"file": ("batch.xls", b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1")}
+        )
+        assert response.status_code == 400
+        assert ".xls" in response.json()["detail"]
+
+    def test_job_not_found(self, auth_headers):
+        """Test unknown job returns 404"""
+        response = requests.get(f"{API_URL}/jobs/invalid-job-id", headers=auth_headers)
+        assert response.status_code == 404
+
+
+class TestZipExport:
+    """ZIP export endpoint tests"""
+
+    def test_zip_export_selection(self, auth_headers):
+        """Test POST /api/certificates/export-zip with selected certificates"""
+        import io
+        import zipfile
+
+        list_response = requests.get(f"{API_URL}/certificates", headers=auth_headers)
+        certs = list_response.json()
+        if len(certs) < 2:
+            pytest.skip("Need at least 2 certificates for ZIP export test")
+
+        response = requests.post(
+            f"{API_URL}/certificates/export-zip",
+            headers=auth_headers,
+            json={"certificate_ids": [certs[0]["id"], certs[1]["id"]]}
+        )
+        assert response.status_code == 200, f"ZIP export failed: {response.text}"
+        assert response.headers.get("content-type") == "application/zip"
+
+        archive = zipfile.ZipFile(io.BytesIO(response.content))
+        assert archive.testzip() is None
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+        assert any(certs[0]["unique_code"] in name for name in archive.namelist())
+
+    def test_zip_export_requires_selection(self, auth_headers):
+        """Test ZIP export without a selection returns 400"""
+        response = requests.post(f"{API_URL}/certificates/export-zip", headers=auth_headers, json={})
+        assert response.status_code == 400
+
+
 class TestTemplates:
     """Template endpoint tests"""
     
@@ -160,6 +532,8 @@ class TestTemplates:
         assert response.status_code == 200
         data = response.json()
         assert isinstance(data, list)
+        # Listed as summaries, without the field layout
+        assert all("fields" not in template for template in data)
     
     def test_get_single_template(self, auth_headers):
         """Test getting a single template"""
@@ -174,6 +548,73 @@ class TestTemplates:
         data = response.json()
         assert data["id"] == template_id
 
+    def test_update_template_rejects_invalid_layout(self, auth_headers):
+        """Test saving a layout the renderer cannot draw returns 400 and leaves the template unchanged"""
+        list_response = requests.get(f"{API_URL}/templates", headers=auth_headers)
+        templates = list_response.json()
+        if not templates:
+            pytest.skip("No templates to test")
+        
+        template_id = templates[0]["id"]
+        before = requests.get(f"{API_URL}/templates/{template_id}", headers=auth_headers).json()
+        for field in (
+            {"field_type": "unknown", "x": 0, "y": 0, "width": 100, "height": 40},
+            {"field_type": "participant_name", "x": 0, "y": 0, "width": 0, "height": 40},
+        ):
+            response = requests.put(f"{API_URL}/templates/{template_id}", headers=auth_headers, json={"fields": [field]})
+            assert response.status_code == 400
+        after = requests.get(f"{API_URL}/templates/{template_id}", headers=auth_headers).json()
+        assert after["fields"] == before["fields"]
+
+    def test_template_image_preview_size(self, auth_headers):
+        """Test requesting a downscaled template preview"""
+        list_response = requests.get(f"{API_URL}/templates", headers=auth_headers)
+        templates = list_response.json()
+        if not templates:
+            pytest.skip("No templates to test")
+
+        template_id = templates[0]["id"]
+        full = requests.get(f"{API_URL}/templates/{template_id}/image")
+        preview = requests.get(f"{API_URL}/templates/{template_id}/image", params={"size": 320})
+        assert preview.status_code == 200
+        # A preview is never larger than the original
+        assert len(preview.content) <= len(full.content)
+
+    def test_template_render_preview(self, auth_headers):
+        """Test the editor preview renders in memory without creating certificates"""
+        list_response = requests.get(f"{API_URL}/templates", headers=auth_headers)
+        templates = list_response.json()
+        if not templates:
+            pytest.skip("No templates to test")
+
+        template_id = templates[0]["id"]
+        response = requests.post(
+            f"{API_URL}/templates/{template_id}/preview",
+            headers=auth_headers,
+            json={"scale": 0.5, "image_format": "jpeg"}
+        )
+        assert response.status_code == 200
+        assert response.headers.get("content-type") == "image/jpeg"
+
+        # Sized to the editor canvas width
+        import io
+        from PIL import Image
+        response = requests.post(
+            f"{API_URL}/templates/{template_id}/preview",
+            headers=auth_headers,
+            json={"width": 400}
+        )
+        assert response.status_code == 200
+        assert Image.open(io.BytesIO(response.content)).width <= 400
+
+        # Unsaved layouts are validated like saved ones
+        response = requests.post(
+            f"{API_URL}/templates/{template_id}/preview",
+            headers=auth_headers,
+            json={"fields": [{"field_type": "unknown", "x": 0, "y": 0, "width": 10, "height": 10}]}
+        )
+        assert response.status_code == 400
+
 
 class TestVerification:
     """Public verification endpoint tests"""
@@ -212,6 +653,14 @@ class TestStats:
         assert "certificates_this_month" in data
         assert "total_validations" in data
 
+    def test_get_index_stats(self, auth_headers):
+        """Test the admin index report lists the verification code index"""
+        response = requests.get(f"{API_URL}/stats/indexes", headers=auth_headers)
+        assert response.status_code == 200
+        indexes = response.json()["certificates"]["indexes"]
+        unique_code = [index for index in indexes if index["key"] == [["unique_code", 1]]]
+        assert unique_code and unique_code[0]["present"] and unique_code[0]["unique"]
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
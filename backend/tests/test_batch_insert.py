@@ -0,0 +1,68 @@
+"""
+Batch certificate inserts against a scratch MongoDB database
+Tests: unordered inserts store every valid document and report the rest by index
+"""
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+from dotenv import load_dotenv
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+load_dotenv(BACKEND_DIR / '.env')
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get('MONGO_URL') or not os.environ.get('DB_NAME'),
+    reason="MONGO_URL and DB_NAME are not configured"
+)
+
+
+@pytest.fixture(scope="module")
+def server():
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+    return server
+
+
+def certificate(unique_code: str, issuance_key=None) -> dict:
+    return {"id": str(uuid.uuid4()), "unique_code": unique_code, "issuance_key": issuance_key}
+
+
+def test_insert_certificates_partial_failure(server, monkeypatch):
+    """Test duplicates fail individually, in any chunk, while the other documents are stored"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from indexes import INDEXES
+
+    monkeypatch.setattr(server, "BATCH_INSERT_SIZE", 3)
+    existing = certificate("TESTEXIST", "key-existing")
+    documents = [
+        certificate("TEST0"),
+        certificate("TEST1", "key-1"),
+        certificate("TEST0"),                  # Same unique code as document 0
+        certificate("TEST3"),
+        certificate("TEST4", "key-existing"),  # Same issuance key as a stored certificate
+        certificate("TEST5", "key-1"),         # Same issuance key as document 1
+        certificate("TEST6"),
+    ]
+
+    async def scenario():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        database = client[f"{os.environ['DB_NAME']}_test_{uuid.uuid4().hex[:8]}"]
+        try:
+            await database.certificates.create_indexes(INDEXES['certificates'])
+            await database.certificates.insert_one(dict(existing))
+            write_errors = await server.insert_certificates(database, [dict(document) for document in documents])
+            stored = await database.certificates.find({}, {"_id": 0, "id": 1}).to_list(None)
+            return write_errors, {document['id'] for document in stored}
+        finally:
+            await client.drop_database(database.name)
+            client.close()
+
+    write_errors, stored = asyncio.run(scenario())
+
+    assert sorted(write_errors) == [2, 4, 5]
+    assert all(error['code'] == 11000 for error in write_errors.values())
+    assert stored == {existing['id']} | {documents[index]['id'] for index in (0, 1, 3, 6)}
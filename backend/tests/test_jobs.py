@@ -0,0 +1,103 @@
+"""
+JobWorker tests against a scratch MongoDB database
+Tests: completion, failure, and resumption from the checkpoint after a retryable error
+"""
+import asyncio
+import os
+import sys
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+load_dotenv(BACKEND_DIR / '.env')
+sys.path.insert(0, str(BACKEND_DIR))
+
+import jobs  # noqa: E402
+from models import Job  # noqa: E402
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get('MONGO_URL') or not os.environ.get('DB_NAME'),
+    reason="MONGO_URL and DB_NAME are not configured"
+)
+
+ROWS = 8
+
+
+def run_jobs(handlers: Dict[str, jobs.JobHandler], documents: List[dict]) -> List[dict]:
+    """Run a JobWorker over documents in a scratch database until every job is final, and return them"""
+    async def scenario():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        database = client[f"{os.environ['DB_NAME']}_test_{uuid.uuid4().hex[:8]}"]
+        worker = jobs.JobWorker(database, handlers, poll_seconds=0.05)
+        try:
+            await database.jobs.insert_many(documents)
+            worker.start()
+            for _ in range(200):
+                found = {job['id']: job for job in await database.jobs.find({}, {'_id': 0}).to_list(None)}
+                if all(job['status'] in ('completed', 'failed') for job in found.values()):
+                    return [found[document['id']] for document in documents]
+                await asyncio.sleep(0.05)
+            raise AssertionError(f"Jobs did not finish: {list(found.values())}")
+        finally:
+            await worker.stop()
+            await client.drop_database(database.name)
+            client.close()
+
+    return asyncio.run(scenario())
+
+
+def test_job_resumes_at_next_row_after_retryable_error(monkeypatch, tmp_path):
+    """Test a job interrupted by a dead render pool keeps its input and resumes from next_row"""
+    monkeypatch.setattr(jobs, "JOB_RETRY_SECONDS", 0)
+    source = tmp_path / "batch.csv"
+    source.write_text("participant_name,document_id\n")
+    attempts = []
+
+    async def handler(job: jobs.JobContext):
+        start = job.job['next_row']
+        attempts.append((start, source.exists()))
+        for row in range(start, ROWS):
+            if row == 5 and len(attempts) == 1:
+                raise BrokenProcessPool("A render worker died")
+            await job.update({'next_row': row + 1}, inc={'processed': 1})
+
+    [job] = run_jobs({"test": handler}, [
+        Job(type="test", source_path=str(source), created_by="TEST").model_dump()
+    ])
+
+    assert attempts == [(0, True), (5, True)]
+    assert job["status"] == "completed"
+    assert job["attempts"] == 2
+    assert job["last_error"] == "A render worker died"
+    assert job["processed"] == ROWS
+    assert not source.exists()
+
+
+def test_job_error_fails_job(tmp_path):
+    """Test any other error fails the job with its message and removes its input"""
+    source = tmp_path / "batch.csv"
+    source.write_text("participant_name,document_id\n")
+
+    async def handler(job: jobs.JobContext):
+        raise jobs.JobError("Template not found")
+
+    async def succeed(job: jobs.JobContext):
+        await job.update({'next_row': ROWS})
+
+    failed, completed = run_jobs({"test_fail": handler, "test_ok": succeed}, [
+        Job(type="test_fail", source_path=str(source), created_by="TEST").model_dump(),
+        Job(type="test_ok", created_by="TEST").model_dump(),
+    ])
+
+    assert failed["status"] == "failed"
+    assert failed["error"] == "Template not found"
+    assert failed["attempts"] == 1
+    assert not source.exists()
+    assert completed["status"] == "completed"
+    assert completed["next_row"] == ROWS
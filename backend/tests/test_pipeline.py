@@ -0,0 +1,107 @@
+"""
+Batch pipeline tests
+Tests: stage stats, batched stages, backpressure, error propagation, row checkpoints
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from pipeline import Pipeline, RowCheckpoint, Stage  # noqa: E402
+
+ITEMS = 25
+
+
+async def numbers(count: int = ITEMS):
+    for number in range(count):
+        yield number
+
+
+def test_pipeline_stats():
+    """Test every stage reports the items it handled, batched stages counting items rather than batches"""
+    batches = []
+
+    async def double(number):
+        await asyncio.sleep(0.001)
+        return number * 2
+
+    async def drop_odd(number):
+        return number if number % 4 == 0 else None
+
+    async def collect(batch):
+        batches.append(batch)
+
+    pipeline = Pipeline([
+        Stage("double", double, workers=3, queue_size=4),
+        Stage("filter", drop_odd, queue_size=4),
+        Stage("collect", collect, queue_size=4, batch_size=5, linger=0.01),
+    ])
+    asyncio.run(pipeline.run(numbers()))
+
+    assert sorted(number for batch in batches for number in batch) == [n * 2 for n in range(ITEMS) if n % 2 == 0]
+    assert all(len(batch) <= 5 for batch in batches)
+
+    stats = pipeline.stats()
+    assert stats["source"]["items"] == ITEMS
+    assert stats["elapsed_seconds"] >= 0
+    assert list(stats["stages"]) == ["double", "filter", "collect"]
+    double_stats, filter_stats, collect_stats = stats["stages"].values()
+    assert double_stats["workers"] == 3
+    assert double_stats["items"] == ITEMS
+    assert filter_stats["items"] == ITEMS
+    assert collect_stats["items"] == (ITEMS + 1) // 2
+    for stage in stats["stages"].values():
+        assert stage["queue_depth"] == 0
+        assert stage["queue_size"] == 4
+        assert 0.0 <= stage["utilization"] <= 1.0
+        assert stage["items_per_second"] > 0
+
+
+def test_pipeline_backpressure():
+    """Test a slow stage stops the source from being read ahead of its bounded queues"""
+    read = []
+    written = []
+
+    async def source():
+        for number in range(ITEMS):
+            read.append(number)
+            yield number
+
+    async def passthrough(number):
+        return number
+
+    async def slow(number):
+        written.append(number)
+        await asyncio.sleep(0.005)
+        # Both queues full, plus the item the feeder and the first stage are each waiting to put
+        assert len(read) - len(written) <= 2 + 2 + 2
+
+    pipeline = Pipeline([Stage("pass", passthrough, queue_size=2), Stage("slow", slow, queue_size=2)])
+    asyncio.run(pipeline.run(source()))
+    assert written == list(range(ITEMS))
+
+
+def test_pipeline_stage_error():
+    """Test an error in any stage stops the pipeline and is raised to the caller"""
+    async def passthrough(number):
+        return number
+
+    async def fail(number):
+        if number == 7:
+            raise ValueError("Row 7 failed")
+
+    pipeline = Pipeline([Stage("pass", passthrough), Stage("fail", fail)])
+    with pytest.raises(ValueError, match="Row 7 failed"):
+        asyncio.run(pipeline.run(numbers()))
+
+
+def test_row_checkpoint_out_of_order():
+    """Test the checkpoint only advances past rows that are all done"""
+    checkpoint = RowCheckpoint(10)
+    for row, expected in [(12, 10), (11, 10), (10, 13), (14, 13), (13, 15)]:
+        checkpoint.done(row)
+        assert checkpoint.next_row == expected
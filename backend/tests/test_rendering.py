@@ -0,0 +1,123 @@
+"""
+Certificate rendering tests
+Tests: font cache, QR code rendering, batch static layers
+"""
+import sys
+from datetime import datetime, timezone
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+import rendering  # noqa: E402
+from utils import font_cache_info, generate_qr_matrix, get_font, render_qr_image  # noqa: E402
+
+VERIFICATION_URL = "https://example.com/verify/TEST1234"
+
+STATIC_VALUES = {"certifier_name": "TEST Certifier", "event_name": "TEST Event"}
+
+
+@pytest.fixture
+def template(tmp_path):
+    """A plain template with text fields of every batch kind and a QR code"""
+    file_path = tmp_path / "template.png"
+    Image.new("RGB", (800, 600), (250, 245, 230)).save(file_path)
+    field = {"font_family": "Arial", "font_size": 24, "font_color": "#1a2b3c", "width": 500, "height": 40}
+    return {
+        "id": f"test-{tmp_path.name}",
+        "file_url": str(file_path),
+        "updated_at": "1",
+        "fields": [
+            {**field, "field_type": "participant_name", "x": 50, "y": 50, "text_align": "center"},
+            {**field, "field_type": "document_id", "x": 50, "y": 120},
+            {**field, "field_type": "certifier_name", "x": 50, "y": 190, "text_align": "right"},
+            {**field, "field_type": "event_name", "x": 50, "y": 260},
+            {**field, "field_type": "date", "x": 50, "y": 330},
+            {"field_type": "qr_code", "x": 600, "y": 400, "width": 150, "height": 150},
+        ],
+    }
+
+
+def certificate_data(**values) -> dict:
+    return {
+        "participant_name": "TEST Participant",
+        "document_id": "TEST-001",
+        "issue_date": datetime(2024, 5, 1, tzinfo=timezone.utc),
+        "unique_code": "TEST1234",
+        **STATIC_VALUES,
+        **values,
+    }
+
+
+def render(template: dict, data: dict, static_values=None) -> Image.Image:
+    content = rendering.render_certificate_bytes(template, data, VERIFICATION_URL, static_values)
+    return Image.open(BytesIO(content)).convert("RGB")
+
+
+def test_font_cache_reuses_fonts():
+    """Test a family and size is loaded once and then served from the cache"""
+    font = get_font("Georgia", 37)
+    before = font_cache_info()
+    assert get_font("Georgia", 37) is font
+    after = font_cache_info()
+    assert after["hits"] == before["hits"] + 1
+    assert after["misses"] == before["misses"]
+
+    assert get_font("Georgia", 38) is not font
+    assert font_cache_info()["misses"] == after["misses"] + 1
+
+
+def test_font_cache_stats():
+    """Test render cache stats report the font cache of this process"""
+    get_font("Verdana", 41)
+    stats = rendering.render_cache_stats()
+    assert stats["fonts"] == font_cache_info()
+    assert stats["fonts"]["size"] >= 1
+
+
+@pytest.mark.parametrize("width,height", [(150, None), (233, 233), (120, 90)])
+def test_qr_image_matches_matrix(width, height):
+    """Test the QR image has the requested size and one sharp black or white cell per module"""
+    matrix = generate_qr_matrix(VERIFICATION_URL)
+    image = render_qr_image(VERIFICATION_URL, width, height)
+    height = height or width
+    assert image.size == (width, height)
+    assert image.mode == "RGB"
+    assert {color for _, color in image.getcolors()} <= {(0, 0, 0), (255, 255, 255)}
+
+    modules = len(matrix)
+    for row in range(modules):
+        for column in range(modules):
+            x = int((column + 0.5) * width / modules)
+            y = int((row + 0.5) * height / modules)
+            expected = (0, 0, 0) if matrix[row][column] else (255, 255, 255)
+            assert image.getpixel((x, y)) == expected, (row, column)
+
+
+def test_qr_code_drawn_on_certificate(template):
+    """Test the certificate carries the verification QR code in its box"""
+    image = render(template, certificate_data())
+    assert image.crop((600, 400, 750, 550)).tobytes() == render_qr_image(VERIFICATION_URL, 150, 150).tobytes()
+
+
+def test_static_layer_matches_full_render(template):
+    """Test rows drawn on a cached static layer are identical to fully drawn rows"""
+    for name in ("TEST Participant", "TEST Other Participant"):
+        data = certificate_data(participant_name=name)
+        assert render(template, data, STATIC_VALUES).tobytes() == render(template, data).tobytes()
+
+    # The layer is built once per template revision and static values
+    layers = [key for key in rendering.template_cache._entries if key[0] == template["id"] and key[-1]]
+    assert len(layers) == 1
+
+
+def test_static_layer_not_used_for_other_values(template):
+    """Test a row whose values differ from the batch's static values is drawn with its own"""
+    data = certificate_data(event_name="TEST Other Event")
+    with_layer = render(template, data, STATIC_VALUES)
+    assert with_layer.tobytes() == render(template, data).tobytes()
+    assert with_layer.tobytes() != render(template, certificate_data(), STATIC_VALUES).tobytes()
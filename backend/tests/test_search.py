@@ -0,0 +1,96 @@
+"""
+Query plans of certificate search against the declared indexes
+Tests: exact matches read newest first from an index, prefix matches are never sorted
+"""
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from dotenv import load_dotenv
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+load_dotenv(BACKEND_DIR / '.env')
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get('MONGO_URL') or not os.environ.get('DB_NAME'),
+    reason="MONGO_URL and DB_NAME are not configured"
+)
+
+NAMES = ["María José García", "Mario Gómez", "Marta Ruiz", "José María López", "Ana Martínez"]
+
+
+@pytest.fixture(scope="module")
+def server():
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+    return server
+
+
+@pytest.fixture(scope="module")
+def certificates(server):
+    """A scratch certificates collection with the declared indexes"""
+    from pymongo import MongoClient
+    from indexes import INDEXES
+    from utils import document_key, name_tokens
+
+    client = MongoClient(os.environ['MONGO_URL'])
+    collection = client[os.environ['DB_NAME']][f"test_search_{uuid.uuid4().hex[:8]}"]
+    collection.create_indexes(INDEXES['certificates'])
+
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    collection.insert_many([{
+        "id": str(uuid.uuid4()),
+        "unique_code": uuid.uuid4().hex[:8].upper(),
+        "participant_name": NAMES[index % len(NAMES)],
+        "name_tokens": name_tokens(NAMES[index % len(NAMES)]),
+        "document_id": f"{12340000 + index}",
+        "document_key": document_key(f"{12340000 + index}"),
+        "created_at": start + timedelta(minutes=index),
+    } for index in range(500)])
+    yield collection
+    collection.drop()
+    client.close()
+
+
+def plan_stages(plan) -> set:
+    """Stage names anywhere in an explain plan, classic or slot-based"""
+    stages = set()
+    if isinstance(plan, dict):
+        if isinstance(plan.get('stage'), str):
+            stages.add(plan['stage'])
+        for value in plan.values():
+            stages |= plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            stages |= plan_stages(value)
+    return stages
+
+
+@pytest.mark.parametrize("q", ["maría", "jose maria", "ma", "12340042", "12"])
+def test_exact_search_reads_index_order(server, certificates, q):
+    """Test exact matches come newest first from an index, without a SORT stage"""
+    exact, _ = server.certificate_search_conditions(q)
+    query = certificates.find({"$and": exact}).sort([("created_at", -1), ("id", -1)]).limit(21)
+    stages = plan_stages(query.explain()["queryPlanner"]["winningPlan"])
+    assert "IXSCAN" in stages
+    assert "SORT" not in stages
+
+
+@pytest.mark.parametrize("q", ["ma", "jose mar", "12"])
+def test_prefix_search_is_not_sorted(server, certificates, q):
+    """Test prefix matches scan an index range and are read unsorted"""
+    _, prefix = server.certificate_search_conditions(q)
+    query = certificates.find({"$and": prefix}).limit(20)
+    stages = plan_stages(query.explain()["queryPlanner"]["winningPlan"])
+    assert "IXSCAN" in stages
+    assert "SORT" not in stages
+
+    matched = list(certificates.find({"$and": prefix}).limit(20))
+    assert matched
+    last = q.split()[-1]
+    for certificate in matched:
+        words = certificate["name_tokens"] if not last.isdigit() else [certificate["document_key"]]
+        assert any(word.startswith(last) and word != last for word in words)
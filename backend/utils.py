@@ -1,10 +1,13 @@
 import hashlib
+import re
+import unicodedata
 import qrcode
 from PIL import Image, ImageDraw, ImageFont
 from io import BytesIO
 import os
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+from functools import lru_cache
 import base64
 from pathlib import Path
 
@@ -37,8 +40,22 @@ def generate_certificate_hash(data: Dict[str, Any]) -> str:
     hash_string = f"{data['unique_code']}{data['participant_name']}{data['document_id']}{data['issue_date']}"
     return hashlib.sha256(hash_string.encode()).hexdigest()
 
-def generate_qr_code(data: str, size: int = 300) -> str:
-    """Generate QR code and return as base64 string"""
+def generate_issuance_key(template_id: str, document_id: str, event_name: Optional[str], course_name: Optional[str]) -> str:
+    """Identity of an issuance: one certificate per participant document, template, event and course"""
+    parts = [template_id, str(document_id).strip().upper(), (event_name or '').strip(), (course_name or '').strip()]
+    return hashlib.sha256('\x1f'.join(parts).encode()).hexdigest()
+
+def name_tokens(name: str) -> List[str]:
+    """Searchable words of a name: lowercase, without accents, split on anything but letters and digits"""
+    decomposed = unicodedata.normalize('NFKD', str(name).casefold())
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return [token for token in re.split(r'[\W_]+', stripped) if token]
+
+def document_key(document_id: str) -> str:
+    """Document id reduced to uppercase letters and digits, so 1.234.567-8 and 12345678 match"""
+    return re.sub(r'[\W_]+', '', str(document_id)).upper()
+
+def _build_qr(data: str) -> qrcode.QRCode:
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_H,
@@ -47,8 +64,28 @@ def generate_qr_code(data: str, size: int = 300) -> str:
     )
     qr.add_data(data)
     qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
+    return qr
+
+def generate_qr_matrix(data: str) -> List[List[bool]]:
+    """Generate the QR module matrix (including the quiet-zone border), True = dark"""
+    return _build_qr(data).get_matrix()
+
+def render_qr_image(data: str, width: int, height: Optional[int] = None) -> Image.Image:
+    """Render a QR code as an RGB image directly at the requested pixel size.
+
+    One pixel per module is scaled up with nearest-neighbour, which keeps the module
+    edges sharp and skips the PNG encode/decode round trip of generate_qr_code.
+    """
+    matrix = generate_qr_matrix(data)
+    modules = len(matrix)
+    pixels = bytes(0 if dark else 255 for row in matrix for dark in row)
+    img = Image.frombytes('L', (modules, modules), pixels)
+    img = img.resize((width, height or width), Image.Resampling.NEAREST)
+    return img.convert('RGB')
+
+def generate_qr_code(data: str, size: int = 300) -> str:
+    """Generate QR code and return as base64 string"""
+    img = _build_qr(data).make_image(fill_color="black", back_color="white")
     img = img.resize((size, size), Image.Resampling.LANCZOS)
     
     buffered = BytesIO()
@@ -56,16 +93,19 @@ def generate_qr_code(data: str, size: int = 300) -> str:
     img_str = base64.b64encode(buffered.getvalue()).decode()
     return f"data:image/png;base64,{img_str}"
 
-def get_font(font_name: str, size: int):
-    """Get font object with proper mapping"""
+# Maximum number of (family, size) font objects kept in memory per process
+FONT_CACHE_SIZE = int(os.environ.get('FONT_CACHE_SIZE', 256))
+
+# Sizes loaded for every FONT_MAP family by preload_fonts()
+PRELOAD_FONT_SIZES = [int(size) for size in os.environ.get('PRELOAD_FONT_SIZES', '14,16,20,24,32,48').split(',') if size]
+
+@lru_cache(maxsize=None)
+def resolve_font_path(font_name: str) -> Optional[str]:
+    """Resolve a font family to an existing file, following the fallback chain"""
     # Get the system font path from the mapping
     font_path = FONT_MAP.get(font_name)
-    
     if font_path and os.path.exists(font_path):
-        try:
-            return ImageFont.truetype(font_path, size)
-        except Exception as e:
-            print(f"Error loading font {font_name} from {font_path}: {e}")
+        return font_path
     
     # Fallback chain
     fallback_fonts = [
@@ -75,61 +115,42 @@ def get_font(font_name: str, size: int):
     
     for fallback in fallback_fonts:
         if os.path.exists(fallback):
-            try:
-                return ImageFont.truetype(fallback, size)
-            except:
-                continue
+            return fallback
+    
+    return None
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def get_font(font_name: str, size: int):
+    """Get font object with proper mapping (cached per family and size)"""
+    font_path = resolve_font_path(font_name)
+    
+    if font_path:
+        try:
+            return ImageFont.truetype(font_path, size)
+        except Exception as e:
+            print(f"Error loading font {font_name} from {font_path}: {e}")
     
     # Last resort: PIL default font
     return ImageFont.load_default()
 
+def preload_fonts(sizes: Optional[List[int]] = None):
+    """Warm the font cache with every FONT_MAP family at the common sizes"""
+    for font_name in FONT_MAP:
+        for size in sizes or PRELOAD_FONT_SIZES:
+            get_font(font_name, size)
+
+def font_cache_info() -> Dict[str, int]:
+    """Hit/miss counters of the font cache in this process"""
+    info = get_font.cache_info()
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "max_size": info.maxsize,
+    }
+
 def hex_to_rgb(hex_color: str) -> tuple:
     """Convert hex color to RGB tuple"""
     hex_color = hex_color.lstrip('#')
     return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
 
-
-def create_pdf_from_images(image_paths: List[str], output_path: str) -> str:
-    """Create a single PDF from multiple PNG images"""
-    from reportlab.lib.pagesizes import letter, landscape
-    from reportlab.pdfgen import canvas as pdf_canvas
-    from reportlab.lib.utils import ImageReader
-    
-    # Use landscape letter size
-    page_width, page_height = landscape(letter)
-    
-    c = pdf_canvas.Canvas(output_path, pagesize=landscape(letter))
-    
-    for i, image_path in enumerate(image_paths):
-        if not os.path.exists(image_path):
-            continue
-            
-        # Open image to get dimensions
-        img = Image.open(image_path)
-        img_width, img_height = img.size
-        
-        # Calculate scaling to fit the page with margins
-        margin = 20
-        available_width = page_width - 2 * margin
-        available_height = page_height - 2 * margin
-        
-        # Calculate scale to fit
-        scale_x = available_width / img_width
-        scale_y = available_height / img_height
-        scale = min(scale_x, scale_y)
-        
-        # Calculate centered position
-        new_width = img_width * scale
-        new_height = img_height * scale
-        x = (page_width - new_width) / 2
-        y = (page_height - new_height) / 2
-        
-        # Draw the image
-        c.drawImage(image_path, x, y, width=new_width, height=new_height)
-        
-        # Add new page for next image (except for last one)
-        if i < len(image_paths) - 1:
-            c.showPage()
-    
-    c.save()
-    return output_path
@@ -1,8 +1,9 @@
 import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
 import { certificateService } from '../services/api';
-import { Award, Plus, Download, ExternalLink, FileDown, CheckSquare, Square } from 'lucide-react';
+import { Award, Plus, Download, ExternalLink, FileDown, FileArchive, CheckSquare, Square, Search, X } from 'lucide-react';
 import { Button } from '../components/ui/button';
+import { Input } from '../components/ui/input';
 import { toast } from 'sonner';
 import axios from 'axios';
 
@@ -13,23 +14,58 @@ export const CertificatesPage = () => {
   const [loading, setLoading] = useState(true);
   const [selectedCerts, setSelectedCerts] = useState([]);
   const [downloadingPdf, setDownloadingPdf] = useState(false);
+  const [downloadingZip, setDownloadingZip] = useState(false);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [searchInput, setSearchInput] = useState('');
+  const [activeSearch, setActiveSearch] = useState('');
 
   useEffect(() => {
     loadCertificates();
   }, []);
 
-  const loadCertificates = async () => {
+  const fetchPage = (search, params = {}) => (
+    search ? certificateService.search(search, params) : certificateService.getPage(params)
+  );
+
+  const loadCertificates = async (search = '') => {
     try {
-      const data = await certificateService.getAll();
-      setCertificates(data);
+      const page = await fetchPage(search);
+      setCertificates(page.items);
+      setNextCursor(page.nextCursor);
+      setActiveSearch(search);
+      setSelectedCerts([]);
     } catch (error) {
-      toast.error('Error al cargar certificados');
+      toast.error(error.response?.data?.detail || 'Error al cargar certificados');
     } finally {
       setLoading(false);
     }
   };
 
-  const handleDownload = async (certId, uniqueCode) => {
+  const handleSearch = (e) => {
+    e.preventDefault();
+    loadCertificates(searchInput.trim());
+  };
+
+  const clearSearch = () => {
+    setSearchInput('');
+    loadCertificates();
+  };
+
+  const loadMoreCertificates = async () => {
+    setLoadingMore(true);
+    try {
+      const page = await fetchPage(activeSearch, { cursor: nextCursor });
+      setCertificates((prev) => [...prev, ...page.items]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      toast.error('Error al cargar certificados');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const handleDownload = async (certId, uniqueCode, fileFormat = 'png') => {
     try {
       const token = localStorage.getItem('token');
       const response = await axios.get(
@@ -46,7 +82,7 @@ export const CertificatesPage = () => {
       const url = window.URL.createObjectURL(new Blob([response.data]));
       const link = document.createElement('a');
       link.href = url;
-      link.setAttribute('download', `certificate_${uniqueCode}.png`);
+      link.setAttribute('download', `certificate_${uniqueCode}.${fileFormat === 'jpeg' ? 'jpg' : fileFormat}`);
       document.body.appendChild(link);
       link.click();
       link.remove();
@@ -104,6 +140,35 @@ export const CertificatesPage = () => {
     }
   };
 
+  const handleDownloadZip = async () => {
+    if (selectedCerts.length === 0) {
+      toast.error('Selecciona al menos un certificado');
+      return;
+    }
+
+    setDownloadingZip(true);
+    try {
+      const blob = await certificateService.downloadZip({ certificate_ids: selectedCerts });
+
+      const url = window.URL.createObjectURL(blob);
+      const link = document.createElement('a');
+      link.href = url;
+      link.setAttribute('download', `certificados_${Date.now()}.zip`);
+      document.body.appendChild(link);
+      link.click();
+      link.remove();
+      window.URL.revokeObjectURL(url);
+
+      toast.success(`${selectedCerts.length} certificados descargados como ZIP`);
+      setSelectedCerts([]);
+    } catch (error) {
+      console.error('ZIP download error:', error);
+      toast.error('Error al descargar certificados como ZIP');
+    } finally {
+      setDownloadingZip(false);
+    }
+  };
+
   if (loading) {
     return <div className="text-white">Cargando...</div>;
   }
@@ -127,6 +192,17 @@ export const CertificatesPage = () => {
               {downloadingPdf ? 'Descargando...' : `Descargar ${selectedCerts.length} como PDF`}
             </Button>
           )}
+          {selectedCerts.length > 0 && (
+            <Button 
+              onClick={handleDownloadZip}
+              disabled={downloadingZip}
+              className="bg-slate-700 hover:bg-slate-600"
+              data-testid="download-zip-btn"
+            >
+              <FileArchive className="w-5 h-5 mr-2" />
+              {downloadingZip ? 'Descargando...' : `Descargar ${selectedCerts.length} como ZIP`}
+            </Button>
+          )}
           <Link to="/certificates/generate">
             <Button className="bg-accent hover:bg-accent-hover" data-testid="generate-certificate-btn">
               <Plus className="w-5 h-5 mr-2" />
@@ -136,7 +212,33 @@ export const CertificatesPage = () => {
         </div>
       </div>
 
-      {certificates.length === 0 ? (
+      <form onSubmit={handleSearch} className="flex items-center gap-3" data-testid="certificate-search-form">
+        <div className="relative flex-1 max-w-xl">
+          <Search className="w-4 h-4 text-slate-400 absolute left-3 top-1/2 -translate-y-1/2" />
+          <Input
+            value={searchInput}
+            onChange={(e) => setSearchInput(e.target.value)}
+            placeholder="Buscar por nombre o número de documento"
+            className="pl-9 bg-slate-900/50 border-slate-800 text-white"
+            data-testid="certificate-search-input"
+          />
+        </div>
+        <Button type="submit" variant="outline" className="border-slate-700 text-white hover:bg-slate-800">
+          Buscar
+        </Button>
+        {activeSearch && (
+          <Button type="button" variant="ghost" className="text-slate-300" onClick={clearSearch}>
+            <X className="w-4 h-4 mr-1" />
+            Limpiar
+          </Button>
+        )}
+      </form>
+
+      {certificates.length === 0 && activeSearch ? (
+        <div className="bg-slate-900/50 backdrop-blur-xl border border-slate-800 rounded-xl p-12 text-center">
+          <p className="text-slate-400">No se encontraron certificados para "{activeSearch}"</p>
+        </div>
+      ) : certificates.length === 0 ? (
         <div className="bg-slate-900/50 backdrop-blur-xl border border-slate-800 rounded-xl p-12 text-center">
           <Award className="w-16 h-16 text-slate-600 mx-auto mb-4" />
           <h3 className="text-xl font-semibold text-white mb-2">No hay certificados</h3>
@@ -222,7 +324,7 @@ export const CertificatesPage = () => {
                           size="sm"
                           variant="outline"
                           className="border-slate-700 text-white hover:bg-slate-800"
-                          onClick={() => handleDownload(cert.id, cert.unique_code)}
+                          onClick={() => handleDownload(cert.id, cert.unique_code, cert.file_format)}
                           data-testid={`download-certificate-${cert.id}`}
                         >
                           <Download className="w-4 h-4" />
@@ -248,6 +350,19 @@ export const CertificatesPage = () => {
               </tbody>
             </table>
           </div>
+          {nextCursor && (
+            <div className="flex justify-center p-4 border-t border-slate-800">
+              <Button
+                variant="outline"
+                className="border-slate-700 text-white hover:bg-slate-800"
+                onClick={loadMoreCertificates}
+                disabled={loadingMore}
+                data-testid="load-more-certificates-btn"
+              >
+                {loadingMore ? 'Cargando...' : 'Cargar más'}
+              </Button>
+            </div>
+          )}
         </div>
       )}
     </div>
@@ -1,20 +1,33 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { certificateService, templateService } from '../services/api';
+import { certificateService, templateService, jobService } from '../services/api';
 import { ArrowLeft, Plus, Upload } from 'lucide-react';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
 import { Label } from '../components/ui/label';
+import { Checkbox } from '../components/ui/checkbox';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '../components/ui/select';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '../components/ui/tabs';
 import { toast } from 'sonner';
 import { useDropzone } from 'react-dropzone';
 
+// Most recent batch results kept on screen while a job runs
+const MAX_BATCH_ROWS = 200;
+
+const ROW_STATUS_LABELS = {
+  succeeded: 'Generado',
+  existing: 'Ya existía',
+  failed: 'Error',
+};
+
 export const GenerateCertificatePage = () => {
   const navigate = useNavigate();
   const [templates, setTemplates] = useState([]);
   const [loading, setLoading] = useState(false);
   const [activeTab, setActiveTab] = useState('individual');
+  const [batchProgress, setBatchProgress] = useState(null);
+  const [batchRows, setBatchRows] = useState([]);
+  const [batchResult, setBatchResult] = useState(null);
   
   // Individual form
   const [individualForm, setIndividualForm] = useState({
@@ -39,6 +52,7 @@ export const GenerateCertificatePage = () => {
     event_name: '',
     course_name: '',
     file: null,
+    skip_existing: true,
   });
 
   useEffect(() => {
@@ -86,7 +100,8 @@ export const GenerateCertificatePage = () => {
   const { getRootProps, getInputProps, isDragActive } = useDropzone({
     accept: {
       'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': ['.xlsx'],
-      'application/vnd.ms-excel': ['.xls'],
+      'text/csv': ['.csv'],
+      'text/tab-separated-values': ['.tsv'],
     },
     maxFiles: 1,
     onDrop: (acceptedFiles) => {
@@ -94,20 +109,47 @@ export const GenerateCertificatePage = () => {
         setBatchForm({ ...batchForm, file: acceptedFiles[0] });
       }
     },
+    onDropRejected: (rejections) => {
+      if (rejections[0]?.file.name.toLowerCase().endsWith('.xls')) {
+        toast.error('Los archivos .xls (Excel 97-2003) no son compatibles. Guárdalo como .xlsx o .csv');
+      } else {
+        toast.error('Formato no compatible. Usa un archivo .xlsx, .csv o .tsv');
+      }
+    },
   });
 
+  const handleDownloadFailedRows = async () => {
+    try {
+      const blob = await jobService.downloadFailedRows(batchResult.id);
+
+      const url = window.URL.createObjectURL(blob);
+      const link = document.createElement('a');
+      link.href = url;
+      link.setAttribute('download', `filas_con_error_${Date.now()}.csv`);
+      document.body.appendChild(link);
+      link.click();
+      link.remove();
+      window.URL.revokeObjectURL(url);
+    } catch (error) {
+      console.error('Failed rows download error:', error);
+      toast.error('Error al descargar las filas con error');
+    }
+  };
+
   const handleBatchSubmit = async (e) => {
     e.preventDefault();
 
     if (!batchForm.file) {
-      toast.error('Por favor selecciona un archivo Excel');
+      toast.error('Por favor selecciona un archivo Excel o CSV');
       return;
     }
 
     setLoading(true);
+    setBatchRows([]);
+    setBatchResult(null);
 
     try {
-      const certificates = await certificateService.createBatch(
+      let job = await certificateService.createBatch(
         batchForm.template_id,
         batchForm.certifier_name,
         batchForm.representative_name,
@@ -115,10 +157,44 @@ export const GenerateCertificatePage = () => {
         batchForm.representative_name_3,
         batchForm.event_name,
         batchForm.course_name,
-        batchForm.file
+        batchForm.file,
+        batchForm.skip_existing ? 'skip' : 'reissue'
       );
-      toast.success(`${certificates.length} certificados generados exitosamente`);
-      navigate('/certificates');
+
+      // The batch runs as a background job; follow its event stream, or poll it
+      // if the stream is unavailable
+      setBatchProgress(job);
+      try {
+        await jobService.streamEvents(job.id, (type, data) => {
+          if (type === 'progress') {
+            setBatchProgress(data);
+          } else if (type === 'rows') {
+            setBatchRows((rows) => [...[...data].reverse(), ...rows].slice(0, MAX_BATCH_ROWS));
+          } else if (type === 'done') {
+            job = data;
+          }
+        });
+      } catch (streamError) {
+        console.error('Job event stream error:', streamError);
+      }
+      while (job.status === 'queued' || job.status === 'running') {
+        setBatchProgress(job);
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        job = await jobService.get(job.id);
+      }
+
+      if (job.status === 'failed') {
+        toast.error(job.error || 'Error al generar certificados');
+        return;
+      }
+      setBatchResult(job);
+      toast.success(`${job.succeeded} certificados generados exitosamente`);
+      if (job.skipped > 0) {
+        toast.info(`${job.skipped} participantes ya tenían certificado y se omitieron`);
+      }
+      if (job.failed > 0) {
+        toast.warning(`${job.failed} filas tienen errores; descárgalas para corregirlas y volver a enviarlas`);
+      }
     } catch (error) {
       console.error('Batch error:', error);
       let errorMsg = 'Error al generar certificados';
@@ -135,6 +211,7 @@ export const GenerateCertificatePage = () => {
       toast.error(errorMsg);
     } finally {
       setLoading(false);
+      setBatchProgress(null);
     }
   };
 
@@ -404,7 +481,7 @@ export const GenerateCertificatePage = () => {
               </div>
 
               <div>
-                <Label className="text-slate-300 mb-2 block">Archivo Excel *</Label>
+                <Label className="text-slate-300 mb-2 block">Archivo Excel o CSV *</Label>
                 <div
                   {...getRootProps()}
                   className={`border-2 border-dashed rounded-xl p-8 text-center cursor-pointer transition-all ${
@@ -426,9 +503,9 @@ export const GenerateCertificatePage = () => {
                   ) : (
                     <div>
                       <p className="text-white mb-2">
-                        Arrastra un archivo Excel o haz clic para seleccionar
+                        Arrastra un archivo Excel o CSV, o haz clic para seleccionar
                       </p>
-                      <p className="text-sm text-slate-400">.xlsx o .xls</p>
+                      <p className="text-sm text-slate-400">.xlsx, .csv o .tsv (los .xls de Excel 97-2003 no son compatibles)</p>
                     </div>
                   )}
                 </div>
@@ -437,14 +514,69 @@ export const GenerateCertificatePage = () => {
                 </p>
               </div>
 
+              <div className="flex items-center gap-3">
+                <Checkbox
+                  id="batch_skip_existing"
+                  checked={batchForm.skip_existing}
+                  onCheckedChange={(checked) => setBatchForm({ ...batchForm, skip_existing: checked === true })}
+                  data-testid="batch-skip-existing-checkbox"
+                />
+                <Label htmlFor="batch_skip_existing" className="text-slate-300">
+                  Omitir participantes que ya tienen este certificado (misma plantilla, evento y curso)
+                </Label>
+              </div>
+
               <Button
                 type="submit"
                 className="w-full bg-accent hover:bg-accent-hover h-11"
                 disabled={loading}
                 data-testid="submit-batch-btn"
               >
-                {loading ? 'Generando...' : 'Generar Certificados en Lote'}
+                {loading
+                  ? batchProgress?.status === 'running'
+                    ? `Generando... ${batchProgress.processed}${batchProgress.total_rows ? ` de ${batchProgress.total_rows}` : ''}`
+                    : 'Generando...'
+                  : 'Generar Certificados en Lote'}
               </Button>
+
+              {batchResult && (
+                <div className="flex items-center justify-between rounded-lg border border-slate-700 p-4" data-testid="batch-result">
+                  <p className="text-slate-300">
+                    {batchResult.succeeded} generados, {batchResult.skipped} omitidos, {batchResult.failed} con error
+                  </p>
+                  <div className="flex gap-2">
+                    {batchResult.failed > 0 && (
+                      <Button
+                        type="button"
+                        variant="outline"
+                        onClick={handleDownloadFailedRows}
+                        data-testid="download-failed-rows-btn"
+                      >
+                        Descargar filas con error
+                      </Button>
+                    )}
+                    <Button type="button" variant="outline" onClick={() => navigate('/certificates')}>
+                      Ver certificados
+                    </Button>
+                  </div>
+                </div>
+              )}
+
+              {batchRows.length > 0 && (
+                <div className="max-h-80 overflow-y-auto rounded-lg border border-slate-700" data-testid="batch-rows">
+                  {batchRows.map((row) => (
+                    <div key={row.row} className="flex items-center justify-between gap-4 border-b border-slate-800 px-4 py-2 text-sm">
+                      <span className="text-slate-500 w-16">Fila {row.row}</span>
+                      <span className="flex-1 text-white truncate">{row.participant_name}</span>
+                      <span className="text-slate-400 font-mono">{row.unique_code}</span>
+                      <span className={row.status === 'failed' ? 'text-red-400' : 'text-slate-300'} title={row.error || ''}>
+                        {ROW_STATUS_LABELS[row.status] || row.status}
+                        {row.error && `: ${row.error}`}
+                      </span>
+                    </div>
+                  ))}
+                </div>
+              )}
             </form>
           </TabsContent>
         </Tabs>
@@ -1,7 +1,7 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { templateService } from '../services/api';
-import { ArrowLeft, Save, Plus, Trash2, Type, Hash, Calendar, QrCode, User } from 'lucide-react';
+import { ArrowLeft, Save, Plus, Trash2, Type, Hash, Calendar, QrCode, User, Eye, EyeOff } from 'lucide-react';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
 import { Label } from '../components/ui/label';
@@ -16,6 +16,8 @@ const fieldTypes = [
   { value: 'representative_name', label: 'Representante 1', icon: Type },
   { value: 'representative_name_2', label: 'Representante 2', icon: Type },
   { value: 'representative_name_3', label: 'Representante 3', icon: Type },
+  { value: 'event_name', label: 'Nombre del Evento', icon: Type },
+  { value: 'course_name', label: 'Nombre del Curso', icon: Type },
   { value: 'date', label: 'Fecha', icon: Calendar },
   { value: 'unique_code', label: 'Código Único', icon: Hash },
   { value: 'qr_code', label: 'Código QR', icon: QrCode },
@@ -40,7 +42,7 @@ const availableFonts = [
   { value: 'Allura', label: 'Allura (Script)' },
 ];
 
-const DraggableField = ({ field, onDrag, onClick, isSelected, scale }) => {
+const DraggableField = ({ field, onDrag, onClick, isSelected, scale, preview }) => {
   const [isDragging, setIsDragging] = useState(false);
   const [dragStart, setDragStart] = useState({ x: 0, y: 0 });
   const fieldRef = useRef(null);
@@ -92,7 +94,9 @@ const DraggableField = ({ field, onDrag, onClick, isSelected, scale }) => {
         top: field.y * scale,
         width: field.width * scale,
         height: field.height * scale,
-        backgroundColor: field.field_type === 'qr_code' ? 'rgba(240, 240, 240, 0.9)' : 'rgba(37, 99, 235, 0.3)',
+        backgroundColor: preview
+          ? 'transparent'
+          : field.field_type === 'qr_code' ? 'rgba(240, 240, 240, 0.9)' : 'rgba(37, 99, 235, 0.3)',
         zIndex: isSelected ? 100 : 10,
       }}
       onMouseDown={handleMouseDown}
@@ -102,9 +106,11 @@ const DraggableField = ({ field, onDrag, onClick, isSelected, scale }) => {
       }}
       data-testid={`canvas-field-${field.id}`}
     >
-      <div className="absolute inset-0 flex items-center justify-center text-xs font-medium text-slate-700 pointer-events-none">
-        {fieldType?.label}
-      </div>
+      {!preview && (
+        <div className="absolute inset-0 flex items-center justify-center text-xs font-medium text-slate-700 pointer-events-none">
+          {fieldType?.label}
+        </div>
+      )}
     </div>
   );
 };
@@ -121,6 +127,8 @@ export const TemplateEditorPage = () => {
   const [saving, setSaving] = useState(false);
   const [canvasSize, setCanvasSize] = useState({ width: 0, height: 0, scale: 1 });
   const [backgroundImage, setBackgroundImage] = useState(null);
+  const [showPreview, setShowPreview] = useState(false);
+  const [previewImage, setPreviewImage] = useState(null);
 
   useEffect(() => {
     loadTemplate();
@@ -144,6 +152,26 @@ export const TemplateEditorPage = () => {
     return () => window.removeEventListener('resize', updateCanvasSize);
   }, [template]);
 
+  // Re-render the server preview shortly after the layout stops changing
+  useEffect(() => {
+    if (!showPreview) return;
+    const timer = setTimeout(async () => {
+      try {
+        // Sized to the canvas in device pixels
+        const width = Math.round((canvasSize.width || 800) * (window.devicePixelRatio || 1));
+        const blob = await templateService.preview(id, fields, width);
+        const url = URL.createObjectURL(blob);
+        setPreviewImage((previous) => {
+          if (previous) URL.revokeObjectURL(previous);
+          return url;
+        });
+      } catch (error) {
+        toast.error('Error al generar la vista previa');
+      }
+    }, 150);
+    return () => clearTimeout(timer);
+  }, [showPreview, fields, id, canvasSize.width]);
+
   const loadTemplate = async () => {
     try {
       const data = await templateService.getById(id);
@@ -247,15 +275,26 @@ export const TemplateEditorPage = () => {
             <p className="text-slate-400">Editor de plantilla • {fields.length} campos • {signerFields.length} firmantes</p>
           </div>
         </div>
-        <Button
-          onClick={saveTemplate}
-          disabled={saving}
-          className="bg-accent hover:bg-accent-hover"
-          data-testid="save-template-btn"
-        >
-          <Save className="w-5 h-5 mr-2" />
-          {saving ? 'Guardando...' : 'Guardar Cambios'}
-        </Button>
+        <div className="flex items-center gap-3">
+          <Button
+            variant="outline"
+            onClick={() => setShowPreview(!showPreview)}
+            className="border-slate-700 text-slate-300 hover:text-white"
+            data-testid="toggle-preview-btn"
+          >
+            {showPreview ? <EyeOff className="w-5 h-5 mr-2" /> : <Eye className="w-5 h-5 mr-2" />}
+            {showPreview ? 'Ocultar Vista Previa' : 'Vista Previa'}
+          </Button>
+          <Button
+            onClick={saveTemplate}
+            disabled={saving}
+            className="bg-accent hover:bg-accent-hover"
+            data-testid="save-template-btn"
+          >
+            <Save className="w-5 h-5 mr-2" />
+            {saving ? 'Guardando...' : 'Guardar Cambios'}
+          </Button>
+        </div>
       </div>
 
       {/* Editor Layout */}
@@ -375,7 +414,9 @@ export const TemplateEditorPage = () => {
             style={{
               width: '100%',
               height: canvasSize.height || 500,
-              backgroundImage: backgroundImage ? `url(${backgroundImage})` : 'none',
+              backgroundImage: showPreview && previewImage
+                ? `url(${previewImage})`
+                : backgroundImage ? `url(${backgroundImage})` : 'none',
               backgroundSize: 'contain',
               backgroundRepeat: 'no-repeat',
               backgroundPosition: 'center',
@@ -399,6 +440,7 @@ export const TemplateEditorPage = () => {
                 onClick={setSelectedField}
                 isSelected={selectedField === field.id}
                 scale={canvasSize.scale}
+                preview={showPreview && !!previewImage}
               />
             ))}
           </div>
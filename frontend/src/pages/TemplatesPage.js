@@ -88,7 +88,7 @@ export const TemplatesPage = () => {
             >
               <div className="aspect-[1.414] bg-slate-800 relative overflow-hidden">
                 <img
-                  src={templateService.getImage(template.id)}
+                  src={templateService.getImage(template.id, 400)}
                   alt={template.name}
                   className="w-full h-full object-cover"
                 />
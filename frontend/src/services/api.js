@@ -74,13 +74,29 @@ export const templateService = {
     return response.data;
   },
 
-  getImage: (id) => `${API}/templates/${id}/image`,
+  // Sample render of an (unsaved) layout, `width` pixels wide
+  preview: async (id, fields, width) => {
+    const response = await api.post(`/templates/${id}/preview`, { fields, width }, {
+      responseType: 'blob',
+    });
+    return response.data;
+  },
+
+  getImage: (id, size) => `${API}/templates/${id}/image${size ? `?size=${size}` : ''}`,
 };
 
 export const certificateService = {
-  getAll: async (skip = 0, limit = 100) => {
-    const response = await api.get(`/certificates?skip=${skip}&limit=${limit}`);
-    return response.data;
+  // One page of certificates, newest first. Pass the returned nextCursor back as
+  // params.cursor for the following page; it is null on the last page.
+  getPage: async (params = {}) => {
+    const response = await api.get('/certificates', { params: { limit: 100, ...params } });
+    return { items: response.data, nextCursor: response.headers['x-next-cursor'] || null };
+  },
+
+  // Certificates by document id or participant name; paged like getPage
+  search: async (q, params = {}) => {
+    const response = await api.get('/certificates/search', { params: { q, ...params } });
+    return { items: response.data, nextCursor: response.headers['x-next-cursor'] || null };
   },
 
   getById: async (id) => {
@@ -93,7 +109,7 @@ export const certificateService = {
     return response.data;
   },
 
-  createBatch: async (templateId, certifierName, representativeName, representativeName2, representativeName3, eventName, courseName, file) => {
+  createBatch: async (templateId, certifierName, representativeName, representativeName2, representativeName3, eventName, courseName, file, onExisting = 'skip') => {
     const formData = new FormData();
     formData.append('template_id', templateId);
     if (certifierName) formData.append('certifier_name', certifierName);
@@ -102,6 +118,7 @@ export const certificateService = {
     if (representativeName3) formData.append('representative_name_3', representativeName3);
     if (eventName) formData.append('event_name', eventName);
     if (courseName) formData.append('course_name', courseName);
+    formData.append('on_existing', onExisting);
     formData.append('file', file);
 
     const response = await api.post('/certificates/batch', formData, {
@@ -118,6 +135,13 @@ export const certificateService = {
     });
     return response.data;
   },
+
+  downloadZip: async (selection) => {
+    const response = await api.post('/certificates/export-zip', selection, {
+      responseType: 'blob',
+    });
+    return response.data;
+  },
   
   verify: async (code) => {
     const response = await axios.get(`${API}/verify/${code}`);
@@ -125,6 +149,62 @@ export const certificateService = {
   },
 };
 
+export const jobService = {
+  get: async (id) => {
+    const response = await api.get(`/jobs/${id}`);
+    return response.data;
+  },
+
+  getRows: async (id, params = {}) => {
+    const response = await api.get(`/jobs/${id}/rows`, { params });
+    return response.data;
+  },
+
+  downloadFailedRows: async (id) => {
+    const response = await api.get(`/jobs/${id}/failed-rows`, {
+      responseType: 'blob',
+    });
+    return response.data;
+  },
+
+  // Server-Sent Events of a running job, read with fetch because EventSource
+  // cannot send the Authorization header. Calls onEvent(type, data) for each
+  // event and resolves when the stream ends.
+  streamEvents: async (id, onEvent, signal) => {
+    const token = localStorage.getItem('token');
+    const response = await fetch(`${API}/jobs/${id}/events`, {
+      headers: token ? { Authorization: `Bearer ${token}` } : {},
+      signal,
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Event stream failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const message = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        let type = 'message';
+        const data = [];
+        message.split('\n').forEach((line) => {
+          if (line.startsWith('event: ')) type = line.slice(7);
+          else if (line.startsWith('data: ')) data.push(line.slice(6));
+        });
+        if (data.length > 0) onEvent(type, JSON.parse(data.join('\n')));
+      }
+    }
+  },
+};
+
 export const statsService = {
   get: async () => {
     const response = await api.get('/stats');